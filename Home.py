@@ -1,12 +1,27 @@
 import streamlit as st
-from datetime import date
+from datetime import date, timedelta
 import sys
 import os
-
-# Add the circle_diagram_component to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'circle_diagram_component'))
-from circle_diagram_component import circle_diagram
-from database_sqlite import log_defect_to_database, get_defect_count
+import time
+
+SCRIPT_START = time.perf_counter()
+
+# Add the circle_diagram_component to path (once; the script reruns on every interaction)
+COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'circle_diagram_component')
+if COMPONENT_DIR not in sys.path:
+    sys.path.insert(0, COMPONENT_DIR)
+from circle_diagram_component import circle_diagram, confirm_entries, new_entries, release_entries
+from database_sqlite import log_defects_batch, get_archived_count, get_defect_count
+from metrics import metrics
+from app_resources import (
+    get_backfill_worker,
+    get_defect_types,
+    get_heatmap_engine,
+    get_page_css,
+    get_part_catalog,
+    get_sync_worker,
+    get_write_queue,
+)
 
 st.set_page_config(
     page_title="Defect Logger | Brembo QC",
@@ -14,187 +29,17 @@ st.set_page_config(
     layout="wide"
 )
 
-# Force sidebar to stay visible
-st.markdown("""
-<style>
-    [data-testid="stSidebar"] {
-        display: block !important;
-    }
-    [data-testid="collapsedControl"] {
-        display: block !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Shared per process: sync worker, write-behind queue, backfill worker, stylesheet, part catalog
+sync_worker = get_sync_worker()
+write_queue = get_write_queue()
+if write_queue is not None and write_queue.error is not None:
+    # The writer thread has failed; submissions are written inline instead
+    write_queue = None
+get_backfill_worker()
 
-# Modern professional styling
-st.markdown("""
-<style>
-    /* Main app background and layout */
-    .stApp {
-        background: linear-gradient(135deg, #1e293b 0%, #334155 100%);
-    }
-    
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Header styling */
-    .main-header {
-        background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 50%, #1a1a1a 100%);
-        padding: 30px 40px;
-        border-radius: 0;
-        margin: -80px -80px 40px -80px;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.4);
-        border-bottom: 4px solid #dc2626;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .main-header::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 100%;
-        background: linear-gradient(90deg, transparent 0%, rgba(220, 38, 38, 0.1) 50%, transparent 100%);
-        animation: shine 3s infinite;
-    }
-    
-    @keyframes shine {
-        0%, 100% { transform: translateX(-100%); }
-        50% { transform: translateX(100%); }
-    }
-    
-    .company-name {
-        color: #dc2626;
-        font-size: 18px;
-        font-weight: 900;
-        letter-spacing: 4px;
-        margin-bottom: 8px;
-        text-transform: uppercase;
-    }
-    
-    .main-header h1 {
-        color: white;
-        font-size: 36px;
-        font-weight: 800;
-        margin: 0;
-        letter-spacing: -1px;
-        text-transform: uppercase;
-    }
-    
-    .main-header p {
-        color: rgba(255, 255, 255, 0.7);
-        font-size: 13px;
-        margin: 8px 0 0 0;
-        letter-spacing: 1px;
-        text-transform: uppercase;
-        font-weight: 500;
-    }
-    
-    /* Input fields styling */
-    .stDateInput, .stSelectbox, .stTextInput {
-        background-color: white;
-    }
-    
-    .stDateInput > div > div > input,
-    .stSelectbox > div > div > div,
-    .stTextInput > div > div > input {
-        background-color: white !important;
-        border: 2px solid #e2e8f0 !important;
-        border-radius: 8px !important;
-        color: #1e293b !important;
-        font-weight: 500 !important;
-        padding: 10px 12px !important;
-        font-size: 14px !important;
-    }
-    
-    .stDateInput > div > div > input:focus,
-    .stSelectbox > div > div > div:focus,
-    .stTextInput > div > div > input:focus {
-        border-color: #dc2626 !important;
-        box-shadow: 0 0 0 3px rgba(220, 38, 38, 0.1) !important;
-    }
-    
-    /* Input section background */
-    [data-testid="column"] {
-        background: rgba(30, 41, 59, 0.6);
-        padding: 15px;
-        border-radius: 10px;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    /* Labels */
-    .stDateInput > label,
-    .stSelectbox > label,
-    .stTextInput > label {
-        color: #ffffff !important;
-        font-weight: 700 !important;
-        font-size: 15px !important;
-        text-transform: uppercase;
-        letter-spacing: 0.8px;
-        text-shadow: 0 2px 4px rgba(0, 0, 0, 0.5);
-        margin-bottom: 8px !important;
-        display: block !important;
-        background: rgba(220, 38, 38, 0.2);
-        padding: 6px 10px;
-        border-radius: 6px;
-        border-left: 3px solid #dc2626;
-    }
-    
-    /* Cards and containers */
-    .info-card {
-        background: white;
-        padding: 20px;
-        border-radius: 12px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        margin: 20px 0;
-    }
-    
-    /* Success/Error messages */
-    .stSuccess, .stError, .stInfo {
-        border-radius: 8px !important;
-        font-weight: 500 !important;
-    }
-    
-    /* Divider */
-    hr {
-        margin: 30px 0;
-        border: none;
-        height: 1px;
-        background: rgba(255, 255, 255, 0.1);
-    }
-    
-    /* Stats badge */
-    .stats-badge {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        padding: 15px 25px;
-        border-radius: 10px;
-        color: white;
-        text-align: center;
-        margin-top: 20px;
-    }
-    
-    .stats-badge .number {
-        font-size: 32px;
-        font-weight: 700;
-        color: #fbbf24;
-        display: block;
-    }
-    
-    .stats-badge .label {
-        font-size: 12px;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-        opacity: 0.8;
-        margin-top: 5px;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Streamlit drops any element a rerun does not emit again, so the stylesheet
+# is sent on every run; only the cached string is reused
+st.markdown(get_page_css(), unsafe_allow_html=True)
 
 # Header
 st.markdown("""
@@ -206,27 +51,19 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Navigation hint
-col1, col2 = st.columns([6, 1])
+col1, col2, col3, col4 = st.columns([4, 1, 1, 1])
 with col2:
+    if st.button("📈 Analytics", use_container_width=True):
+        st.switch_page("pages/analytics.py")
+with col3:
     if st.button("📊 View Logs", use_container_width=True):
         st.switch_page("pages/view_logs.py")
+with col4:
+    if st.button("⚙️ Admin", use_container_width=True):
+        st.switch_page("pages/admin.py")
 
-part_numbers = [
-    "19.A956.04", "18.A957.04", "18.N233.03", "18.N276.00_M", "18.N325.02", 
-    "18.N352.00_M", "18.N353.00_M", "19.9921.03", "19.9922.03", "19.9923.03", 
-    "19.9924.03", "19.9925.03", "19.A958.04", "19.A959.04", "19.A960.04", 
-    "19.A961.04", "19.D328.00", "19.D329.00", "19.N222.03", "19.N234.00_M", 
-    "19.N235.00_M", "19.N236.00_M", "19.N248.02", "19.N265.00_M", "19.N268.02", 
-    "19.N274.03", "19.N278.03", "19.N284.03", "19.N349.02", "19.N366.00", 
-    "19.N367.00", "19.N397.00", "19.N398.00", "19.N400.00", "19.N371.00", 
-    "19.N372.00", "19.N402.00", "19.N423.00", "19.N385.01", "19.N426.00", 
-    "19.N427.00", "19.N408.00", "19.N429.00", "19.N367.01", "18.N424.00", 
-    "19.N425.00", "19.N428.02", "19.N428.01", "XC1.A9.00", "19.N403.02", 
-    "19.E396.00", "18.N456.00", "19.E394.00", "19.E395.00", "19.N402.02", 
-    "19.N400.02", "19.N360.00", "19.N454.02", "19.N473.02", "19.N453.02", 
-    "19.N481.02", "18.N277.03", "19.N216.01", "XC5.94.00", "XC5.95.00", 
-    "XC5.96.00"
-]
+# Part number options and an option -> index map for the selectbox
+part_options, part_index = get_part_catalog()
 
 # Initialize session state
 if 'inspection_date' not in st.session_state:
@@ -239,6 +76,10 @@ if 'date_code' not in st.session_state:
     st.session_state.date_code = ""
 if 'notes' not in st.session_state:
     st.session_state.notes = ""
+if 'pending_writes' not in st.session_state:
+    st.session_state.pending_writes = []
+if 'write_results' not in st.session_state:
+    st.session_state.write_results = []
 
 # Session Information Form
 col1, col2, col3, col4, col5 = st.columns(5)
@@ -248,8 +89,8 @@ with col1:
     st.session_state.inspection_date = inspection_date
 
 with col2:
-    idx = ([""] + part_numbers).index(st.session_state.part_number) if st.session_state.part_number in ([""] + part_numbers) else 0
-    part_number = st.selectbox("Part Number", options=[""] + part_numbers, index=idx)
+    part_number = st.selectbox("Part Number", options=part_options,
+                               index=part_index.get(st.session_state.part_number, 0))
     st.session_state.part_number = part_number
 
 with col3:
@@ -266,11 +107,38 @@ with col5:
 
 st.markdown("---")
 
-# Circle diagram
-click_data = circle_diagram(key="diagram")
-
-# Handle data logging
-if click_data:
+# Heatmap overlay: where the selected part has scrapped, by clock segment and ring
+heatmap = None
+heat_col1, heat_col2, heat_col3 = st.columns([1, 2, 2])
+with heat_col1:
+    show_heatmap = st.toggle("Defect heatmap", key="show_heatmap")
+if show_heatmap:
+    with heat_col2:
+        heatmap_dates = st.date_input(
+            "Heatmap dates",
+            value=(date.today() - timedelta(days=30), date.today()),
+            key="heatmap_dates"
+        )
+    with heat_col3:
+        heatmap_defect = st.selectbox("Heatmap defect type", options=["All"] + get_defect_types(),
+                                      key="heatmap_defect")
+    date_from = heatmap_dates[0] if len(heatmap_dates) > 0 else None
+    date_to = heatmap_dates[1] if len(heatmap_dates) > 1 else None
+    heatmap_data = get_heatmap_engine().get(part_number or None, date_from, date_to)
+    defect_filter = None if heatmap_defect == "All" else heatmap_defect
+    heatmap = heatmap_data.overlay(defect_filter)
+    hotspots = ", ".join(f"{segment} o'clock {ring} ({count})" for segment, ring, count
+                         in heatmap_data.hotspots(3, defect_filter))
+    st.caption(f"{part_number or 'All parts'}: {int(heatmap_data.segment_ring(defect_filter).sum()):,} defects"
+               + (f" | Hotspots: {hotspots}" if hotspots else ""))
+
+# Entries the diagram sent since the last run (one per marked point) are stored before it is
+# drawn, so stored ones are acknowledged with this run; entries not stored are released,
+# so the diagram's resend is retried
+entries = new_entries(key="diagram")
+diagram_area = st.container()
+
+if entries:
     session_info = {
         'date': str(inspection_date),
         'part_number': part_number,
@@ -280,21 +148,78 @@ if click_data:
     }
     
     if not batch_number:
+        release_entries(entries, key="diagram")
         st.error("⚠️ Batch Number is required to log defects")
     elif not part_number:
+        release_entries(entries, key="diagram")
         st.error("⚠️ Part Number is required to log defects")
+    elif write_queue:
+        try:
+            with metrics.phase("home.submit.enqueue"):
+                futures = write_queue.submit_batch(entries, session_info)
+        except RuntimeError as e:
+            # The writer stopped in the meantime; the diagram's resend is written inline
+            release_entries(entries, key="diagram")
+            st.error(f"❌ Failed to log defects: {e}")
+        else:
+            metrics.count("home.defects_submitted", len(entries))
+            if sync_worker:
+                futures[-1].add_done_callback(lambda f: sync_worker.wake())
+            # Acknowledged to the diagram only once committed (see show_write_confirmations)
+            st.session_state.pending_writes.extend(zip(futures, entries))
+            st.session_state.write_results = []
+            st.success(f"✅ {len(futures)} defect(s) received, saving...")
     else:
-        success, message = log_defect_to_database(click_data, session_info)
+        with metrics.phase("home.submit.log"):
+            success, message = log_defects_batch(entries, session_info)
+        metrics.count("home.defects_submitted", len(entries))
+        if success:
+            confirm_entries(entries, key="diagram")
+            if sync_worker:
+                sync_worker.wake()
+            st.success(f"✅ {message}")
+        else:
+            release_entries(entries, key="diagram")
+            st.error(f"❌ {message}")
+
+with diagram_area:
+    # Anything the diagram returns here arrived without going through new_entries; it is
+    # still held, so release it and take it from the resend
+    unexpected = circle_diagram(key="diagram", defect_types=get_defect_types(), heatmap=heatmap)
+    if unexpected:
+        release_entries(unexpected, key="diagram")
+
+# Confirm queued defects once they are committed, without a full rerun. Committed entries
+# are acknowledged on the diagram's next render; failed ones are released so the
+# diagram's resend is logged again.
+@st.fragment(run_every="1s")
+def show_write_confirmations():
+    for future, entry in [pending for pending in st.session_state.pending_writes if pending[0].done()]:
+        st.session_state.pending_writes.remove((future, entry))
+        if future.exception():
+            release_entries([entry], key="diagram")
+            st.session_state.write_results.append((False, f"Failed to log defect: {future.exception()}"))
+        else:
+            confirm_entries([entry], key="diagram")
+            st.session_state.write_results.append((True, f"Defect logged successfully! ID: {future.result()} (Local DB)"))
+    
+    for success, message in st.session_state.write_results:
         if success:
             st.success(f"✅ {message}")
         else:
             st.error(f"❌ {message}")
 
-# Stats display
-total = get_defect_count()
+if st.session_state.pending_writes or st.session_state.write_results:
+    show_write_confirmations()
+
+# Stats display (archived defects still count as logged)
+total = get_defect_count() + get_archived_count()
 st.markdown(f"""
 <div class="stats-badge">
     <span class="number">{total}</span>
     <span class="label">Total Defects Logged</span>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+if metrics.enabled:
+    metrics.record("home.script", time.perf_counter() - SCRIPT_START)
@@ -0,0 +1,96 @@
+"""
+Process-wide Resources for the Streamlit Pages
+Everything here is loaded once per server process and shared by every
+session. The cached functions live in an imported module rather than in
+the page script: a decorator inside the script is rebuilt on every rerun,
+and Streamlit re-reads the function's source each time to key its cache.
+"""
+import os
+import re
+
+import streamlit as st
+
+from database_sqlite import get_catalog_names, register_catalog_names
+from heatmap import HeatmapEngine
+from migrate import start_backfill_worker
+from settings import get_setting
+from sync_engine import start_sync_worker_from_env
+from write_behind import start_write_behind_from_env
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CSS_FILE = os.path.join(APP_DIR, 'assets', 'home.css')
+PART_NUMBERS_FILE = os.path.join(APP_DIR, 'part_numbers.txt')
+
+# Path to an alternative part number list (one part per line)
+PART_NUMBERS_ENV = "SCRAP_PART_NUMBERS_FILE"
+
+DEFECT_TYPES_TTL = 60       # seconds before a defect type added to the catalog shows up
+
+
+@st.cache_resource
+def get_sync_worker():
+    """Background push to the remote database (only when SCRAP_SYNC_TARGET is set)"""
+    return start_sync_worker_from_env()
+
+
+@st.cache_resource
+def get_backfill_worker():
+    """Background run of any data backfills left by a schema upgrade (None if there are none)"""
+    return start_backfill_worker()
+
+
+@st.cache_resource
+def get_write_queue():
+    """Write-behind queue (only when SCRAP_WRITE_MODE=write_behind)"""
+    return start_write_behind_from_env()
+
+
+@st.cache_resource
+def get_page_css():
+    """
+    Read and minify the page stylesheet
+    
+    Returns:
+        str: A <style> block ready for st.markdown
+    """
+    with open(CSS_FILE, encoding='utf-8') as f:
+        css = f.read()
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return f"<style>{css.strip()}</style>"
+
+
+@st.cache_resource
+def get_part_catalog():
+    """
+    Load the part number selectbox options
+    
+    The parts are also registered in the PA_Products catalog, so they get
+    IDs in list order rather than in order of first use.
+    
+    Returns:
+        tuple: (options with a leading blank entry, dict of option -> index)
+    """
+    with open(get_setting(PART_NUMBERS_ENV, PART_NUMBERS_FILE), encoding='utf-8') as f:
+        part_numbers = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    options = [""] + list(dict.fromkeys(part_numbers))
+    register_catalog_names('Product', options)
+    return options, {part: i for i, part in enumerate(options)}
+
+
+@st.cache_resource(ttl=DEFECT_TYPES_TTL)
+def get_defect_types():
+    """
+    Defect type buttons for the circle diagram, from the PA_DefectTypes catalog
+    
+    Kept for DEFECT_TYPES_TTL only: any row written with a new Scrap name
+    adds it to the catalog, from this process or another one.
+    """
+    return get_catalog_names('Scrap')
+
+
+@st.cache_resource
+def get_heatmap_engine():
+    """Shared heatmap engine, so every session reuses the same cached heatmaps"""
+    return HeatmapEngine()
@@ -0,0 +1,345 @@
+"""
+Parquet Archive Tier
+Moves defects older than a cut-off age out of the live SQLite database into
+Parquet files partitioned by Entry_Date month, and answers queries across
+the live table and the archive in one call
+
+Run from the command line while the app is serving, the archiver is a
+second process writing to the database: both need multi_process (e.g. the
+same SCRAP_CONFIG file), or the app's query cache keeps showing archived
+rows until its next own write.
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+from database_sqlite import (
+    CATALOGS,
+    DEFECT_COLUMNS,
+    INTEGER_COLUMNS,
+    MULTI_PROCESS_ENV,
+    SHIFT_SQL,
+    build_filter_clause,
+    delete_archived_defects,
+    get_manager,
+)
+from settings import get_setting
+from sync_engine import SYNC_TARGET_ENV
+
+# Archive location and age, overridable per deployment
+ARCHIVE_DIR = "defect_archive"
+ARCHIVE_DIR_ENV = "SCRAP_ARCHIVE_DIR"
+ARCHIVE_AGE_ENV = "SCRAP_ARCHIVE_AGE_DAYS"
+
+DEFAULT_ARCHIVE_AGE_DAYS = 180
+DEFAULT_BATCH_SIZE = 50000      # rows moved per write transaction
+
+# Log viewer filters (see FILTER_CONDITIONS) as Parquet row filters
+PARQUET_FILTERS = {
+    'date_from': ("Entry_Date", ">="),
+    'date_to': ("Entry_Date", "<="),
+    'product': ("Product", "=="),
+    'batch_number': ("Batch_Number", "=="),
+    'scrap': ("Scrap", "=="),
+    'location': ("Location", "=="),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("The Parquet archive needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def get_archive_dir(archive_dir=None):
+    """The archive directory: the argument, else SCRAP_ARCHIVE_DIR, else ARCHIVE_DIR"""
+    return archive_dir or get_setting(ARCHIVE_DIR_ENV) or ARCHIVE_DIR
+
+
+def archive_schema(columns=DEFECT_COLUMNS):
+    """Arrow schema for defect rows, in the given column order (non-integer columns are strings)"""
+    pa = _pyarrow()
+    return pa.schema([(column, pa.int64() if column in INTEGER_COLUMNS else pa.string()) for column in columns])
+
+
+def _catalog_id(column, param="?"):
+    """SQL expression for the catalog ID of a name parameter (0 when missing, as in the summaries)"""
+    return f"COALESCE((SELECT ID FROM {CATALOGS[column][0]} WHERE Name = {param}), 0)"
+
+
+def _to_table(rows, columns):
+    pa = _pyarrow()
+    return pa.Table.from_pydict(
+        {column: [row[i] for row in rows] for i, column in enumerate(columns)},
+        schema=archive_schema(columns)
+    )
+
+
+def _write_partition(archive_dir, month, rows):
+    """Write one month's rows to a new Parquet file; returns its path relative to archive_dir"""
+    pa = _pyarrow()
+    relative_path = f"month={month}/defects-{rows[0][0]}-{rows[-1][0]}.parquet"
+    path = os.path.join(archive_dir, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    # Written under a temporary name and fsynced, so a listed partition is always complete
+    temp_path = path + ".tmp"
+    pa.parquet.write_table(_to_table(rows, DEFECT_COLUMNS), temp_path, compression="zstd")
+    with open(temp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return relative_path
+
+
+def _archive_batch(conn, archive_dir, cutoff, skip_unsynced, batch_size):
+    """Move up to batch_size rows into the archive inside a write transaction"""
+    unsynced = "AND ID NOT IN (SELECT ID FROM PA_SyncOutbox WHERE Status = 'pending')" if skip_unsynced else ""
+    rows = conn.execute(
+        f"""
+        SELECT {', '.join(DEFECT_COLUMNS)} FROM PA_InternalScrap
+        WHERE Entry_Date < ? AND Entry_Date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*' {unsynced}
+        ORDER BY ID LIMIT ?
+        """,
+        (cutoff, batch_size)
+    ).fetchall()
+    if not rows:
+        return 0
+    
+    months = {}
+    for row in rows:
+        months.setdefault(row[2][:7], []).append(row)
+    
+    written = []
+    try:
+        for month, month_rows in sorted(months.items()):
+            relative_path = _write_partition(archive_dir, month, month_rows)
+            written.append(relative_path)
+            entry_dates = [row[2] for row in month_rows]
+            conn.execute(
+                """
+                INSERT INTO PA_ArchivePartitions (Path, Month, Rows, Min_ID, Max_ID, Min_Entry_Date, Max_Entry_Date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (relative_path, month, len(month_rows), month_rows[0][0], month_rows[-1][0],
+                 min(entry_dates), max(entry_dates))
+            )
+        
+        deleted = delete_archived_defects(conn, [row[0] for row in rows])
+        if deleted != len(rows):
+            raise RuntimeError(f"Archived {len(rows)} rows but deleted {deleted}")
+        return deleted
+    
+    except BaseException:
+        # The transaction rolls back; don't leave files the manifest doesn't list
+        for relative_path in written:
+            try:
+                os.remove(os.path.join(archive_dir, relative_path))
+            except OSError:
+                pass
+        raise
+
+
+def archive_defects(older_than_days=None, archive_dir=None, batch_size=DEFAULT_BATCH_SIZE,
+                    skip_unsynced=None, db_file=None):
+    """
+    Move defects with an Entry_Date older than older_than_days to the archive
+    
+    Each batch is written to Parquet and deleted from the live table in the
+    same write transaction, and a file is only read once that transaction
+    has listed it in PA_ArchivePartitions, so a crash part way through
+    neither loses nor duplicates rows.
+    
+    Args:
+        older_than_days (int): Age cut-off (default SCRAP_ARCHIVE_AGE_DAYS or 180)
+        archive_dir (str): Where to write partitions (see get_archive_dir)
+        batch_size (int): Rows moved per write transaction
+        skip_unsynced (bool): Keep rows still waiting in the sync outbox
+            (default: only when a sync target is configured)
+        db_file (str): SQLite database (default: the configured one)
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        if older_than_days is None:
+            older_than_days = get_setting(ARCHIVE_AGE_ENV, DEFAULT_ARCHIVE_AGE_DAYS)
+        if skip_unsynced is None:
+            skip_unsynced = bool(get_setting(SYNC_TARGET_ENV))
+        archive_dir = get_archive_dir(archive_dir)
+        cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+        _pyarrow()
+        
+        manager = get_manager(db_file)
+        archived = 0
+        while True:
+            moved = manager.write(
+                lambda conn: _archive_batch(conn, archive_dir, cutoff, skip_unsynced, batch_size)
+            )
+            archived += moved
+            if moved < batch_size:
+                break
+        
+        return True, f"{archived} defects before {cutoff} archived to {archive_dir}"
+    
+    except Exception as e:
+        return False, f"Failed to archive defects: {str(e)}"
+
+
+def get_archive_partitions(date_from=None, date_to=None, db_file=None, conn=None):
+    """
+    List archive partitions that may hold rows in an Entry_Date range
+    
+    Returns:
+        list of str: Paths relative to the archive directory, newest rows first
+    """
+    conn = conn or get_manager(db_file).connection()
+    return [
+        row[0] for row in conn.execute(
+            """
+            SELECT Path FROM PA_ArchivePartitions
+            WHERE Max_Entry_Date >= ? AND Min_Entry_Date <= ?
+            ORDER BY Max_ID DESC
+            """,
+            (str(date_from or ''), str(date_to or '\uffff'))
+        )
+    ]
+
+
+def add_archive_to_summaries(conn, archive_dir=None):
+    """
+    Add the archived rows to the summary tables, inside the caller's write transaction
+    
+    For rebuild_defect_summaries, which recomputes the summaries from the
+    live table: every listed partition is read (only the summary columns)
+    and aggregated per summary key before it is written.
+    
+    Args:
+        conn: Connection with an open write transaction
+        archive_dir (str): Archive location (see get_archive_dir)
+    
+    Returns:
+        int: Number of archived defects added
+    """
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+    partitions = get_archive_partitions(conn=conn)
+    if not partitions:
+        return 0
+    archive_dir = get_archive_dir(archive_dir)
+    table = pa.parquet.read_table(
+        [os.path.join(archive_dir, path) for path in partitions],
+        columns=['Entry_Date', 'Batch_Number', 'Product', 'Scrap', 'Location', 'Quantity', 'Exact_Time'],
+        schema=archive_schema(),
+        partitioning=None,
+    )
+    count_all = ('Quantity', 'count', pc.CountOptions(mode='all'))
+    
+    daily = table.group_by(['Entry_Date', 'Product', 'Scrap', 'Location'], use_threads=False).aggregate(
+        [count_all, ('Quantity', 'sum')]
+    )
+    conn.executemany(
+        f"""
+        INSERT INTO PA_Summary_Daily (Entry_Date, Product_ID, Scrap_ID, Location_ID, Defects, Quantity)
+        VALUES (COALESCE(?, ''), {_catalog_id('Product')}, {_catalog_id('Scrap')},
+                {_catalog_id('Location')}, ?, COALESCE(?, 0))
+        ON CONFLICT (Entry_Date, Product_ID, Scrap_ID, Location_ID) DO UPDATE SET
+            Defects = Defects + excluded.Defects, Quantity = Quantity + excluded.Quantity
+        """,
+        zip(*(daily.column(name).to_pylist() for name in
+              ['Entry_Date', 'Product', 'Scrap', 'Location', 'Quantity_count', 'Quantity_sum']))
+    )
+    
+    batches = table.group_by(['Batch_Number', 'Product', 'Scrap'], use_threads=False).aggregate(
+        [count_all, ('Quantity', 'sum'), ('Entry_Date', 'min'), ('Entry_Date', 'max')]
+    )
+    conn.executemany(
+        f"""
+        INSERT INTO PA_Summary_Batch (Batch_Number, Product_ID, Scrap_ID, Defects, Quantity, First_Entry_Date, Last_Entry_Date)
+        VALUES (COALESCE(?, ''), {_catalog_id('Product')}, {_catalog_id('Scrap')},
+                ?, COALESCE(?, 0), ?, ?)
+        ON CONFLICT (Batch_Number, Product_ID, Scrap_ID) DO UPDATE SET
+            Defects = Defects + excluded.Defects, Quantity = Quantity + excluded.Quantity,
+            First_Entry_Date = MIN(COALESCE(First_Entry_Date, excluded.First_Entry_Date), COALESCE(excluded.First_Entry_Date, First_Entry_Date)),
+            Last_Entry_Date = MAX(COALESCE(Last_Entry_Date, excluded.Last_Entry_Date), COALESCE(excluded.Last_Entry_Date, Last_Entry_Date))
+        """,
+        zip(*(batches.column(name).to_pylist() for name in
+              ['Batch_Number', 'Product', 'Scrap', 'Quantity_count', 'Quantity_sum', 'Entry_Date_min', 'Entry_Date_max']))
+    )
+    
+    # The shift comes from Exact_Time in SQL, as for live rows
+    times = table.group_by(['Entry_Date', 'Product', 'Exact_Time'], use_threads=False).aggregate([count_all])
+    conn.executemany(
+        f"""
+        INSERT INTO PA_Summary_Shift (Entry_Date, Product_ID, Shift, Defects)
+        VALUES (COALESCE(:entry_date, ''), {_catalog_id('Product', ':product')}, COALESCE({SHIFT_SQL.format(ref=':exact_time')}, 0), :defects)
+        ON CONFLICT (Entry_Date, Product_ID, Shift) DO UPDATE SET Defects = Defects + excluded.Defects
+        """,
+        ({'entry_date': entry_date, 'product': product, 'exact_time': exact_time, 'defects': defects}
+         for entry_date, product, exact_time, defects in zip(
+             *(times.column(name).to_pylist() for name in ['Entry_Date', 'Product', 'Exact_Time', 'Quantity_count'])))
+    )
+    return table.num_rows
+
+
+def query_defects(filters=None, columns=None, archive_dir=None, db_file=None):
+    """
+    Get the defects matching the log viewer filters, live and archived
+    
+    Archive partitions whose Entry_Date range falls outside date_from and
+    date_to are never opened. Within the files that are read, only the
+    requested columns are decoded and row groups are skipped on their
+    statistics.
+    
+    Args:
+        filters (dict): Log viewer filters (see FILTER_CONDITIONS)
+        columns (list): Columns to return (default DEFECT_COLUMNS)
+        archive_dir (str): Archive location (see get_archive_dir)
+        db_file (str): SQLite database (default: the configured one)
+    
+    Returns:
+        pandas.DataFrame: Matching rows, highest ID first when ID is selected
+    """
+    pa = _pyarrow()
+    columns = list(columns or DEFECT_COLUMNS)
+    unknown = [column for column in columns if column not in DEFECT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    filters = {key: str(value) for key, value in (filters or {}).items() if value is not None and value != ""}
+    where, params = build_filter_clause(filters)
+    archive_dir = get_archive_dir(archive_dir)
+    
+    # One snapshot for both, so rows being archived meanwhile are seen exactly once
+    with get_manager(db_file).transaction() as conn:
+        hot = _to_table(conn.execute(f"SELECT {', '.join(columns)} FROM PA_InternalScrap {where}", params).fetchall(), columns)
+        partitions = get_archive_partitions(filters.get('date_from'), filters.get('date_to'), conn=conn)
+    
+    tables = [hot]
+    if partitions:
+        tables.append(pa.parquet.read_table(
+            [os.path.join(archive_dir, path) for path in partitions],
+            columns=columns,
+            schema=archive_schema(),
+            partitioning=None,
+            filters=[(*PARQUET_FILTERS[key], value) for key, value in filters.items()] or None,
+        ))
+    
+    table = pa.concat_tables(tables)
+    if 'ID' in columns:
+        table = table.sort_by([('ID', 'descending')])
+    return table.to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old defects to the Parquet archive")
+    parser.add_argument('--older-than-days', type=int, help=f'default ${ARCHIVE_AGE_ENV} or {DEFAULT_ARCHIVE_AGE_DAYS}')
+    parser.add_argument('--archive-dir', help=f'default ${ARCHIVE_DIR_ENV} or {ARCHIVE_DIR}')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    if not get_manager().multi_process:
+        print(f"! {MULTI_PROCESS_ENV} is off: a running app will not see this archive run until its next write")
+    success, message = archive_defects(args.older_than_days, args.archive_dir, args.batch_size)
+    print(("✓ " if success else "✗ ") + message)
@@ -0,0 +1,80 @@
+"""
+Log viewer read path benchmark
+
+Compares loading the whole table into a DataFrame with pd.read_sql_query
+against columnar_reader.read_defects_frame, with and without a memory-mapped
+database file. For each it reports load time, extra peak RSS over the
+process baseline and the DataFrame's own deep memory usage. Each
+measurement runs in a fresh Python process so the peak RSS of one run
+can't hide behind another.
+
+Usage:
+    python benchmarks/bench_columnar_read.py --rows 10000 100000 1000000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import database_sqlite
+from bench_csv_export import build_database, peak_rss_mb
+
+METHODS = ['read_sql', 'columnar', 'columnar+mmap']
+MMAP_SIZE = 1 << 30             # bytes; larger than any benchmark database
+
+
+def run_child(db_file, method):
+    """Load the table once with the given method and print 'baseline_mb peak_mb seconds frame_mb'"""
+    import pandas as pd
+    from columnar_reader import read_defects_frame
+    database_sqlite.configure(db_file)
+    conn = database_sqlite.get_manager().connection()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if method == 'read_sql':
+        df = pd.read_sql_query("SELECT * FROM PA_InternalScrap ORDER BY ID DESC", conn)
+    else:
+        df = read_defects_frame(mmap_size=MMAP_SIZE if method == 'columnar+mmap' else None)
+    elapsed = time.perf_counter() - start
+    frame_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+    print(baseline, peak_rss_mb(), elapsed, frame_mb)
+
+
+def measure(db_file, method):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', method, '--db', db_file],
+        check=True, capture_output=True, text=True
+    ).stdout.split()
+    baseline, peak, elapsed, frame_mb = (float(value) for value in output)
+    return peak - baseline, elapsed, frame_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--child', choices=METHODS, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        run_child(args.db, args.child)
+        return
+    
+    print("=" * 84)
+    print("Full-table DataFrame load: seconds | extra peak RSS | DataFrame size")
+    print("=" * 84)
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, 'bench.db')
+            build_database(db_file, rows)
+            print(f"{rows:,} rows")
+            for method in METHODS:
+                extra_mb, elapsed, frame_mb = measure(db_file, method)
+                print(f"  {method:<16} {elapsed:7.2f} s   {extra_mb:8.1f} MB peak   {frame_mb:8.1f} MB frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Concurrent write stress benchmark for database_sqlite
+
+Simulates several inspection stations logging into one database at the same
+time. Each worker (thread or process) calls log_defect_to_database in a loop
+and records how long every call takes, including busy waits and retries.
+
+Usage:
+    python benchmarks/bench_concurrent_writes.py --workers 8 --inserts 500
+    python benchmarks/bench_concurrent_writes.py --mode process --busy-timeout 2000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import database_sqlite
+
+CLICK_DATA = {
+    'segment': 7,
+    'ring': 'Outer',
+    'distance': 201,
+    'angle': 192,
+    'option': 'Inboard',
+    'defect': 'Pinholes',
+    'cavity': '3',
+}
+
+
+def _worker(db_file, inserts, pragmas, worker_id):
+    """Insert rows and return (latencies in seconds, failure count, start, end)"""
+    if database_sqlite.get_manager().db_file != db_file:
+        # Fresh worker process: point it at the benchmark database
+        database_sqlite.configure(db_file, pragmas=pragmas)
+    session_info = {
+        'date': time.strftime('%Y-%m-%d'),
+        'part_number': '19.N402.00',
+        'batch_number': f'STATION-{worker_id}',
+        'date_code': 'BENCH',
+        'notes': '',
+    }
+    latencies = []
+    failures = 0
+    started = time.time()
+    for i in range(inserts):
+        click_data = dict(CLICK_DATA, timestamp=f'{worker_id}-{i}')
+        start = time.perf_counter()
+        success, _ = database_sqlite.log_defect_to_database(click_data, session_info)
+        latencies.append(time.perf_counter() - start)
+        if not success:
+            failures += 1
+    return latencies, failures, started, time.time()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def run(workers, inserts, mode, pragmas):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'bench.db')
+        # Create the schema up front so workers only race on inserts
+        database_sqlite.configure(db_file, pragmas=pragmas).connection()
+        
+        if mode == 'process':
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            futures = [
+                executor.submit(_worker, db_file, inserts, pragmas, worker_id)
+                for worker_id in range(workers)
+            ]
+            results = [future.result() for future in futures]
+        database_sqlite.close_connections()
+    
+    # Measure from the first insert to the last, excluding worker process startup
+    elapsed = max(result[3] for result in results) - min(result[2] for result in results)
+    latencies = [latency for result in results for latency in result[0]]
+    failures = sum(result[1] for result in results)
+    return {
+        'workers': workers,
+        'mode': mode,
+        'inserts': len(latencies) - failures,
+        'failures': failures,
+        'elapsed_s': elapsed,
+        'inserts_per_s': (len(latencies) - failures) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8, help='concurrent stations')
+    parser.add_argument('--inserts', type=int, default=250, help='inserts per station')
+    parser.add_argument('--mode', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--journal-mode', default='WAL', help='WAL or DELETE (the old default)')
+    parser.add_argument('--synchronous', default='NORMAL')
+    parser.add_argument('--busy-timeout', type=int, default=5000, help='milliseconds')
+    args = parser.parse_args()
+    
+    pragmas = {
+        'journal_mode': args.journal_mode,
+        'synchronous': args.synchronous,
+        'busy_timeout': args.busy_timeout,
+    }
+    result = run(args.workers, args.inserts, args.mode, pragmas)
+    
+    print("=" * 50)
+    print(f"Concurrent writes: {result['workers']} {result['mode']} workers, journal_mode={args.journal_mode}")
+    print("=" * 50)
+    print(f"Inserts:      {result['inserts']:,} ({result['failures']} failed)")
+    print(f"Elapsed:      {result['elapsed_s']:.2f} s")
+    print(f"Throughput:   {result['inserts_per_s']:,.0f} inserts/s")
+    print(f"p50 commit:   {result['p50_ms']:.2f} ms")
+    print(f"p99 commit:   {result['p99_ms']:.2f} ms")
+    print(f"max commit:   {result['max_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
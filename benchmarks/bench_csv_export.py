@@ -0,0 +1,137 @@
+"""
+CSV export memory benchmark
+
+Compares peak resident memory of the streaming export (write_defects_csv)
+with the old View Logs path (read_sql_query -> DataFrame -> to_csv string)
+as the table grows. Each measurement runs in a fresh Python process so the
+peak RSS of one run can't hide behind another.
+
+Usage:
+    python benchmarks/bench_csv_export.py --rows 10000 50000 200000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import database_sqlite
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PRODUCTS = ["19.N402.00", "19.N400.02", "18.N456.00", "19.E394.00", "XC5.94.00"]
+DEFECTS = ["Pinholes", "Inclusion (sand)", "Cracks", "Short Pours", "Core Set", "Other"]
+
+
+def build_database(db_file, rows):
+    """Fill a fresh database with rows synthetic defects"""
+    manager = database_sqlite.configure(db_file)
+    
+    def insert(conn):
+        conn.executemany(
+            """
+            INSERT INTO PA_InternalScrap
+            (Entry_Date, Batch_Number, Date_Code, Product, Scrap, Quantity, Signature, Notes,
+             Casting_Clock, Pinhole_Level, Exact_Time, Casting_Cavity_Number, Core_Cavity_Number,
+             Core_Clock, Shift_Class, Location)
+            VALUES (?, ?, ?, ?, ?, 1, 'LS', ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                (
+                    f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                    f"B{i // 500:05d}",
+                    f"DC{i % 53:02d}",
+                    PRODUCTS[i % len(PRODUCTS)],
+                    DEFECTS[i % len(DEFECTS)],
+                    "re-checked by shift lead" if i % 20 == 0 else "",
+                    i % 12 + 1,
+                    (i * 7) % 240,
+                    f"2025-01-01T00:00:{i % 60:02d}.000Z",
+                    str(i % 8 + 1),
+                    str(i % 8 + 1),
+                    "Outer",
+                    (i * 13) % 360,
+                    "Inboard" if i % 2 else "Outboard",
+                )
+                for i in range(rows)
+            )
+        )
+    
+    manager.write(insert)
+    database_sqlite.close_connections()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(db_file, method):
+    """Export once with the given method and print 'baseline_mb peak_mb seconds'"""
+    database_sqlite.configure(db_file)
+    if method == 'dataframe':
+        import pandas as pd
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    with tempfile.TemporaryFile(mode='w', encoding='utf-8', newline='') as out:
+        if method == 'stream':
+            database_sqlite.write_defects_csv(out)
+        else:
+            conn = database_sqlite.get_manager().connection()
+            df = pd.read_sql_query("SELECT * FROM PA_InternalScrap ORDER BY ID DESC", conn)
+            out.write(df.to_csv(index=False))
+    elapsed = time.perf_counter() - start
+    print(baseline, peak_rss_mb(), elapsed)
+
+
+def measure(db_file, method):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', method, '--db', db_file],
+        check=True, capture_output=True, text=True
+    ).stdout.split()
+    baseline, peak, elapsed = (float(value) for value in output)
+    return peak - baseline, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--child', choices=['stream', 'dataframe'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        run_child(args.db, args.child)
+        return
+    
+    try:
+        import pandas
+        methods = ['stream', 'dataframe']
+    except ImportError:
+        methods = ['stream']
+    
+    print("=" * 64)
+    print("CSV export: extra peak RSS over process baseline")
+    print("=" * 64)
+    print(f"{'rows':>10} | " + " | ".join(f"{method:>20}" for method in methods))
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, 'bench.db')
+            build_database(db_file, rows)
+            cells = []
+            for method in methods:
+                extra_mb, elapsed = measure(db_file, method)
+                cells.append(f"{extra_mb:8.1f} MB {elapsed:7.2f} s")
+            print(f"{rows:>10,} | " + " | ".join(f"{cell:>20}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
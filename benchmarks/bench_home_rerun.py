@@ -0,0 +1,101 @@
+"""
+Home page rerun timing benchmark
+
+Every widget change reruns Home.py from the top, so the cost of one script
+run is paid on each interaction. This runs the page headlessly with
+Streamlit's AppTest, changes a widget to trigger each rerun, and reports
+how long the script body took. (AppTest's own wall time is dominated by
+its polling, so the page is run through a wrapper that times the exec.)
+With --compare, the same is done for Home.py as of a git revision so the
+two can be compared side by side.
+
+Usage:
+    python benchmarks/bench_home_rerun.py --reruns 200
+    python benchmarks/bench_home_rerun.py --compare HEAD~1
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+import database_sqlite
+from bench_concurrent_writes import percentile
+from streamlit.testing.v1 import AppTest
+
+# The wrapper imports this module by name; make that the running copy
+sys.modules.setdefault('bench_home_rerun', sys.modules[__name__])
+
+WRAPPER = """
+import time
+import bench_home_rerun
+
+with open({script!r}, encoding='utf-8') as f:
+    code = compile(f.read(), {script!r}, 'exec')
+start = time.perf_counter()
+try:
+    exec(code, {{'__file__': {script!r}, '__name__': '__main__'}})
+finally:
+    bench_home_rerun.script_times.append(time.perf_counter() - start)
+"""
+
+script_times = []
+
+
+def time_reruns(script, reruns):
+    """Run script once to warm caches, then time reruns triggered by widget changes"""
+    wrapper = os.path.join(REPO_DIR, '_bench_home_wrapper.py')
+    with open(wrapper, 'w', encoding='utf-8') as f:
+        f.write(WRAPPER.format(script=os.path.abspath(script)))
+    try:
+        at = AppTest.from_file(os.path.abspath(wrapper), default_timeout=30).run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        del script_times[:]
+        for i in range(reruns):
+            at.text_input[-1].set_value(f"rerun {i}").run()
+        return list(script_times)
+    finally:
+        os.remove(wrapper)
+
+
+def summarize(label, timings):
+    print(f"{label:<20} p50 {percentile(timings, 50) * 1000:8.2f} ms   "
+          f"p99 {percentile(timings, 99) * 1000:8.2f} ms   "
+          f"mean {sum(timings) / len(timings) * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reruns', type=int, default=100)
+    parser.add_argument('--compare', metavar='REV', help='also time Home.py from this git revision')
+    args = parser.parse_args()
+    
+    print("=" * 72)
+    print(f"Home.py: {args.reruns} widget-triggered reruns")
+    print("=" * 72)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        database_sqlite.configure(os.path.join(tmp, 'bench.db'))
+        summarize("working tree", time_reruns(os.path.join(REPO_DIR, 'Home.py'), args.reruns))
+        
+        if args.compare:
+            source = subprocess.run(
+                ['git', 'show', f'{args.compare}:Home.py'],
+                cwd=REPO_DIR, check=True, capture_output=True, text=True
+            ).stdout
+            # Next to Home.py, so the old script's relative paths and imports resolve
+            old_script = os.path.join(REPO_DIR, '_bench_home_compare.py')
+            with open(old_script, 'w', encoding='utf-8') as f:
+                f.write(source)
+            try:
+                summarize(args.compare, time_reruns(old_script, args.reruns))
+            finally:
+                os.remove(old_script)
+        database_sqlite.close_connections()
+
+
+if __name__ == "__main__":
+    main()
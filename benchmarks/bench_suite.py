@@ -0,0 +1,294 @@
+"""
+Benchmark suite for the logging stack
+
+Builds synthetic databases of each requested size (see workload.py), then
+times the public functions of database_sqlite and the View Logs read path
+against them: logging, counts, pages, breakdowns, summaries, exports and
+maintenance. The query result cache is cleared before every call unless
+--warm-cache is given, so the numbers are SQLite's, not the cache's.
+
+Results are written as JSON. --compare reads an earlier results file and
+flags every benchmark whose median got slower by more than --threshold.
+
+Functions that only run inside a caller's write transaction
+(insert_defect_rows, add_catalog_names, delete_archived_defects) are
+measured through the calls that use them.
+
+Usage:
+    python benchmarks/bench_suite.py --rows 1000 10000 100000 --output before.json
+    python benchmarks/bench_suite.py --rows 1000 10000 100000 --compare before.json
+    python benchmarks/bench_suite.py --rows 10000000 --data-dir /var/tmp/scrap-bench
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+import database_sqlite
+from bench_concurrent_writes import percentile
+from columnar_reader import read_defects_frame
+from workload import Workload, build_database
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_REPEAT = 20
+FULL_SCAN_LIMIT = 1000000       # skip whole-table loads above this many rows
+REGRESSION_THRESHOLD = 1.2      # median slowdown that --compare reports
+
+
+def time_calls(func, repeat, warm_cache=False):
+    """Call func repeat times; returns the timings in seconds"""
+    timings = []
+    for _ in range(repeat):
+        if not warm_cache:
+            database_sqlite.query_cache.clear()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'n': len(timings),
+        'min_ms': min(timings) * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'mean_ms': sum(timings) / len(timings) * 1000,
+    }
+
+
+def sample_filters():
+    """Realistic filter values taken from the database being measured"""
+    products = database_sqlite.get_defect_counts_by_product()
+    scraps = database_sqlite.get_defect_counts_by_scrap()
+    days = database_sqlite.get_defect_counts_by_day()
+    newest = max(days) if days else date.today().isoformat()
+    month_ago = (date.fromisoformat(newest) - timedelta(days=30)).isoformat()
+    rows, _, _ = database_sqlite.get_defects_page(page_size=1)
+    return {
+        'product': next(iter(products), None),
+        'scrap': next(iter(scraps), None),
+        'location': 'Inboard',
+        'batch_number': rows[0][3] if rows else None,
+        'date_from': month_ago,
+        'date_to': newest,
+    }
+
+
+def consume(iterator):
+    for _ in iterator:
+        pass
+
+
+def read_cases(rows, sample):
+    """(name, callable) pairs that only read"""
+    month = {'date_from': sample['date_from'], 'date_to': sample['date_to']}
+    product = {'product': sample['product']}
+    combined = {'product': sample['product'], 'scrap': sample['scrap'], 'location': sample['location']}
+    batch = {'batch_number': sample['batch_number']}
+    middle_id = database_sqlite.get_last_defect_id() // 2
+    cases = [
+        ("get_defect_count", database_sqlite.get_defect_count),
+        ("get_last_defect_id", database_sqlite.get_last_defect_id),
+        ("get_archived_count", database_sqlite.get_archived_count),
+        ("get_catalog_names Product", lambda: database_sqlite.get_catalog_names('Product')),
+        ("count_defects month", lambda: database_sqlite.count_defects(month)),
+        ("count_defects product", lambda: database_sqlite.count_defects(product)),
+        ("count_defects product+scrap+location", lambda: database_sqlite.count_defects(combined)),
+        ("count_defects batch", lambda: database_sqlite.count_defects(batch)),
+        ("get_defects_page first", lambda: database_sqlite.get_defects_page(page_size=100)),
+        ("get_defects_page product", lambda: database_sqlite.get_defects_page(product, page_size=100)),
+        ("get_defects_page deep", lambda: database_sqlite.get_defects_page(before_id=middle_id, page_size=100)),
+        ("view_logs page month+product", lambda: (
+            database_sqlite.count_defects(dict(month, **product)),
+            read_defects_frame(dict(month, **product), limit=101),
+        )),
+        ("view_logs page combined", lambda: (
+            database_sqlite.count_defects(combined),
+            read_defects_frame(combined, limit=101),
+        )),
+        ("iter_defect_chunks batch", lambda: consume(database_sqlite.iter_defect_chunks(batch))),
+        ("write_defects_csv month", lambda: database_sqlite.write_defects_csv(io.StringIO(), month)),
+        ("get_defect_breakdown day", lambda: database_sqlite.get_defect_breakdown('day')),
+        ("get_defect_breakdown product", database_sqlite.get_defect_counts_by_product),
+        ("get_defect_breakdown scrap", database_sqlite.get_defect_counts_by_scrap),
+        ("get_defect_totals Product+Scrap", lambda: database_sqlite.get_defect_totals(['Product', 'Scrap'])),
+        ("get_defect_totals Location month", lambda: database_sqlite.get_defect_totals(['Location'], month)),
+        ("refresh_defect_summaries no-op", database_sqlite.refresh_defect_summaries),
+        ("get_daily_summary month", lambda: database_sqlite.get_daily_summary(month['date_from'], month['date_to'])),
+        ("get_batch_summary month", lambda: database_sqlite.get_batch_summary(month['date_from'], month['date_to'])),
+        ("get_export_watermark", database_sqlite.get_export_watermark),
+        ("iter_sql_server_export first batch", lambda: next(database_sqlite.iter_sql_server_export(), None)),
+        ("explain_app_queries", database_sqlite.explain_app_queries),
+        ("build_filter_clause", lambda: database_sqlite.build_filter_clause(combined)),
+        ("sql_server_literal", lambda: database_sqlite.sql_server_literal("O'Brien")),
+    ]
+    if rows <= FULL_SCAN_LIMIT:
+        cases += [
+            ("get_all_defects", database_sqlite.get_all_defects),
+            ("read_defects_frame all", read_defects_frame),
+            ("write_defects_csv all", lambda: database_sqlite.write_defects_csv(io.StringIO())),
+            ("export_to_sql_server_format", database_sqlite.export_to_sql_server_format),
+        ]
+    return cases
+
+
+def write_cases(rows, workload):
+    """(name, callable, repeat or None) for calls that change the database; run after the reads"""
+    click_data, session_info = workload.click()
+    clicks = [workload.click()[0] for _ in range(10)]
+    # A new idempotency key per call, or every call after the first is a repeat
+    keys = itertools.count()
+    
+    def fresh(click):
+        return {**click, 'client_id': f"bench-{next(keys)}"}
+    cases = [
+        ("build_defect_values", lambda: database_sqlite.build_defect_values(click_data, session_info), None),
+        ("log_defect_to_database", lambda: database_sqlite.log_defect_to_database(fresh(click_data), session_info), None),
+        ("log_defect_to_database repeat", lambda: database_sqlite.log_defect_to_database(click_data, session_info), None),
+        ("log_defects_batch 10", lambda: database_sqlite.log_defects_batch([fresh(click) for click in clicks], session_info), None),
+        ("register_catalog_names existing", lambda: database_sqlite.register_catalog_names(
+            'Product', [session_info['part_number']]), None),
+        ("refresh_defect_summaries after log", lambda: (
+            database_sqlite.log_defect_to_database(fresh(click_data), session_info),
+            database_sqlite.refresh_defect_summaries(),
+        ), None),
+        ("set_export_watermark", lambda: database_sqlite.set_export_watermark(0), None),
+    ]
+    if rows <= FULL_SCAN_LIMIT:
+        cases += [
+            ("rebuild_defect_counters", database_sqlite.rebuild_defect_counters, 3),
+            ("rebuild_defect_summaries", database_sqlite.rebuild_defect_summaries, 3),
+        ]
+    return cases
+
+
+def prepare_database(rows, data_dir, work_file, seed):
+    """Build (or reuse) the base database for a size and copy it to work_file"""
+    base_file = os.path.join(data_dir, f"defects_{rows}_seed{seed}.db")
+    build = None
+    if not os.path.exists(base_file):
+        elapsed = build_database(base_file, rows, seed=seed)
+        database_sqlite.refresh_defect_summaries()
+        build = {'insert_s': elapsed, 'rows_per_s': rows / elapsed}
+        database_sqlite.close_connections()
+        # Fold the WAL into the main file so a plain copy carries everything
+        with sqlite3.connect(base_file) as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    shutil.copyfile(base_file, work_file)
+    return build
+
+
+def run_size(rows, data_dir, repeat, warm_cache, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        work_file = os.path.join(tmp, 'bench.db')
+        build = prepare_database(rows, data_dir, work_file, seed)
+        database_sqlite.configure(work_file)
+        results = {}
+        
+        def record(name, func, times):
+            results[name] = summarize(time_calls(func, times, warm_cache))
+            print(f"  {name:<40} p50 {results[name]['p50_ms']:10.3f} ms   p95 {results[name]['p95_ms']:10.3f} ms")
+        
+        sample = sample_filters()
+        for name, func in read_cases(rows, sample):
+            func()      # warm the page cache; the first call pays for reading the file
+            record(name, func, repeat)
+        workload = Workload(seed + 1)
+        for name, func, times in write_cases(rows, workload):
+            record(name, func, times or repeat)
+        
+        database_sqlite.close_connections()
+        return {'build': build, 'results': results}
+
+
+def metadata():
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def compare(current, previous, threshold):
+    """Print median changes against an earlier results file; returns the number of regressions"""
+    regressions = 0
+    print("=" * 84)
+    print(f"Compared with {previous['meta'].get('revision')} ({previous['meta'].get('timestamp')})")
+    print("=" * 84)
+    for size, run in current['sizes'].items():
+        old_run = previous['sizes'].get(size)
+        if old_run is None:
+            continue
+        print(f"{int(size):,} rows")
+        for name, result in run['results'].items():
+            old = old_run['results'].get(name)
+            if old is None or old['p50_ms'] == 0:
+                continue
+            ratio = result['p50_ms'] / old['p50_ms']
+            flag = "  REGRESSION" if ratio > threshold else ""
+            regressions += bool(flag)
+            print(f"  {name:<40} {old['p50_ms']:10.3f} -> {result['p50_ms']:10.3f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help='keep generated databases here and reuse them across runs')
+    parser.add_argument('--warm-cache', action='store_true', help='leave the query result cache on')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', metavar='JSON', help='compare medians with an earlier results file')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+    
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='scrap-bench-')
+    os.makedirs(data_dir, exist_ok=True)
+    report = {'meta': metadata(), 'sizes': {}}
+    try:
+        for rows in args.rows:
+            print("=" * 84)
+            print(f"{rows:,} rows")
+            print("=" * 84)
+            run = run_size(rows, data_dir, args.repeat, args.warm_cache, args.seed)
+            if run['build']:
+                print(f"  built at {run['build']['rows_per_s']:,.0f} rows/s")
+            report['sizes'][str(rows)] = run
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        if compare(report, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Time-window query benchmark
+
+Times the common windows (current/last shift, today, this week, ...) two
+ways on the same database: the old way, comparing Exact_Time text and
+working the shift out per row, and the typed way, a range scan on the
+Exact_Epoch index with the stored Shift. For each it reports the median
+time of a count and of a per-shift breakdown, and the query plan.
+
+Usage:
+    python benchmarks/bench_time_windows.py --rows 100000 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import database_sqlite
+from database_sqlite import DATA_TABLE, SHIFT_SQL
+from time_windows import WINDOWS, resolve_window
+from workload import build_database
+
+DAYS = 90
+
+
+def text_queries(start, end):
+    """(count sql, per-shift sql, params) comparing Exact_Time text"""
+    bounds = [datetime.fromtimestamp(bound, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S') for bound in (start, end)]
+    where = "WHERE Exact_Time >= ? AND Exact_Time < ?"
+    return (
+        f"SELECT COUNT(*) FROM {DATA_TABLE} {where}",
+        f"SELECT Entry_Date, {SHIFT_SQL.format(ref='Exact_Time')}, COUNT(*) FROM {DATA_TABLE} {where} GROUP BY 1, 2",
+        bounds,
+    )
+
+
+def typed_queries(start, end):
+    """(count sql, per-shift sql, params) on Exact_Epoch and Shift"""
+    where = "WHERE Exact_Epoch >= ? AND Exact_Epoch < ?"
+    return (
+        f"SELECT COUNT(*) FROM {DATA_TABLE} {where}",
+        f"SELECT Entry_Day, Shift, COUNT(*) FROM {DATA_TABLE} {where} GROUP BY 1, 2",
+        [start, end],
+    )
+
+
+def median_ms(conn, sql, params, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def plan(conn, sql, params):
+    return "; ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    print("=" * 84)
+    print("Time windows: median ms, text (Exact_Time) vs typed (Exact_Epoch)")
+    print("=" * 84)
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, 'bench.db')
+            build_database(db_file, rows, days=DAYS)
+            # Plain connection: no query cache between repeats
+            conn = database_sqlite.get_manager().connection()
+            conn.execute(f"ANALYZE {DATA_TABLE}")
+            print(f"{rows:,} rows over {DAYS} days")
+            print(f"  {'window':<14} {'matches':>9}   {'count text':>10} {'typed':>8}   {'by shift text':>13} {'typed':>8}")
+            for window in WINDOWS:
+                start, end = resolve_window(window)
+                text_count, text_shift, text_params = text_queries(start, end)
+                typed_count, typed_shift, typed_params = typed_queries(start, end)
+                matches = conn.execute(typed_count, typed_params).fetchone()[0]
+                assert matches == conn.execute(text_count, text_params).fetchone()[0]
+                print(f"  {window:<14} {matches:>9,}   "
+                      f"{median_ms(conn, text_count, text_params, args.repeat):10.2f} "
+                      f"{median_ms(conn, typed_count, typed_params, args.repeat):8.2f}   "
+                      f"{median_ms(conn, text_shift, text_params, args.repeat):13.2f} "
+                      f"{median_ms(conn, typed_shift, typed_params, args.repeat):8.2f}")
+            start, end = resolve_window("last_shift")
+            print(f"  plan text:  {plan(conn, *text_queries(start, end)[::2])}")
+            print(f"  plan typed: {plan(conn, *typed_queries(start, end)[::2])}")
+            database_sqlite.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Click-to-acknowledgement latency: synchronous logging vs the write-behind queue
+
+Several simulated operator sessions submit defects at the same time. For the
+synchronous path the acknowledgement is the return of log_defect_to_database;
+for write-behind it is the return of submit(), and "durable" is when the
+row's Future resolves to its ID after the group commit.
+
+Usage:
+    python benchmarks/bench_write_behind.py --sessions 8 --clicks 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import database_sqlite
+from bench_concurrent_writes import CLICK_DATA, percentile
+from write_behind import WriteBehindQueue
+
+SESSION_INFO = {
+    'date': '2025-06-02',
+    'part_number': '19.N402.00',
+    'batch_number': 'B-1042',
+    'date_code': 'DC22',
+    'notes': '',
+}
+
+
+def run_sessions(sessions, clicks, think_time, submit):
+    """Run submit(i) from every session thread; return per-click ack latencies"""
+    latencies = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(sessions)
+    
+    def session(session_id):
+        local = []
+        start_barrier.wait()
+        for i in range(clicks):
+            start = time.perf_counter()
+            submit(session_id * clicks + i)
+            local.append(time.perf_counter() - start)
+            if think_time:
+                time.sleep(think_time)
+        with lock:
+            latencies.extend(local)
+    
+    threads = [threading.Thread(target=session, args=(s,)) for s in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def summarize(label, latencies):
+    print(f"{label:<26} p50 {percentile(latencies, 50) * 1000:8.3f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:8.3f} ms   "
+          f"max {max(latencies) * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--clicks', type=int, default=200, help='clicks per session')
+    parser.add_argument('--think-time', type=float, default=0.001, help='seconds between clicks')
+    parser.add_argument('--synchronous', default='FULL', help='synchronous pragma for both paths')
+    args = parser.parse_args()
+    pragmas = {'synchronous': args.synchronous}
+    
+    print("=" * 78)
+    print(f"{args.sessions} sessions x {args.clicks} clicks, synchronous={args.synchronous}")
+    print("=" * 78)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        database_sqlite.configure(os.path.join(tmp, 'sync.db'), pragmas=pragmas)
+        
+        def submit_sync(i):
+            database_sqlite.log_defect_to_database(dict(CLICK_DATA, timestamp=str(i)), SESSION_INFO)
+        
+        summarize("synchronous ack", run_sessions(args.sessions, args.clicks, args.think_time, submit_sync))
+        database_sqlite.close_connections()
+        
+        database_sqlite.configure(os.path.join(tmp, 'queued.db'), pragmas=pragmas)
+        write_queue = WriteBehindQueue(synchronous=args.synchronous)
+        submitted = {}
+        durable = []
+        
+        def submit_queued(i):
+            start = time.perf_counter()
+            future = write_queue.submit(dict(CLICK_DATA, timestamp=str(i)), SESSION_INFO)
+            future.add_done_callback(lambda f: durable.append(time.perf_counter() - start))
+            submitted[i] = future
+        
+        acks = run_sessions(args.sessions, args.clicks, args.think_time, submit_queued)
+        write_queue.close()
+        summarize("write-behind ack", acks)
+        summarize("write-behind durable", durable)
+        failures = sum(1 for future in submitted.values() if future.exception())
+        print(f"write-behind rows: {len(submitted) - failures:,} committed, {failures} failed, "
+              f"{database_sqlite.get_defect_count():,} in database")
+        database_sqlite.close_connections()
+
+
+if __name__ == "__main__":
+    main()
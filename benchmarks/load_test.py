@@ -0,0 +1,192 @@
+"""
+Multi-process load test
+
+Runs the database side of a multi-process deployment: --processes worker
+processes share one database, as several Streamlit servers behind a
+reverse proxy would, and each runs --sessions simulated operator sessions
+on threads. A session loops over page reruns (total count, current-shift
+count, newest page of the log) with --think-ms between them, and every
+--submit-every reruns submits 1-5 defects with client IDs. One submission
+in ten is sent a second time, like a browser resending its outbox.
+
+Reported per mode: latency percentiles per operation, throughput, failed
+submissions, busy retries, writer lock waits, rows in the database against
+distinct rows submitted, and stale reads (a cached total lower than an
+uncached total read just before it, i.e. a write from another process the
+query cache had not seen yet) with how many rows the worst one was behind.
+
+"multi" runs with multi_process (file writer lock and shared generation),
+"plain" without, as every process ran before.
+
+Usage:
+    python benchmarks/load_test.py --processes 4 --sessions 25 --duration 20
+    python benchmarks/load_test.py --mode multi --processes 8 --sessions 50 --think-ms 50
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+import database_sqlite
+from bench_concurrent_writes import percentile
+from metrics import metrics
+from time_windows import count_defects_in_window
+from workload import Workload, build_database
+
+OPERATIONS = ('rerun', 'submit', 'resend')
+RESEND_RATE = 0.1
+TOTAL_SQL = "SELECT Total FROM PA_InternalScrap_Counters WHERE Dimension = 'total' AND Key = ''"
+
+
+def _session(session_id, end_at, think_ms, submit_every, result, lock):
+    workload = Workload(seed=session_id, days=1)
+    rng = random.Random(session_id)
+    latencies = defaultdict(list)
+    submitted, failures, stale, behind, reruns = set(), 0, 0, 0, 0
+    manager = database_sqlite.get_manager()
+    while time.time() < end_at:
+        # Uncached total first: counts only grow here, so a cached total below it is stale
+        true_total = manager.connection().execute(TOTAL_SQL).fetchone()[0]
+        start = time.perf_counter()
+        total = database_sqlite.get_defect_count()
+        count_defects_in_window("current_shift")
+        database_sqlite.get_defects_page(page_size=100)
+        latencies['rerun'].append(time.perf_counter() - start)
+        stale += total < true_total
+        behind = max(behind, true_total - total)
+        reruns += 1
+        
+        if reruns % submit_every == 0:
+            clicks = [workload.click() for _ in range(rng.randint(1, 5))]
+            entries = [click_data for click_data, _ in clicks]
+            resends = 2 if rng.random() < RESEND_RATE else 1
+            for attempt in range(resends):
+                start = time.perf_counter()
+                success, _ = database_sqlite.log_defects_batch(entries, clicks[0][1])
+                latencies['resend' if attempt else 'submit'].append(time.perf_counter() - start)
+                if success:
+                    submitted.update(entry['client_id'] for entry in entries)
+                else:
+                    failures += 1
+        time.sleep(think_ms / 1000 * rng.uniform(0.5, 1.5))
+    
+    with lock:
+        for operation, values in latencies.items():
+            result['latencies'][operation].extend(values)
+        result['submitted'].update(submitted)
+        result['failures'] += failures
+        result['stale'] += stale
+        result['behind'] = max(result['behind'], behind)
+        result['reruns'] += reruns
+
+
+def _worker(db_file, multi_process, sessions, first_session, start_at, duration, think_ms, submit_every):
+    """One server process: run its sessions, return their combined results"""
+    database_sqlite.configure(db_file, multi_process=multi_process)
+    metrics.enabled = True
+    metrics.slow_ms = float("inf")     # counters and timers only, no slow-operation warnings
+    database_sqlite.get_manager().connection()
+    result = {'latencies': defaultdict(list), 'submitted': set(), 'failures': 0, 'stale': 0, 'behind': 0, 'reruns': 0}
+    lock = threading.Lock()
+    time.sleep(max(0.0, start_at - time.time()))
+    threads = [
+        threading.Thread(target=_session, args=(first_session + i, start_at + duration, think_ms, submit_every,
+                                                result, lock))
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = metrics.snapshot()
+    result['busy_retries'] = snapshot['counters'].get('db.write.busy_retries', 0)
+    result['lock_wait'] = snapshot['timers'].get('db.write.lock')
+    database_sqlite.close_connections()
+    return result
+
+
+def run(mode, processes, sessions, duration, think_ms, submit_every, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'load.db')
+        build_database(db_file, rows, days=30)
+        database_sqlite.close_connections()
+        
+        # Every process starts its sessions at the same moment, after startup
+        start_at = time.time() + 2.0 + 0.2 * processes
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(_worker, db_file, mode == "multi", sessions, process * sessions, start_at,
+                                duration, think_ms, submit_every)
+                for process in range(processes)
+            ]
+            results = [future.result() for future in futures]
+        
+        conn = database_sqlite.configure(db_file, multi_process=False).connection()
+        logged = conn.execute(
+            f"SELECT COUNT(*) FROM {database_sqlite.DATA_TABLE} WHERE Client_ID IS NOT NULL"
+        ).fetchone()[0]
+        database_sqlite.close_connections()
+    
+    latencies = defaultdict(list)
+    for result in results:
+        for operation, values in result['latencies'].items():
+            latencies[operation].extend(values)
+    submitted = set().union(*(result['submitted'] for result in results))
+    lock_waits = [result['lock_wait'] for result in results if result['lock_wait']]
+    return {
+        'mode': mode,
+        'reruns_per_s': sum(result['reruns'] for result in results) / duration,
+        'submits_per_s': len(latencies['submit']) / duration,
+        'latencies': latencies,
+        'failures': sum(result['failures'] for result in results),
+        'busy_retries': sum(result['busy_retries'] for result in results),
+        'lock_wait_max_ms': max((wait['max_ms'] for wait in lock_waits), default=0.0),
+        'stale': sum(result['stale'] for result in results),
+        'behind': max(result['behind'] for result in results),
+        'submitted': len(submitted),
+        'logged': logged,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['multi', 'plain', 'both'], default='both')
+    parser.add_argument('--processes', type=int, default=4, help='server processes')
+    parser.add_argument('--sessions', type=int, default=25, help='sessions per process')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds')
+    parser.add_argument('--think-ms', type=float, default=100.0, help='pause between reruns')
+    parser.add_argument('--submit-every', type=int, default=3, help='reruns per submission')
+    parser.add_argument('--rows', type=int, default=50000, help='rows in the database to start with')
+    args = parser.parse_args()
+    
+    modes = ["plain", "multi"] if args.mode == "both" else [args.mode]
+    print("=" * 78)
+    print(f"Load test: {args.processes} processes x {args.sessions} sessions, {args.duration:g} s, "
+          f"{args.think_ms:g} ms think time")
+    print("=" * 78)
+    for mode in modes:
+        result = run(mode, args.processes, args.sessions, args.duration, args.think_ms, args.submit_every,
+                     args.rows)
+        print(f"{mode}: {result['reruns_per_s']:,.0f} reruns/s, {result['submits_per_s']:,.0f} submissions/s")
+        for operation in OPERATIONS:
+            values = result['latencies'][operation]
+            if values:
+                print(f"  {operation:<8} n={len(values):<7,} p50 {percentile(values, 50) * 1000:7.2f} ms  "
+                      f"p95 {percentile(values, 95) * 1000:7.2f} ms  p99 {percentile(values, 99) * 1000:7.2f} ms  "
+                      f"max {max(values) * 1000:8.2f} ms")
+        print(f"  failed submissions {result['failures']:,}, busy retries {result['busy_retries']:,}, "
+              f"longest writer lock wait {result['lock_wait_max_ms']:.1f} ms")
+        print(f"  rows logged {result['logged']:,} of {result['submitted']:,} distinct submitted, "
+              f"stale reads {result['stale']:,} (up to {result['behind']:,} rows behind)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Synthetic defect workload
+
+Generates PA_InternalScrap rows shaped like the line's data rather than
+uniform noise: a few part numbers account for most of the volume, a few
+defect types dominate, defects cluster by clock position and ring, the
+Pinhole_Level/Shift_Class values agree with the ring and segment they were
+clicked in, and weekdays run heavier than weekends. Rows are produced in
+chunks with NumPy, so a 10M-row database can be built without holding it
+in memory.
+
+Usage:
+    python benchmarks/workload.py --rows 1000000 --db bench.db
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+import database_sqlite
+
+PART_NUMBERS_FILE = os.path.join(REPO_DIR, 'part_numbers.txt')
+
+# Relative frequency of each defect type; the rest share what is left
+DEFECT_WEIGHTS = {
+    "Pinholes": 22, "Inclusion (sand)": 15, "Cracks": 8, "Core Set": 7, "Short Pours": 6,
+    "Drum Thickness": 5, "Mismatch": 5, "Heavy Dry Core": 4, "Burns": 3, "Damage": 3,
+}
+
+# Ring -> (relative frequency, distance range from the centre in diagram pixels)
+RINGS = {
+    "Center": (3, 0, 25),
+    "CenterRing": (3, 26, 35),
+    "Inner": (34, 36, 140),
+    "Middle": (24, 141, 170),
+    "Outer": (26, 171, 230),
+    "Border": (7, 231, 240),
+    "Outside": (3, 241, 260),
+}
+
+# Clock positions 1-12; the gate side (5-7 o'clock) collects most defects
+SEGMENT_WEIGHTS = [4, 4, 5, 7, 11, 14, 12, 9, 6, 5, 4, 4]
+
+WEEKDAY_WEIGHTS = [10, 10, 10, 10, 9, 4, 2]        # Monday..Sunday
+SHIFT_STARTS = [6, 14, 22]                         # hour each shift starts
+CAVITIES = 8
+NOTES = ["re-checked by shift lead", "sent to lab", "customer return", "rework possible"]
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def load_part_numbers():
+    """The part numbers offered on the Home page"""
+    with open(PART_NUMBERS_FILE, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def _normalized(weights):
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+class Workload:
+    """
+    Random generator of defect rows in INSERT_DEFECT_SQL value order
+    
+    Args:
+        seed (int): Seed for the random generator; equal seeds give equal rows
+        days (int): Entry_Date spread, ending at end_date
+        end_date (date): Newest Entry_Date (default today)
+    """
+    
+    def __init__(self, seed=0, days=365, end_date=None):
+        self.rng = np.random.default_rng(seed)
+        self.parts = load_part_numbers()
+        self.rng.shuffle(self.parts)
+        # Zipf-like: the k-th most common part is logged about 1/k as often as the first
+        self.part_p = _normalized(1.0 / np.arange(1, len(self.parts) + 1) ** 1.1)
+        
+        self.defects = list(database_sqlite.DEFECT_TYPES)
+        leftover = max(1, (100 - sum(DEFECT_WEIGHTS.values())) / max(1, len(self.defects) - len(DEFECT_WEIGHTS)))
+        self.defect_p = _normalized([DEFECT_WEIGHTS.get(name, leftover) for name in self.defects])
+        
+        self.rings = list(RINGS)
+        self.ring_p = _normalized([RINGS[name][0] for name in self.rings])
+        self.ring_low = np.array([RINGS[name][1] for name in self.rings])
+        self.ring_high = np.array([RINGS[name][2] for name in self.rings])
+        self.segment_p = _normalized(SEGMENT_WEIGHTS)
+        
+        end_date = end_date or date.today()
+        self.days = [end_date - timedelta(days=offset) for offset in range(days)]
+        self.day_p = _normalized([WEEKDAY_WEIGHTS[day.weekday()] for day in self.days])
+        self.day_text = [day.isoformat() for day in self.days]
+    
+    def chunk(self, count):
+        """Generate count rows as a list of value tuples"""
+        rng = self.rng
+        day = rng.choice(len(self.days), size=count, p=self.day_p)
+        part = rng.choice(len(self.parts), size=count, p=self.part_p)
+        defect = rng.choice(len(self.defects), size=count, p=self.defect_p)
+        ring = rng.choice(len(self.rings), size=count, p=self.ring_p)
+        segment = rng.choice(12, size=count, p=self.segment_p) + 1
+        distance = rng.integers(self.ring_low[ring], self.ring_high[ring] + 1)
+        angle = ((segment - 1) * 30 + rng.integers(0, 30, size=count)) % 360
+        shift = rng.integers(0, len(SHIFT_STARTS), size=count)
+        seconds = rng.integers(0, 8 * 3600, size=count)
+        cavity = rng.integers(1, CAVITIES + 1, size=count)
+        location = rng.integers(0, 2, size=count)
+        noted = rng.random(count) < 0.05
+        note = rng.integers(0, len(NOTES), size=count)
+        
+        rows = []
+        for i in range(count):
+            entry_date = self.day_text[day[i]]
+            hour = (SHIFT_STARTS[shift[i]] + seconds[i] // 3600) % 24
+            minute, second = divmod(int(seconds[i] % 3600), 60)
+            cavity_number = str(cavity[i])
+            rows.append((
+                entry_date,                                             # Entry_Date
+                f"{entry_date.replace('-', '')[2:]}-{part[i]:02d}-{shift[i] + 1}",   # Batch_Number
+                f"DC{day[i] % 53:02d}",                                 # Date_Code
+                self.parts[part[i]],                                    # Product
+                self.defects[defect[i]],                                # Scrap
+                1,                                                      # Quantity
+                'LS',                                                   # Signature
+                NOTES[note[i]] if noted[i] else None,                   # Notes
+                int(segment[i]),                                        # Casting_Clock
+                int(distance[i]),                                       # Pinhole_Level
+                f"{entry_date}T{hour:02d}:{minute:02d}:{second:02d}.000Z",   # Exact_Time
+                cavity_number,                                          # Casting_Cavity_Number
+                cavity_number,                                          # Core_Cavity_Number
+                self.rings[ring[i]],                                    # Core_Clock
+                int(angle[i]),                                          # Shift_Class
+                "Inboard" if location[i] else "Outboard",               # Location
+                None,                                                   # Client_ID
+            ))
+        return rows
+    
+    def chunks(self, total, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield total rows in lists of at most chunk_size"""
+        while total > 0:
+            count = min(chunk_size, total)
+            yield self.chunk(count)
+            total -= count
+    
+    def click(self):
+        """One (click_data, session_info) pair, as the Home page passes to log_defect_to_database"""
+        values = self.chunk(1)[0]
+        click_data = {
+            'defect': values[4], 'segment': values[8], 'distance': values[9], 'timestamp': values[10],
+            'cavity': values[11], 'ring': values[13], 'angle': values[14], 'option': values[15],
+            'client_id': self.rng.bytes(16).hex(),
+        }
+        session_info = {'date': values[0], 'batch_number': values[1], 'date_code': values[2],
+                        'part_number': values[3], 'notes': values[7]}
+        return click_data, session_info
+
+
+def build_database(db_file, rows, seed=0, days=365, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Add rows synthetic defects to db_file through the normal insert path
+    
+    Returns:
+        float: Seconds spent inserting (generation excluded)
+    """
+    manager = database_sqlite.configure(db_file)
+    workload = Workload(seed, days)
+    elapsed = 0.0
+    for chunk in workload.chunks(rows, chunk_size):
+        start = time.perf_counter()
+        manager.write(lambda conn: database_sqlite.insert_defect_rows(conn, chunk))
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--db', required=True, help='database file to create or extend')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+    
+    elapsed = build_database(args.db, args.rows, args.seed, args.days)
+    print(f"{args.rows:,} rows inserted in {elapsed:.1f} s ({args.rows / elapsed:,.0f} rows/s)")
+    database_sqlite.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
+import itertools
 import os
+from collections import OrderedDict
+
+import streamlit as st
 import streamlit.components.v1 as components
 
 _RELEASE = True
@@ -13,12 +17,100 @@ else:
     build_dir = os.path.join(parent_dir, "frontend/build")
     _component_func = components.declare_component("circle_diagram", path=build_dir)
 
+SEEN_LIMIT = 5000       # client_ids remembered per session for deduplication
+ACK_LIMIT = 500         # most recent stored ones sent back to the component as acknowledgements
+
+
+def _seen_ids(key):
+    """
+    This session's received client_ids for one diagram, oldest first,
+    mapped to True once stored (acknowledged) or False while held
+    """
+    state_key = f"_circle_diagram_seen_{key}"
+    if state_key not in st.session_state:
+        st.session_state[state_key] = OrderedDict()
+    return st.session_state[state_key]
+
+
+def _receive(component_value, key):
+    seen = _seen_ids(key)
+    entries = []
+    for entry in (component_value or {}).get('entries', []):
+        client_id = entry.get('client_id')
+        if client_id in seen:
+            continue
+        entries.append(entry)
+        if client_id:
+            seen[client_id] = False
+    while len(seen) > SEEN_LIMIT:
+        seen.popitem(last=False)
+    return entries or None
+
+
+def new_entries(key):
+    """
+    Entries the diagram has sent since they were last taken, before it is drawn
+    
+    Reads the component's latest value from st.session_state, so a page can
+    store the entries and call confirm_entries before circle_diagram, and
+    the acknowledgement goes out with the same run instead of waiting for
+    the component's resend.
+    
+    Returns:
+        list of dict or None: New entries, held until confirm_entries or release_entries
+    """
+    return _receive(st.session_state.get(key), key)
+
 
-def circle_diagram(key=None):
+def circle_diagram(key=None, defect_types=None, heatmap=None):
     """
     Create a Circle Diagram component.
     
-    Returns dict with defect data when user completes the workflow.
+    defect_types is the list of defect buttons to offer (the component's
+    built-in list when empty). heatmap is a Heatmap.overlay() payload to
+    shade segments and rings by defect count, or None for no overlay.
+    
+    Returns a list of defect dicts when user completes the workflow: one
+    entry for a single click, or one per marked point in multi-point mode.
+    
+    The component keeps submitted entries in the browser's localStorage and
+    sends them in batches, each with a client_id, until this function has
+    acknowledged them on a later run. Entries already received in this
+    session (the component's value is returned again on every rerun, and
+    unacknowledged entries are resent) are dropped, so each is returned
+    once (here or by new_entries); None when there is nothing new.
+    Returned entries are only acknowledged after confirm_entries; call
+    release_entries for entries that could not be stored, so they are
+    accepted when resent.
+    """
+    seen = _seen_ids(key)
+    acked = list(itertools.islice((client_id for client_id, stored in reversed(seen.items()) if stored), ACK_LIMIT))
+    component_value = _component_func(defect_types=defect_types or [], heatmap=heatmap, acked=acked,
+                                      key=key, default=None)
+    return _receive(component_value, key)
+
+
+def confirm_entries(entries, key=None):
+    """
+    Mark entries as stored, so the component is told to drop them
+    
+    The acknowledgement goes out on the diagram's next render: this run if
+    called before circle_diagram, otherwise the next rerun.
+    """
+    seen = _seen_ids(key)
+    for entry in entries:
+        client_id = entry.get('client_id')
+        if client_id in seen:
+            seen[client_id] = True
+
+
+def release_entries(entries, key=None):
+    """
+    Forget entries returned by circle_diagram that were not stored
+    
+    They stay unacknowledged in the component, which sends them again
+    (after a short delay) and this time they are returned as new.
     """
-    component_value = _component_func(key=key, default=None)
-    return component_value
\ No newline at end of file
+    seen = _seen_ids(key)
+    for entry in entries:
+        seen.pop(entry.get('client_id'), None)
@@ -2,30 +2,154 @@ import React, { useState, useRef, useEffect } from 'react';
 import { Streamlit, withStreamlitConnection } from 'streamlit-component-lib';
 import './circle_diagram.css';
 
-const CircleDiagram = () => {
+// Used when Streamlit does not pass a defect_types list
+const DEFAULT_DEFECT_TYPES = [
+  "Drop in Mold", "Stains", "Marking NOK", "Burns", "Crush", "Other",
+  "Lack of Materials", "Mismatch", "Pilot Crush", "Drum Thickness",
+  "Cracks", "Short Pours", "Stickers", "Damage", "Core Set",
+  "Inclusion (sand)", "Heavy Dry Core", "Pinholes"
+];
+
+// Inner and outer radius of each ring, matching getClickZone
+const RING_RADII = {
+  Center: [0, 25],
+  CenterRing: [25, 35],
+  Inner: [35, 140],
+  Middle: [140, 170],
+  Outer: [170, 230],
+  Border: [230, 240],
+  Outside: [240, 250]
+};
+
+// Submitted entries wait in localStorage until the server acknowledges
+// their client_id, so a stalled websocket or a page reload doesn't lose them
+const OUTBOX_KEY = 'circle_diagram_outbox';
+const FLUSH_DELAY_MS = 300;     // entries submitted this close together go in one rerun
+const RETRY_MS = 15000;         // resend entries still unacknowledged after this long
+const MAX_FLUSH = 200;          // entries per flush
+
+const newClientId = () => (window.crypto && window.crypto.randomUUID)
+  ? window.crypto.randomUUID()
+  // randomUUID needs a secure context; plain http on the shop-floor LAN doesn't have one
+  : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+
+const loadOutbox = () => {
+  try {
+    return JSON.parse(window.localStorage.getItem(OUTBOX_KEY)) || [];
+  } catch (e) {
+    return [];
+  }
+};
+
+const saveOutbox = (outbox) => {
+  try {
+    if (outbox.length) {
+      window.localStorage.setItem(OUTBOX_KEY, JSON.stringify(outbox));
+    } else {
+      window.localStorage.removeItem(OUTBOX_KEY);
+    }
+  } catch (e) {
+    // Storage full or disabled: the entries still live in memory until acknowledged
+  }
+};
+
+const CircleDiagram = ({ args }) => {
   const canvasRef = useRef(null);
   const [clickCount, setClickCount] = useState(0);
   const [showOptionModal, setShowOptionModal] = useState(false);
   const [showDefectModal, setShowDefectModal] = useState(false);
   const [showCavityModal, setShowCavityModal] = useState(false);
   const [pendingClick, setPendingClick] = useState(null);
+  const [pendingPoints, setPendingPoints] = useState([]);
+  const [multiPoint, setMultiPoint] = useState(false);
+  const [markedPoints, setMarkedPoints] = useState([]);
   const [selectedOption, setSelectedOption] = useState('');
   const [selectedDefect, setSelectedDefect] = useState('');
   const [cavity, setCavity] = useState('');
   const [lastClick, setLastClick] = useState('');
+  const outboxRef = useRef(null);
+  if (outboxRef.current === null) {
+    outboxRef.current = loadOutbox();
+  }
+  const flushTimerRef = useRef(null);
+  const [unsentCount, setUnsentCount] = useState(outboxRef.current.length);
+
+  // Defect types come from the PA_DefectTypes catalog
+  const defectTypes = (args && args.defect_types && args.defect_types.length)
+    ? args.defect_types
+    : DEFAULT_DEFECT_TYPES;
+
+  // Segment x ring counts for the heatmap overlay (null = no overlay)
+  const heatmap = (args && args.heatmap) || null;
+  const heatmapKey = JSON.stringify(heatmap);
+
+  // client_ids the server has taken; they are dropped from the outbox
+  const acked = (args && args.acked) || [];
+  const ackedKey = acked.join(',');
+
+  const updateOutbox = (outbox) => {
+    outboxRef.current = outbox;
+    saveOutbox(outbox);
+    setUnsentCount(outbox.length);
+  };
 
-  const defectTypes = [
-    "Drop in Mold", "Stains", "Marking NOK", "Burns", "Crush", "Other",
-    "Lack of Materials", "Mismatch", "Pilot Crush", "Drum Thickness",
-    "Cracks", "Short Pours", "Stickers", "Damage", "Core Set",
-    "Inclusion (sand)", "Heavy Dry Core", "Pinholes"
-  ];
+  // Send every entry not sent within RETRY_MS (or every entry, if resend) in one
+  // setComponentValue, so the whole batch costs one rerun
+  const flushOutbox = (resend = false) => {
+    clearTimeout(flushTimerRef.current);
+    flushTimerRef.current = null;
+    const now = Date.now();
+    const due = outboxRef.current.filter(entry => resend || !entry.sent_at || now - entry.sent_at >= RETRY_MS);
+    if (due.length === 0) return;
+    const batch = due.slice(0, MAX_FLUSH);
+    const sending = new Set(batch.map(entry => entry.client_id));
+    updateOutbox(outboxRef.current.map(entry => sending.has(entry.client_id) ? { ...entry, sent_at: now } : entry));
+    Streamlit.setComponentValue({ flushed_at: now, entries: batch.map(({ sent_at, ...entry }) => entry) });
+  };
+
+  const scheduleFlush = () => {
+    if (flushTimerRef.current === null) {
+      flushTimerRef.current = setTimeout(flushOutbox, FLUSH_DELAY_MS);
+    }
+  };
 
   useEffect(() => {
     drawDiagram();
     Streamlit.setFrameHeight(800);
+    // Entries left over from before a reload are sent again; the server drops repeats
+    if (outboxRef.current.length) {
+      updateOutbox(outboxRef.current.map(({ sent_at, ...entry }) => entry));
+      scheduleFlush();
+    }
+    const retry = setInterval(() => flushOutbox(), RETRY_MS);
+    // Whatever was sent while the network was down may never have arrived
+    const resendAll = () => flushOutbox(true);
+    window.addEventListener('online', resendAll);
+    return () => {
+      clearInterval(retry);
+      clearTimeout(flushTimerRef.current);
+      window.removeEventListener('online', resendAll);
+    };
   }, []);
 
+  useEffect(() => {
+    if (acked.length === 0) return;
+    const done = new Set(acked);
+    const outbox = outboxRef.current.filter(entry => !done.has(entry.client_id));
+    if (outbox.length !== outboxRef.current.length) {
+      updateOutbox(outbox);
+    }
+  }, [ackedKey]);
+
+  useEffect(() => {
+    drawDiagram();
+    // Keep any points marked before the overlay changed
+    markedPoints.forEach((point, idx) => {
+      const radians = point.angle * Math.PI / 180;
+      drawMarker(250 + point.distance * Math.sin(radians), 250 - point.distance * Math.cos(radians), String(idx + 1));
+    });
+  }, [heatmapKey]);
+
   const drawDiagram = () => {
     const canvas = canvasRef.current;
     if (!canvas) return;
@@ -101,6 +225,27 @@ const CircleDiagram = () => {
       const y = centerY + 200 * Math.sin(angle);
       ctx.fillText(i.toString(), x, y);
     }
+
+    if (heatmap && heatmap.max > 0) {
+      drawHeatmap(ctx, centerX, centerY);
+    }
+  };
+
+  const drawHeatmap = (ctx, centerX, centerY) => {
+    heatmap.cells.forEach((ringCounts, segmentIdx) => {
+      const startAngle = (segmentIdx * 30 - 90) * Math.PI / 180;
+      const endAngle = ((segmentIdx + 1) * 30 - 90) * Math.PI / 180;
+      ringCounts.forEach((count, ringIdx) => {
+        const radii = RING_RADII[heatmap.rings[ringIdx]];
+        if (!count || !radii) return;
+        ctx.beginPath();
+        ctx.arc(centerX, centerY, radii[1], startAngle, endAngle);
+        ctx.arc(centerX, centerY, radii[0], endAngle, startAngle, true);
+        ctx.closePath();
+        ctx.fillStyle = `rgba(220, 38, 38, ${0.15 + 0.7 * count / heatmap.max})`;
+        ctx.fill();
+      });
+    });
   };
 
   const getClickZone = (x, y) => {
@@ -133,6 +278,24 @@ const CircleDiagram = () => {
     };
   };
 
+  const drawMarker = (x, y, label) => {
+    const ctx = canvasRef.current.getContext('2d');
+    ctx.beginPath();
+    ctx.arc(x, y, label ? 8 : 5, 0, 2 * Math.PI);
+    ctx.fillStyle = 'rgba(255, 0, 0, 0.7)';
+    ctx.fill();
+    ctx.strokeStyle = '#FFFFFF';
+    ctx.lineWidth = 2;
+    ctx.stroke();
+    if (label) {
+      ctx.fillStyle = '#FFFFFF';
+      ctx.font = 'bold 10px Arial';
+      ctx.textAlign = 'center';
+      ctx.textBaseline = 'middle';
+      ctx.fillText(label, x, y);
+    }
+  };
+
   const handleCanvasClick = (e) => {
     const canvas = canvasRef.current;
     const rect = canvas.getBoundingClientRect();
@@ -142,17 +305,35 @@ const CircleDiagram = () => {
     const y = (e.clientY - rect.top) * scaleY;
 
     const clickData = getClickZone(x, y);
+
+    if (multiPoint) {
+      // Collect points; option, defect and cavity are chosen once for the whole cluster
+      drawMarker(x, y, String(markedPoints.length + 1));
+      setMarkedPoints(prev => [...prev, clickData]);
+      return;
+    }
+
     setPendingClick(clickData);
+    setPendingPoints([clickData]);
     setShowOptionModal(true);
+    drawMarker(x, y);
+  };
 
-    const ctx = canvas.getContext('2d');
-    ctx.beginPath();
-    ctx.arc(x, y, 5, 0, 2 * Math.PI);
-    ctx.fillStyle = 'rgba(255, 0, 0, 0.7)';
-    ctx.fill();
-    ctx.strokeStyle = '#FFFFFF';
-    ctx.lineWidth = 2;
-    ctx.stroke();
+  const handleLogMarkedPoints = () => {
+    if (markedPoints.length === 0) return;
+    setPendingClick(markedPoints[0]);
+    setPendingPoints(markedPoints);
+    setShowOptionModal(true);
+  };
+
+  const clearMarkedPoints = () => {
+    setMarkedPoints([]);
+    drawDiagram();
+  };
+
+  const toggleMultiPoint = () => {
+    clearMarkedPoints();
+    setMultiPoint(prev => !prev);
   };
 
   const handleOptionSelect = (option) => {
@@ -173,29 +354,47 @@ const CircleDiagram = () => {
       return;
     }
 
-    const finalData = {
-      ...pendingClick,
+    // Queued rather than sent straight away, so a quick run of submissions
+    // (or a backlog after a Wi-Fi drop) costs one rerun and one commit
+    const entries = pendingPoints.map(point => ({
+      ...point,
       option: selectedOption,
       defect: selectedDefect,
-      cavity: cavity.trim()
-    };
+      cavity: cavity.trim(),
+      client_id: newClientId()
+    }));
 
-    Streamlit.setComponentValue(finalData);
+    updateOutbox([...outboxRef.current, ...entries]);
+    scheduleFlush();
 
-    setLastClick(`Segment ${finalData.segment} | ${finalData.ring} | ${selectedOption} | ${selectedDefect} | Cavity: ${cavity}`);
-    setClickCount(prev => prev + 1);
+    const first = entries[0];
+    setLastClick(entries.length === 1
+      ? `Segment ${first.segment} | ${first.ring} | ${selectedOption} | ${selectedDefect} | Cavity: ${cavity}`
+      : `${entries.length} points | ${selectedOption} | ${selectedDefect} | Cavity: ${cavity}`);
+    setClickCount(prev => prev + entries.length);
 
     setShowCavityModal(false);
     setCavity('');
     setPendingClick(null);
+    setPendingPoints([]);
     setSelectedOption('');
     setSelectedDefect('');
+    if (multiPoint) {
+      clearMarkedPoints();
+    }
   };
 
+  const pointSummary = pendingPoints.length > 1
+    ? <p><strong>Points:</strong> {pendingPoints.length} (segments {pendingPoints.map(point => point.segment).join(', ')})</p>
+    : <p><strong>Segment:</strong> {pendingClick?.segment} | <strong>Ring:</strong> {pendingClick?.ring}</p>;
+
   return (
     <div className="circle-diagram-container">
       <div className="canvas-wrapper">
-        <div className="click-counter">Clicks: {clickCount}</div>
+        <div className="click-counter">
+          Clicks: {clickCount}
+          {unsentCount > 0 && <div className="unsent-count">Unsent: {unsentCount}</div>}
+        </div>
         <canvas
           ref={canvasRef}
           width={500}
@@ -205,6 +404,20 @@ const CircleDiagram = () => {
         />
       </div>
 
+      <div className="multi-point-bar">
+        <button className="modal-btn" onClick={toggleMultiPoint}>
+          {multiPoint ? 'Multi-point: ON' : 'Multi-point: OFF'}
+        </button>
+        {multiPoint && (
+          <>
+            <button className="modal-btn btn-submit" disabled={markedPoints.length === 0} onClick={handleLogMarkedPoints}>
+              Log {markedPoints.length} point{markedPoints.length === 1 ? '' : 's'}
+            </button>
+            <button className="modal-btn" disabled={markedPoints.length === 0} onClick={clearMarkedPoints}>Clear</button>
+          </>
+        )}
+      </div>
+
       <div className="info-box">
         {lastClick ? (
           <div className="data-point"><strong>Last Click:</strong> {lastClick}</div>
@@ -218,10 +431,14 @@ const CircleDiagram = () => {
           <div className="modal-content" onClick={(e) => e.stopPropagation()}>
             <h2>Step 1: Select Option</h2>
             <div className="modal-info">
-              <p><strong>Segment:</strong> {pendingClick.segment}</p>
-              <p><strong>Ring:</strong> {pendingClick.ring}</p>
-              <p><strong>Angle:</strong> {pendingClick.angle}°</p>
-              <p><strong>Distance:</strong> {pendingClick.distance} px</p>
+              {pendingPoints.length > 1 ? pointSummary : (
+                <>
+                  <p><strong>Segment:</strong> {pendingClick.segment}</p>
+                  <p><strong>Ring:</strong> {pendingClick.ring}</p>
+                  <p><strong>Angle:</strong> {pendingClick.angle}°</p>
+                  <p><strong>Distance:</strong> {pendingClick.distance} px</p>
+                </>
+              )}
             </div>
             <p style={{fontWeight: 'bold', marginBottom: '10px'}}>Choose an option:</p>
             <div className="modal-buttons">
@@ -238,7 +455,7 @@ const CircleDiagram = () => {
             <h2>Step 2: Select Defect Type</h2>
             <div className="selected-option">Selected: {selectedOption}</div>
             <div className="modal-info">
-              <p><strong>Segment:</strong> {pendingClick?.segment} | <strong>Ring:</strong> {pendingClick?.ring}</p>
+              {pointSummary}
             </div>
             <p style={{fontWeight: 'bold', marginBottom: '5px'}}>Click a defect type:</p>
             <div className="defect-grid">
@@ -256,7 +473,7 @@ const CircleDiagram = () => {
             <h2>Step 3: Enter Casting Cavity</h2>
             <div className="selected-option">{selectedOption} | {selectedDefect}</div>
             <div className="modal-info">
-              <p><strong>Segment:</strong> {pendingClick?.segment} | <strong>Ring:</strong> {pendingClick?.ring}</p>
+              {pointSummary}
             </div>
             <div style={{margin: '20px 0'}}>
               <label style={{display: 'block', marginBottom: '10px', fontWeight: 'bold', color: '#000'}}>Casting Cavity:</label>
@@ -0,0 +1,169 @@
+"""
+Columnar Defect Reader
+Loads defects straight into typed pandas columns - catalog columns as
+categoricals built from their IDs, text as Arrow-backed strings, numbers
+as nullable integers - without going through object-dtype rows first
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from database_sqlite import (
+    CATALOGS,
+    DATA_FILTER_CONDITIONS,
+    DATA_TABLE,
+    DEFECT_COLUMNS,
+    INTEGER_COLUMNS,
+    build_filter_clause,
+    get_manager,
+    query_cache,
+)
+from metrics import timed
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "string"
+
+DEFAULT_CHUNK_SIZE = 10000      # rows fetched from SQLite at a time
+
+
+def _category_lookup(conn, column):
+    """(codes by catalog ID, category names) for a catalog column"""
+    table, _ = CATALOGS[column]
+    rows = conn.execute(f"SELECT ID, Name FROM {table} ORDER BY ID").fetchall()
+    # Index 0 and unknown IDs map to code -1 (missing)
+    codes = np.full(max((row[0] for row in rows), default=0) + 1, -1, dtype=np.int32)
+    codes[[row[0] for row in rows]] = np.arange(len(rows), dtype=np.int32)
+    return codes, [row[1] for row in rows]
+
+
+def _convert_chunk(column, values, lookups):
+    """One chunk of one column, as the array type it is finally assembled from"""
+    if column in lookups:
+        ids = np.fromiter((value or 0 for value in values), dtype=np.int64, count=len(values))
+        return lookups[column][0][ids]
+    if column in INTEGER_COLUMNS:
+        mask = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        data = np.fromiter((0 if value is None else value for value in values), dtype=np.int64, count=len(values))
+        return data, mask
+    return pd.array(values, dtype=STRING_DTYPE)
+
+
+def _assemble(column, chunks, lookups):
+    if column in lookups:
+        codes = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int32)
+        return pd.Categorical.from_codes(codes, lookups[column][1])
+    if column in INTEGER_COLUMNS:
+        if not chunks:
+            return pd.array([], dtype="Int64")
+        return pd.arrays.IntegerArray(
+            np.concatenate([data for data, _ in chunks]),
+            np.concatenate([mask for _, mask in chunks])
+        )
+    if not chunks:
+        return pd.array([], dtype=STRING_DTYPE)
+    return pd.concat([pd.Series(chunk) for chunk in chunks], ignore_index=True).array
+
+
+def concat_defects_frames(frames):
+    """
+    Stack frames from read_defects_frame, keeping the column types
+    
+    pd.concat turns categoricals into object columns when their categories
+    differ, as they do once a catalog has grown between two reads; here
+    the categories are united instead.
+    """
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    return pd.DataFrame({
+        column: union_categoricals([frame[column] for frame in frames])
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype)
+        else pd.concat([frame[column] for frame in frames], ignore_index=True).array
+        for column in frames[0].columns
+    })
+
+
+@timed()
+def read_defects_frame(filters=None, before_id=None, limit=None, columns=None, after_id=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, mmap_size=None, db_file=None):
+    """
+    Read the defects matching the log viewer filters into a typed DataFrame, newest first
+    
+    Product, Scrap, Core_Clock and Location are read as catalog IDs and
+    become categoricals without their names being fetched per row. Rows
+    are pulled chunk_size at a time and converted column by column, so the
+    Python objects of at most one chunk are alive at once. Frames that fit
+    the shared query cache are kept there until the next write; callers
+    get a copy.
+    
+    Args:
+        filters (dict): Log viewer filters (see FILTER_CONDITIONS)
+        before_id (int): Only return rows with ID below this (keyset pagination)
+        limit (int): Maximum rows to return (None = all)
+        columns (list): Columns to load (default DEFECT_COLUMNS)
+        after_id (int): Only return rows with ID above this (live tail)
+        chunk_size (int): Rows fetched from SQLite at a time
+        mmap_size (int): If set, PRAGMA mmap_size for the duration of the read,
+            so SQLite reads pages from a memory map instead of copying them
+        db_file (str): SQLite database (default: the configured one)
+    
+    Returns:
+        pandas.DataFrame: One column per requested column, in order
+    """
+    columns = list(columns or DEFECT_COLUMNS)
+    unknown = [column for column in columns if column not in DEFECT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    
+    where, params = build_filter_clause(filters, DATA_FILTER_CONDITIONS)
+    if before_id is not None:
+        where = f"{where} AND ID < ?" if where else "WHERE ID < ?"
+        params.append(before_id)
+    if after_id is not None:
+        where = f"{where} AND ID > ?" if where else "WHERE ID > ?"
+        params.append(after_id)
+    select = ", ".join(CATALOGS[column][1] if column in CATALOGS else column for column in columns)
+    sql = f"SELECT {select} FROM {DATA_TABLE} {where} ORDER BY ID DESC LIMIT ?"
+    params.append(-1 if limit is None else limit)
+    
+    manager = get_manager(db_file)
+    key = ('frame', os.path.abspath(manager.db_file), sql, tuple(params), tuple(columns))
+    generation = manager.generation
+    df = query_cache.get(key, generation)
+    if df is not None:
+        return df.copy()
+    
+    conn = manager.connection()
+    previous_mmap_size = None
+    if mmap_size is not None:
+        previous_mmap_size = conn.execute("PRAGMA mmap_size").fetchone()[0]
+        conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    try:
+        chunks = {column: [] for column in columns}
+        # One snapshot, so every ID read has its name in the catalogs read
+        with manager.transaction() as conn:
+            lookups = {column: _category_lookup(conn, column) for column in columns if column in CATALOGS}
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for column, values in zip(columns, zip(*rows)):
+                        chunks[column].append(_convert_chunk(column, values, lookups))
+                    del rows
+            finally:
+                cursor.close()
+    finally:
+        if previous_mmap_size is not None:
+            conn.execute(f"PRAGMA mmap_size = {int(previous_mmap_size)}")
+    
+    df = pd.DataFrame({column: _assemble(column, chunks.pop(column), lookups) for column in columns})
+    if query_cache.put(key, generation, df, int(df.memory_usage(deep=True).sum())):
+        return df.copy()
+    return df
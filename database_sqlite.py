@@ -2,229 +2,2425 @@
 SQLite Database Module for Temporary Local Logging
 This stores data locally until SQL Server permissions are ready
 """
+import atexit
+import csv
+import itertools
 import sqlite3
 import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
-# Database file location
+from metrics import metrics, timed
+from settings import get_setting
+from shared_state import FileLock, SharedCounter, state_file
+
+# Database file location (relative to the working directory unless SCRAP_DB_FILE says otherwise)
 DB_FILE = "defect_logs.db"
+DB_FILE_ENV = "SCRAP_DB_FILE"
 
+# Set when several server processes share the database (see ConnectionManager)
+MULTI_PROCESS_ENV = "SCRAP_MULTI_PROCESS"
 
-class SQLiteConnection:
-    """SQLite database connection for local logging"""
+# Pragmas applied to every connection handed out by the connection manager.
+# Set one for every process with SCRAP_PRAGMA_<NAME> (e.g. SCRAP_PRAGMA_BUSY_TIMEOUT),
+# or per process with configure(pragmas={...}); a value of None skips the pragma.
+PRAGMA_ENV = "SCRAP_PRAGMA_{}"
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,        # ms to wait on a locked database before SQLITE_BUSY
+    'journal_mode': 'WAL',       # readers don't block the writer
+    'synchronous': 'NORMAL',     # fsync at checkpoints only (safe with WAL)
+    'cache_size': -8000,         # negative = KiB, ~8 MB page cache per connection
+    'mmap_size': 0,              # bytes of the file to memory-map (0 = disabled)
+}
+
+# Retry policy for write transactions that still hit SQLITE_BUSY after busy_timeout
+DEFAULT_WRITE_RETRIES = 5
+DEFAULT_RETRY_BACKOFF = 0.05       # seconds, doubled on every attempt
+DEFAULT_RETRY_BACKOFF_MAX = 1.0
+WRITE_RETRIES_ENV = "SCRAP_WRITE_RETRIES"
+
+# Memory cap of the shared query result cache (see QueryCache)
+DEFAULT_QUERY_CACHE_BYTES = 64 * 1024 * 1024
+QUERY_CACHE_MB_ENV = "SCRAP_QUERY_CACHE_MB"
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS PA_InternalScrap (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    TEST_ID INTEGER,
+    Entry_Date TEXT,
+    Batch_Number TEXT,
+    Date_Code TEXT,
+    Product TEXT,
+    Scrap TEXT,
+    Quantity INTEGER,
+    Signature TEXT,
+    Notes TEXT,
+    Casting_Clock INTEGER,
+    Pinhole_Level INTEGER,
+    Exact_Time TEXT,
+    Casting_Cavity_Number TEXT,
+    Core_Cavity_Number TEXT,
+    Core_Clock TEXT,
+    Shift_Class INTEGER,
+    Location TEXT,
+    Created_At TEXT DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Running totals maintained by triggers, so counts never scan PA_InternalScrap.
+# Dimension is 'total' (Key ''), 'day' (Entry_Date), 'product' or 'scrap'.
+COUNTER_DIMENSIONS = ('day', 'product', 'scrap')
+
+COUNTER_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS PA_InternalScrap_Counters (
+        Dimension TEXT NOT NULL,
+        Key TEXT NOT NULL,
+        Total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Dimension, Key)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Count_Insert
+    AFTER INSERT ON PA_InternalScrap
+    BEGIN
+        INSERT INTO PA_InternalScrap_Counters (Dimension, Key, Total) VALUES
+            ('total', '', 1),
+            ('day', COALESCE(NEW.Entry_Date, ''), 1),
+            ('product', COALESCE(NEW.Product, ''), 1),
+            ('scrap', COALESCE(NEW.Scrap, ''), 1)
+        ON CONFLICT (Dimension, Key) DO UPDATE SET Total = Total + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Count_Delete
+    AFTER DELETE ON PA_InternalScrap
+    BEGIN
+        UPDATE PA_InternalScrap_Counters SET Total = Total - 1
+        WHERE (Dimension = 'total' AND Key = '')
+           OR (Dimension = 'day' AND Key = COALESCE(OLD.Entry_Date, ''))
+           OR (Dimension = 'product' AND Key = COALESCE(OLD.Product, ''))
+           OR (Dimension = 'scrap' AND Key = COALESCE(OLD.Scrap, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Count_Update
+    AFTER UPDATE OF Entry_Date, Product, Scrap ON PA_InternalScrap
+    BEGIN
+        UPDATE PA_InternalScrap_Counters SET Total = Total - 1
+        WHERE (Dimension = 'day' AND Key = COALESCE(OLD.Entry_Date, ''))
+           OR (Dimension = 'product' AND Key = COALESCE(OLD.Product, ''))
+           OR (Dimension = 'scrap' AND Key = COALESCE(OLD.Scrap, ''));
+        INSERT INTO PA_InternalScrap_Counters (Dimension, Key, Total) VALUES
+            ('day', COALESCE(NEW.Entry_Date, ''), 1),
+            ('product', COALESCE(NEW.Product, ''), 1),
+            ('scrap', COALESCE(NEW.Scrap, ''), 1)
+        ON CONFLICT (Dimension, Key) DO UPDATE SET Total = Total + 1;
+    END
+    """,
+]
+
+# Secondary indexes for the log viewer filters. Single-column indexes also
+# serve "filter + ORDER BY ID" because SQLite appends the rowid to every index.
+INDEX_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Entry_Date_Product ON PA_InternalScrap (Entry_Date, Product)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Batch_Number_Scrap ON PA_InternalScrap (Batch_Number, Scrap)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Product ON PA_InternalScrap (Product)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Scrap ON PA_InternalScrap (Scrap)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Location ON PA_InternalScrap (Location)",
+]
+
+# High-water marks of incremental exports, one row per export target
+EXPORT_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS PA_ExportState (
+    Target TEXT PRIMARY KEY,
+    Last_ID INTEGER NOT NULL,
+    Exported_At TEXT
+)
+"""
+
+# Outbox of rows waiting to be pushed to the remote database by sync_engine.
+# Every insert queues its ID; the sync worker marks rows synced or schedules a retry.
+OUTBOX_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS PA_SyncOutbox (
+        ID INTEGER PRIMARY KEY,
+        Status TEXT NOT NULL DEFAULT 'pending',
+        Attempts INTEGER NOT NULL DEFAULT 0,
+        Next_Attempt_At REAL NOT NULL DEFAULT 0,
+        Last_Error TEXT,
+        Synced_At TEXT
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS IX_PA_SyncOutbox_Pending
+    ON PA_SyncOutbox (Next_Attempt_At) WHERE Status = 'pending'
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Outbox_Insert
+    AFTER INSERT ON PA_InternalScrap
+    BEGIN
+        INSERT OR IGNORE INTO PA_SyncOutbox (ID) VALUES (NEW.ID);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Outbox_Delete
+    AFTER DELETE ON PA_InternalScrap
+    BEGIN
+        DELETE FROM PA_SyncOutbox WHERE ID = OLD.ID;
+    END
+    """,
+    "INSERT OR IGNORE INTO PA_SyncOutbox (ID) SELECT ID FROM PA_InternalScrap",
+]
+
+# Lookup catalogs for the repeated text columns. Defect rows live in
+# PA_InternalScrap_Data and store small integer IDs; PA_InternalScrap becomes
+# a view that joins the names back in under the original column names.
+# Column -> (catalog table, ID column on PA_InternalScrap_Data)
+DATA_TABLE = "PA_InternalScrap_Data"
+CATALOGS = {
+    'Product': ('PA_Products', 'Product_ID'),
+    'Scrap': ('PA_DefectTypes', 'Scrap_ID'),
+    'Core_Clock': ('PA_Rings', 'Ring_ID'),
+    'Location': ('PA_Locations', 'Location_ID'),
+}
+
+# Names every database starts with; anything else is added on first use
+DEFECT_TYPES = (
+    "Drop in Mold", "Stains", "Marking NOK", "Burns", "Crush", "Other",
+    "Lack of Materials", "Mismatch", "Pilot Crush", "Drum Thickness",
+    "Cracks", "Short Pours", "Stickers", "Damage", "Core Set",
+    "Inclusion (sand)", "Heavy Dry Core", "Pinholes",
+)
+RINGS = ("Center", "CenterRing", "Inner", "Middle", "Outer", "Border", "Outside")
+LOCATIONS = ("Inboard", "Outboard")
+CATALOG_SEEDS = {
+    'Scrap': DEFECT_TYPES,
+    'Core_Clock': RINGS,
+    'Location': LOCATIONS,
+}
+
+# Every column of PA_InternalScrap, in its original order
+DEFECT_COLUMNS = (
+    "ID", "TEST_ID", "Entry_Date", "Batch_Number", "Date_Code", "Product", "Scrap", "Quantity",
+    "Signature", "Notes", "Casting_Clock", "Pinhole_Level", "Exact_Time", "Casting_Cavity_Number",
+    "Core_Cavity_Number", "Core_Clock", "Shift_Class", "Location", "Created_At",
+)
+
+# The columns declared INTEGER; the rest hold text
+INTEGER_COLUMNS = ("ID", "TEST_ID", "Quantity", "Casting_Clock", "Pinhole_Level", "Shift_Class")
+
+DATA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS PA_InternalScrap_Data (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    TEST_ID INTEGER,
+    Entry_Date TEXT,
+    Batch_Number TEXT,
+    Date_Code TEXT,
+    Product_ID INTEGER REFERENCES PA_Products (ID),
+    Scrap_ID INTEGER REFERENCES PA_DefectTypes (ID),
+    Quantity INTEGER,
+    Signature TEXT,
+    Notes TEXT,
+    Casting_Clock INTEGER,
+    Pinhole_Level INTEGER,
+    Exact_Time TEXT,
+    Casting_Cavity_Number TEXT,
+    Core_Cavity_Number TEXT,
+    Ring_ID INTEGER REFERENCES PA_Rings (ID),
+    Shift_Class INTEGER,
+    Location_ID INTEGER REFERENCES PA_Locations (ID),
+    Created_At TEXT DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def _catalog_name(column, row_ref):
+    """SQL expression looking up the catalog name for row_ref's ID column"""
+    table, id_column = CATALOGS[column]
+    return f"(SELECT Name FROM {table} WHERE ID = {row_ref}.{id_column})"
+
+
+def _catalog_id(column, name_sql):
+    """SQL expression looking up the catalog ID for a name"""
+    table, id_column = CATALOGS[column]
+    return f"(SELECT ID FROM {table} WHERE Name = {name_sql})"
+
+
+DEFECT_VIEW_SQL = (
+    "CREATE VIEW IF NOT EXISTS PA_InternalScrap AS\nSELECT\n    "
+    + ",\n    ".join(
+        f"{CATALOGS[column][0]}.Name AS {column}" if column in CATALOGS else f"{DATA_TABLE}.{column}"
+        for column in DEFECT_COLUMNS
+    )
+    + f"\nFROM {DATA_TABLE}\n"
+    + "\n".join(
+        f"LEFT JOIN {table} ON {table}.ID = {DATA_TABLE}.{id_column}"
+        for table, id_column in CATALOGS.values()
+    )
+)
+
+CATALOG_SCHEMA = [
+    f"CREATE TABLE IF NOT EXISTS {table} (ID INTEGER PRIMARY KEY, Name TEXT NOT NULL UNIQUE)"
+    for table, _ in CATALOGS.values()
+]
+
+# Edits through the view: names are mapped back to catalog IDs (new names
+# are added to their catalog), and the row keeps its ID
+VIEW_UPDATE_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_View_Update
+    INSTEAD OF UPDATE ON PA_InternalScrap
+    BEGIN
+        {" ".join(
+            f"INSERT OR IGNORE INTO {table} (Name) SELECT NEW.{column} WHERE NEW.{column} IS NOT NULL;"
+            for column, (table, _) in CATALOGS.items()
+        )}
+        UPDATE PA_InternalScrap_Data SET {", ".join(
+            f"{CATALOGS[column][1]} = {_catalog_id(column, f'NEW.{column}')}" if column in CATALOGS
+            else f"{column} = NEW.{column}"
+            for column in DEFECT_COLUMNS if column != "ID"
+        )}
+        WHERE ID = OLD.ID;
+    END
+    """
+
+# Counter and outbox triggers, moved from PA_InternalScrap onto the data
+# table, and INSTEAD OF triggers so the view still accepts inserts, updates
+# and deletes
+DATA_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Count_Insert
+    AFTER INSERT ON PA_InternalScrap_Data
+    BEGIN
+        INSERT INTO PA_InternalScrap_Counters (Dimension, Key, Total) VALUES
+            ('total', '', 1),
+            ('day', COALESCE(NEW.Entry_Date, ''), 1),
+            ('product', COALESCE({_catalog_name('Product', 'NEW')}, ''), 1),
+            ('scrap', COALESCE({_catalog_name('Scrap', 'NEW')}, ''), 1)
+        ON CONFLICT (Dimension, Key) DO UPDATE SET Total = Total + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Count_Delete
+    AFTER DELETE ON PA_InternalScrap_Data
+    BEGIN
+        UPDATE PA_InternalScrap_Counters SET Total = Total - 1
+        WHERE (Dimension = 'total' AND Key = '')
+           OR (Dimension = 'day' AND Key = COALESCE(OLD.Entry_Date, ''))
+           OR (Dimension = 'product' AND Key = COALESCE({_catalog_name('Product', 'OLD')}, ''))
+           OR (Dimension = 'scrap' AND Key = COALESCE({_catalog_name('Scrap', 'OLD')}, ''));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Count_Update
+    AFTER UPDATE OF Entry_Date, Product_ID, Scrap_ID ON PA_InternalScrap_Data
+    BEGIN
+        UPDATE PA_InternalScrap_Counters SET Total = Total - 1
+        WHERE (Dimension = 'day' AND Key = COALESCE(OLD.Entry_Date, ''))
+           OR (Dimension = 'product' AND Key = COALESCE({_catalog_name('Product', 'OLD')}, ''))
+           OR (Dimension = 'scrap' AND Key = COALESCE({_catalog_name('Scrap', 'OLD')}, ''));
+        INSERT INTO PA_InternalScrap_Counters (Dimension, Key, Total) VALUES
+            ('day', COALESCE(NEW.Entry_Date, ''), 1),
+            ('product', COALESCE({_catalog_name('Product', 'NEW')}, ''), 1),
+            ('scrap', COALESCE({_catalog_name('Scrap', 'NEW')}, ''), 1)
+        ON CONFLICT (Dimension, Key) DO UPDATE SET Total = Total + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Outbox_Insert
+    AFTER INSERT ON PA_InternalScrap_Data
+    BEGIN
+        INSERT OR IGNORE INTO PA_SyncOutbox (ID) VALUES (NEW.ID);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Outbox_Delete
+    AFTER DELETE ON PA_InternalScrap_Data
+    BEGIN
+        DELETE FROM PA_SyncOutbox WHERE ID = OLD.ID;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_View_Insert
+    INSTEAD OF INSERT ON PA_InternalScrap
+    BEGIN
+        {" ".join(
+            f"INSERT OR IGNORE INTO {table} (Name) SELECT NEW.{column} WHERE NEW.{column} IS NOT NULL;"
+            for column, (table, _) in CATALOGS.items()
+        )}
+        INSERT INTO PA_InternalScrap_Data ({", ".join(
+            CATALOGS[column][1] if column in CATALOGS else column for column in DEFECT_COLUMNS
+        )})
+        VALUES ({", ".join(
+            _catalog_id(column, f"NEW.{column}") if column in CATALOGS
+            else "COALESCE(NEW.Created_At, CURRENT_TIMESTAMP)" if column == "Created_At"
+            else f"NEW.{column}"
+            for column in DEFECT_COLUMNS
+        )});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_View_Delete
+    INSTEAD OF DELETE ON PA_InternalScrap
+    BEGIN
+        DELETE FROM PA_InternalScrap_Data WHERE ID = OLD.ID;
+    END
+    """,
+    VIEW_UPDATE_TRIGGER,
+]
+
+# The log viewer indexes, rebuilt on the ID columns
+DATA_INDEX_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Data_Entry_Date_Product ON PA_InternalScrap_Data (Entry_Date, Product_ID)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Data_Batch_Number_Scrap ON PA_InternalScrap_Data (Batch_Number, Scrap_ID)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Data_Product ON PA_InternalScrap_Data (Product_ID)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Data_Scrap ON PA_InternalScrap_Data (Scrap_ID)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Data_Location ON PA_InternalScrap_Data (Location_ID)",
+]
+
+# Hours (local time) at which the three production shifts start
+SHIFT_STARTS = (6, 14, 22)
+
+# Typed copies of the text date columns, for index range scans on time
+# windows: Exact_Epoch is Exact_Time in Unix seconds, Entry_Day is
+# Entry_Date in days since 1970-01-01 and Shift (1-3) is the shift
+# Exact_Time falls in. Filled on insert and backfilled for older rows.
+EXACT_EPOCH_SQL = "CAST(strftime('%s', {ref}) AS INTEGER)"
+ENTRY_DAY_SQL = "CAST(julianday({ref}) - 2440587.5 AS INTEGER)"
+SHIFT_SQL = (
+    "CASE WHEN strftime('%H', {ref}) IS NULL THEN NULL "
+    + " ".join(
+        f"WHEN strftime('%H', {{ref}}, 'localtime') >= '{hour:02d}' THEN {shift}"
+        for shift, hour in sorted(enumerate(SHIFT_STARTS, 1), key=lambda item: -item[1])
+    )
+    + f" ELSE {len(SHIFT_STARTS)} END"
+)
+
+# Pre-aggregated summaries for the analytics page. New rows are folded in by
+# refresh_defect_summaries(), which only reads rows above its watermark in
+# PA_ExportState; triggers correct the totals when an already summarized row
+# is deleted or edited. ID columns use 0 and text keys '' for "none".
+SUMMARY_TARGET = "summaries"
+SUMMARY_WATERMARK = f"(SELECT COALESCE(MAX(Last_ID), 0) FROM PA_ExportState WHERE Target = '{SUMMARY_TARGET}')"
+# (watermark, newest ID): the summaries are behind while the second is larger
+SUMMARY_PENDING_SQL = f"SELECT {SUMMARY_WATERMARK}, (SELECT COALESCE(MAX(ID), 0) FROM {DATA_TABLE})"
+
+SUMMARY_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS PA_Summary_Daily (
+        Entry_Date TEXT NOT NULL,
+        Product_ID INTEGER NOT NULL,
+        Scrap_ID INTEGER NOT NULL,
+        Location_ID INTEGER NOT NULL,
+        Defects INTEGER NOT NULL DEFAULT 0,
+        Quantity INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Entry_Date, Product_ID, Scrap_ID, Location_ID)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS PA_Summary_Batch (
+        Batch_Number TEXT NOT NULL,
+        Product_ID INTEGER NOT NULL,
+        Scrap_ID INTEGER NOT NULL,
+        Defects INTEGER NOT NULL DEFAULT 0,
+        Quantity INTEGER NOT NULL DEFAULT 0,
+        First_Entry_Date TEXT,
+        Last_Entry_Date TEXT,
+        PRIMARY KEY (Batch_Number, Product_ID, Scrap_ID)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS IX_PA_Summary_Batch_Last_Entry_Date ON PA_Summary_Batch (Last_Entry_Date)",
+]
+
+# Defects per Entry_Date, product and shift (from Exact_Time; 0 = unknown)
+SHIFT_SUMMARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS PA_Summary_Shift (
+        Entry_Date TEXT NOT NULL,
+        Product_ID INTEGER NOT NULL,
+        Shift INTEGER NOT NULL,
+        Defects INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Entry_Date, Product_ID, Shift)
+    ) WITHOUT ROWID
+    """
+
+# Summary keys of a data row; ref is NEW or OLD in triggers, a table name otherwise
+_DAILY_KEY = "COALESCE({ref}.Entry_Date, ''), COALESCE({ref}.Product_ID, 0), COALESCE({ref}.Scrap_ID, 0), COALESCE({ref}.Location_ID, 0)"
+_BATCH_KEY = "COALESCE({ref}.Batch_Number, ''), COALESCE({ref}.Product_ID, 0), COALESCE({ref}.Scrap_ID, 0)"
+_SHIFT_KEY = (
+    "COALESCE({ref}.Entry_Date, ''), COALESCE({ref}.Product_ID, 0), "
+    f"COALESCE({SHIFT_SQL.format(ref='{ref}.Exact_Time')}, 0)"
+)
+
+_SUMMARY_REMOVE_OLD = f"""
+        UPDATE PA_Summary_Daily SET Defects = Defects - 1, Quantity = Quantity - COALESCE(OLD.Quantity, 0)
+        WHERE (Entry_Date, Product_ID, Scrap_ID, Location_ID) = ({_DAILY_KEY.format(ref='OLD')});
+        UPDATE PA_Summary_Batch SET Defects = Defects - 1, Quantity = Quantity - COALESCE(OLD.Quantity, 0)
+        WHERE (Batch_Number, Product_ID, Scrap_ID) = ({_BATCH_KEY.format(ref='OLD')});"""
+
+SUMMARY_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Summary_Delete
+    AFTER DELETE ON PA_InternalScrap_Data
+    WHEN OLD.ID <= {SUMMARY_WATERMARK}
+    BEGIN{_SUMMARY_REMOVE_OLD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Summary_Update
+    AFTER UPDATE OF Entry_Date, Batch_Number, Product_ID, Scrap_ID, Location_ID, Quantity ON PA_InternalScrap_Data
+    WHEN OLD.ID <= {SUMMARY_WATERMARK}
+    BEGIN{_SUMMARY_REMOVE_OLD}
+        INSERT INTO PA_Summary_Daily (Entry_Date, Product_ID, Scrap_ID, Location_ID, Defects, Quantity)
+        VALUES ({_DAILY_KEY.format(ref='NEW')}, 1, COALESCE(NEW.Quantity, 0))
+        ON CONFLICT (Entry_Date, Product_ID, Scrap_ID, Location_ID) DO UPDATE SET
+            Defects = Defects + 1, Quantity = Quantity + excluded.Quantity;
+        INSERT INTO PA_Summary_Batch (Batch_Number, Product_ID, Scrap_ID, Defects, Quantity, First_Entry_Date, Last_Entry_Date)
+        VALUES ({_BATCH_KEY.format(ref='NEW')}, 1, COALESCE(NEW.Quantity, 0), NEW.Entry_Date, NEW.Entry_Date)
+        ON CONFLICT (Batch_Number, Product_ID, Scrap_ID) DO UPDATE SET
+            Defects = Defects + 1, Quantity = Quantity + excluded.Quantity,
+            First_Entry_Date = MIN(COALESCE(First_Entry_Date, excluded.First_Entry_Date), COALESCE(excluded.First_Entry_Date, First_Entry_Date)),
+            Last_Entry_Date = MAX(COALESCE(Last_Entry_Date, excluded.Last_Entry_Date), COALESCE(excluded.Last_Entry_Date, Last_Entry_Date));
+    END
+    """,
+]
+
+SHIFT_SUMMARY_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Summary_Shift_Delete
+    AFTER DELETE ON PA_InternalScrap_Data
+    WHEN OLD.ID <= {SUMMARY_WATERMARK}
+    BEGIN
+        UPDATE PA_Summary_Shift SET Defects = Defects - 1
+        WHERE (Entry_Date, Product_ID, Shift) = ({_SHIFT_KEY.format(ref='OLD')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Summary_Shift_Update
+    AFTER UPDATE OF Entry_Date, Product_ID, Exact_Time ON PA_InternalScrap_Data
+    WHEN OLD.ID <= {SUMMARY_WATERMARK}
+    BEGIN
+        UPDATE PA_Summary_Shift SET Defects = Defects - 1
+        WHERE (Entry_Date, Product_ID, Shift) = ({_SHIFT_KEY.format(ref='OLD')});
+        INSERT INTO PA_Summary_Shift (Entry_Date, Product_ID, Shift, Defects)
+        VALUES ({_SHIFT_KEY.format(ref='NEW')}, 1)
+        ON CONFLICT (Entry_Date, Product_ID, Shift) DO UPDATE SET Defects = Defects + 1;
+    END
+    """,
+]
+
+
+def _summary_upserts(rows_condition):
+    """Statements adding the data rows matching rows_condition to the summaries"""
+    return [
+        f"""
+        INSERT INTO PA_Summary_Daily (Entry_Date, Product_ID, Scrap_ID, Location_ID, Defects, Quantity)
+        SELECT {_DAILY_KEY.format(ref=DATA_TABLE)}, COUNT(*), SUM(COALESCE(Quantity, 0))
+        FROM {DATA_TABLE} WHERE {rows_condition}
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (Entry_Date, Product_ID, Scrap_ID, Location_ID) DO UPDATE SET
+            Defects = Defects + excluded.Defects, Quantity = Quantity + excluded.Quantity
+        """,
+        f"""
+        INSERT INTO PA_Summary_Batch (Batch_Number, Product_ID, Scrap_ID, Defects, Quantity, First_Entry_Date, Last_Entry_Date)
+        SELECT {_BATCH_KEY.format(ref=DATA_TABLE)}, COUNT(*), SUM(COALESCE(Quantity, 0)), MIN(Entry_Date), MAX(Entry_Date)
+        FROM {DATA_TABLE} WHERE {rows_condition}
+        GROUP BY 1, 2, 3
+        ON CONFLICT (Batch_Number, Product_ID, Scrap_ID) DO UPDATE SET
+            Defects = Defects + excluded.Defects, Quantity = Quantity + excluded.Quantity,
+            First_Entry_Date = MIN(COALESCE(First_Entry_Date, excluded.First_Entry_Date), COALESCE(excluded.First_Entry_Date, First_Entry_Date)),
+            Last_Entry_Date = MAX(COALESCE(Last_Entry_Date, excluded.Last_Entry_Date), COALESCE(excluded.Last_Entry_Date, Last_Entry_Date))
+        """,
+        f"""
+        INSERT INTO PA_Summary_Shift (Entry_Date, Product_ID, Shift, Defects)
+        SELECT {_SHIFT_KEY.format(ref=DATA_TABLE)}, COUNT(*)
+        FROM {DATA_TABLE} WHERE {rows_condition}
+        GROUP BY 1, 2, 3
+        ON CONFLICT (Entry_Date, Product_ID, Shift) DO UPDATE SET Defects = Defects + excluded.Defects
+        """,
+    ]
+
+
+# Fold the rows with since_id < ID <= last_id into the summaries
+SUMMARY_REFRESH = _summary_upserts("ID > ? AND ID <= ?")
+
+# Rows moved to the Parquet archive (see archive.py). PA_ArchivePartitions
+# lists every file written; a file not listed here is never read.
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS PA_ArchivePartitions (
+    Path TEXT PRIMARY KEY,
+    Month TEXT NOT NULL,
+    Rows INTEGER NOT NULL,
+    Min_ID INTEGER NOT NULL,
+    Max_ID INTEGER NOT NULL,
+    Min_Entry_Date TEXT NOT NULL,
+    Max_Entry_Date TEXT NOT NULL,
+    Archived_At TEXT DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Temp table holding the IDs of the rows being archived, per connection
+ARCHIVE_BATCH_TABLE = "PA_ArchiveBatch"
+
+# Idempotency key generated by the circle diagram for every entry. A replayed
+# submission finds its key in the unique index and is not inserted again.
+# Rows logged without one (older rows, imports) leave it NULL.
+CLIENT_ID_SCHEMA = [
+    "ALTER TABLE PA_InternalScrap_Data ADD COLUMN Client_ID TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS UX_PA_InternalScrap_Data_Client_ID ON PA_InternalScrap_Data (Client_ID) WHERE Client_ID IS NOT NULL",
+]
+
+# One row per schema migration applied. Versions from before the table
+# existed are listed with no Applied_At.
+SCHEMA_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS PA_SchemaHistory (
+    Version INTEGER PRIMARY KEY,
+    Description TEXT NOT NULL,
+    Applied_At TEXT
+)
+"""
+
+# Data backfills queued by migrations and worked through afterwards in
+# small ID-range chunks (see BACKFILLS). Last_ID is committed with each
+# chunk, so an interrupted backfill resumes where it stopped. Rows above
+# Target_ID were written after the migration, already in the new form.
+BACKFILL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS PA_Backfills (
+    Name TEXT PRIMARY KEY,
+    Last_ID INTEGER NOT NULL DEFAULT 0,
+    Target_ID INTEGER NOT NULL,
+    Rows_Done INTEGER NOT NULL DEFAULT 0,
+    Rows_Total INTEGER NOT NULL,
+    Queued_At TEXT DEFAULT CURRENT_TIMESTAMP,
+    Finished_At TEXT
+)
+"""
+
+DEFAULT_BACKFILL_CHUNK = 2000       # rows per backfill transaction
+
+TEMPORAL_SCHEMA = [
+    "ALTER TABLE PA_InternalScrap_Data ADD COLUMN Entry_Day INTEGER",
+    "ALTER TABLE PA_InternalScrap_Data ADD COLUMN Exact_Epoch INTEGER",
+    "ALTER TABLE PA_InternalScrap_Data ADD COLUMN Shift INTEGER",
+    # Covers the per-shift breakdown of a window as well as its row count
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Data_Exact_Epoch ON PA_InternalScrap_Data (Exact_Epoch, Entry_Day, Shift)",
+    "CREATE INDEX IF NOT EXISTS IX_PA_InternalScrap_Data_Entry_Day ON PA_InternalScrap_Data (Entry_Day)",
+    # INSERT_DEFECT_SQL fills them itself; these cover inserts through the
+    # view or from other tools, and later edits of the text columns
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Temporal_Insert
+    AFTER INSERT ON PA_InternalScrap_Data
+    WHEN NEW.Entry_Day IS NULL AND NEW.Exact_Epoch IS NULL
+     AND (NEW.Entry_Date IS NOT NULL OR NEW.Exact_Time IS NOT NULL)
+    BEGIN
+        UPDATE PA_InternalScrap_Data SET
+            Entry_Day = {ENTRY_DAY_SQL.format(ref='NEW.Entry_Date')},
+            Exact_Epoch = {EXACT_EPOCH_SQL.format(ref='NEW.Exact_Time')},
+            Shift = {SHIFT_SQL.format(ref='NEW.Exact_Time')}
+        WHERE ID = NEW.ID;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS PA_InternalScrap_Temporal_Update
+    AFTER UPDATE OF Entry_Date, Exact_Time ON PA_InternalScrap_Data
+    BEGIN
+        UPDATE PA_InternalScrap_Data SET
+            Entry_Day = {ENTRY_DAY_SQL.format(ref='NEW.Entry_Date')},
+            Exact_Epoch = {EXACT_EPOCH_SQL.format(ref='NEW.Exact_Time')},
+            Shift = {SHIFT_SQL.format(ref='NEW.Exact_Time')}
+        WHERE ID = NEW.ID;
+    END
+    """,
+]
+TEMPORAL_BACKFILL = "temporal_columns"
+
+# SQL Server export
+SQL_SERVER_TABLE = "[ict_spotfire_dev].[dbo].[PA_InternalScrap]"
+SQL_SERVER_EXPORT_TARGET = "sql_server"
+SQL_SERVER_BATCH_SIZE = 500
+EXPORT_COLUMNS = (
+    "Entry_Date", "Batch_Number", "Date_Code", "Product", "Scrap", "Quantity", "Signature", "Notes",
+    "Casting_Clock", "Pinhole_Level", "Exact_Time", "Casting_Cavity_Number", "Core_Cavity_Number",
+    "Core_Clock", "Shift_Class", "Location",
+)
+
+# Log viewer filters: filter key -> SQL condition on PA_InternalScrap
+FILTER_CONDITIONS = {
+    'date_from': "Entry_Date >= ?",
+    'date_to': "Entry_Date <= ?",
+    'product': "Product = ?",
+    'batch_number': "Batch_Number = ?",
+    'scrap': "Scrap = ?",
+    'location': "Location = ?",
+}
+
+# The same filters against PA_InternalScrap_Data, matching catalog columns by
+# ID, plus time windows on the typed columns (see time_windows.py)
+DATA_FILTER_CONDITIONS = dict(
+    FILTER_CONDITIONS,
+    product=f"Product_ID = {_catalog_id('Product', '?')}",
+    scrap=f"Scrap_ID = {_catalog_id('Scrap', '?')}",
+    location=f"Location_ID = {_catalog_id('Location', '?')}",
+    time_from="Exact_Epoch >= CAST(? AS INTEGER)",
+    time_to="Exact_Epoch < CAST(? AS INTEGER)",
+    shift="Shift = CAST(? AS INTEGER)",
+)
+
+COUNTER_BACKFILL = [
+    "DELETE FROM PA_InternalScrap_Counters",
+    """
+    INSERT INTO PA_InternalScrap_Counters (Dimension, Key, Total)
+    SELECT 'total', '', COUNT(*) FROM PA_InternalScrap
+    UNION ALL
+    SELECT 'day', COALESCE(Entry_Date, ''), COUNT(*) FROM PA_InternalScrap GROUP BY 2
+    UNION ALL
+    SELECT 'product', COALESCE(Product, ''), COUNT(*) FROM PA_InternalScrap GROUP BY 2
+    UNION ALL
+    SELECT 'scrap', COALESCE(Scrap, ''), COUNT(*) FROM PA_InternalScrap GROUP BY 2
+    """,
+]
+
+
+def _migrate_counters(conn):
+    for statement in COUNTER_SCHEMA + COUNTER_BACKFILL:
+        conn.execute(statement)
+
+
+def _migrate_indexes(conn):
+    for statement in INDEX_SCHEMA:
+        conn.execute(statement)
+    conn.execute("ANALYZE PA_InternalScrap")
+
+
+def _migrate_export_state(conn):
+    conn.execute(EXPORT_STATE_SCHEMA)
+
+
+def _migrate_outbox(conn):
+    for statement in OUTBOX_SCHEMA:
+        conn.execute(statement)
+
+
+def _migrate_catalogs(conn):
+    for statement in CATALOG_SCHEMA:
+        conn.execute(statement)
+    for column, names in CATALOG_SEEDS.items():
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {CATALOGS[column][0]} (Name) VALUES (?)",
+            [(name,) for name in names]
+        )
+    # Names already in use, in order of first appearance
+    for column, (table, _) in CATALOGS.items():
+        conn.execute(
+            f"INSERT OR IGNORE INTO {table} (Name) SELECT {column} FROM PA_InternalScrap "
+            f"WHERE {column} IS NOT NULL GROUP BY {column} ORDER BY MIN(ID)"
+        )
+    
+    # Copy rows across with their IDs, then carry the AUTOINCREMENT
+    # high-water mark over so deleted IDs are never handed out again
+    conn.execute(DATA_SCHEMA)
+    conn.execute(
+        f"INSERT INTO {DATA_TABLE} ("
+        + ", ".join(CATALOGS[column][1] if column in CATALOGS else column for column in DEFECT_COLUMNS)
+        + ") SELECT "
+        + ", ".join(_catalog_id(column, f"s.{column}") if column in CATALOGS else f"s.{column}"
+                    for column in DEFECT_COLUMNS)
+        + " FROM PA_InternalScrap s ORDER BY s.ID"
+    )
+    conn.execute(f"DELETE FROM sqlite_sequence WHERE name = '{DATA_TABLE}'")
+    conn.execute(
+        f"INSERT INTO sqlite_sequence (name, seq) "
+        f"SELECT '{DATA_TABLE}', MAX(seq) FROM sqlite_sequence WHERE name IN ('PA_InternalScrap', '{DATA_TABLE}') "
+        f"HAVING MAX(seq) IS NOT NULL"
+    )
+    
+    # Dropping the table also drops its old triggers and text-column indexes
+    conn.execute("DROP TABLE PA_InternalScrap")
+    conn.execute(DEFECT_VIEW_SQL)
+    for statement in DATA_TRIGGERS + DATA_INDEX_SCHEMA:
+        conn.execute(statement)
+    conn.execute(f"ANALYZE {DATA_TABLE}")
+
+
+def _migrate_summaries(conn):
+    # The first refresh_defect_summaries() call backfills from ID 0
+    for statement in SUMMARY_SCHEMA + SUMMARY_TRIGGERS:
+        conn.execute(statement)
+
+
+def _migrate_archive(conn):
+    conn.execute(ARCHIVE_SCHEMA)
+
+
+def _migrate_client_ids(conn):
+    for statement in CLIENT_ID_SCHEMA:
+        conn.execute(statement)
+
+
+def _migrate_history(conn):
+    conn.execute(SCHEMA_HISTORY_SCHEMA)
+    conn.execute(BACKFILL_SCHEMA)
+    conn.executemany(
+        "INSERT OR IGNORE INTO PA_SchemaHistory (Version, Description) VALUES (?, ?)",
+        [(version, description) for version, description, _ in MIGRATIONS if version < SCHEMA_HISTORY_VERSION]
+    )
+
+
+def queue_backfill(conn, name):
+    """
+    Queue a BACKFILLS entry from inside a migration
+    
+    It covers the rows present now; the migration's write path changes
+    must take care of rows logged from here on.
+    """
+    if name not in BACKFILLS:
+        raise ValueError(f"Unknown backfill: {name}")
+    target_id, rows = conn.execute(f"SELECT COALESCE(MAX(ID), 0), COUNT(*) FROM {DATA_TABLE}").fetchone()
+    conn.execute(
+        "INSERT OR IGNORE INTO PA_Backfills (Name, Target_ID, Rows_Total, Finished_At) "
+        "VALUES (?, ?, ?, CASE WHEN ? = 0 THEN CURRENT_TIMESTAMP END)",
+        (name, target_id, rows, rows)
+    )
+
+
+def _migrate_temporal(conn):
+    for statement in TEMPORAL_SCHEMA:
+        conn.execute(statement)
+    queue_backfill(conn, TEMPORAL_BACKFILL)
+
+
+def _backfill_temporal(conn, after_id, up_to_id):
+    conn.execute(
+        f"UPDATE {DATA_TABLE} SET Entry_Day = {ENTRY_DAY_SQL.format(ref='Entry_Date')}, "
+        f"Exact_Epoch = {EXACT_EPOCH_SQL.format(ref='Exact_Time')}, "
+        f"Shift = {SHIFT_SQL.format(ref='Exact_Time')} "
+        "WHERE ID > ? AND ID <= ?",
+        (after_id, up_to_id)
+    )
+
+
+def _migrate_view_update(conn):
+    conn.execute(VIEW_UPDATE_TRIGGER)
+
+
+def _migrate_shift_summary(conn):
+    conn.execute(SHIFT_SUMMARY_SCHEMA)
+    for statement in SHIFT_SUMMARY_TRIGGERS:
+        conn.execute(statement)
+    # Catch up with the live rows the other summaries already hold; archived
+    # months are added by the next rebuild_defect_summaries()
+    since_id = conn.execute(f"SELECT {SUMMARY_WATERMARK}").fetchone()[0]
+    conn.execute(_summary_upserts("ID <= ?")[-1], (since_id,))
+
+
+# Data backfills: name -> (description, apply(conn, after_id, up_to_id)).
+# apply updates the PA_InternalScrap_Data rows with after_id < ID <= up_to_id
+# and runs inside the same short write transaction that records progress.
+# A migration that needs one adds the new columns, makes new inserts fill
+# them, and calls queue_backfill; run_backfill_step does the rest.
+BACKFILLS = {
+    TEMPORAL_BACKFILL: ("Entry_Day, Exact_Epoch and Shift from Entry_Date and Exact_Time", _backfill_temporal),
+}
+
+
+# Schema migrations, applied in order on top of SCHEMA_SQL. The database's
+# PRAGMA user_version records the last one applied; append new steps only.
+MIGRATIONS = [
+    (1, "Trigger-maintained defect counters", _migrate_counters),
+    (2, "Secondary indexes for log viewer filters", _migrate_indexes),
+    (3, "Export high-water marks", _migrate_export_state),
+    (4, "Sync outbox", _migrate_outbox),
+    (5, "Catalog tables with ID-keyed defect rows", _migrate_catalogs),
+    (6, "Daily and batch summary tables", _migrate_summaries),
+    (7, "Parquet archive partitions", _migrate_archive),
+    (8, "Client idempotency keys", _migrate_client_ids),
+    (9, "Schema history and chunked backfills", _migrate_history),
+    (10, "Typed time columns and shift", _migrate_temporal),
+    (11, "Updates through the PA_InternalScrap view", _migrate_view_update),
+    (12, "Shift summary table", _migrate_shift_summary),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+SCHEMA_HISTORY_VERSION = 9      # migrations from here on are recorded as they are applied
+
+
+# Source of ConnectionManager.generation values, unique across managers
+# so a replaced manager's cached results can never look current
+_generations = itertools.count(1)
+
+
+class ConnectionManager:
+    """
+    Process-wide SQLite connection manager
+    
+    Each thread gets one reusable connection, opened on first use with the
+    configured pragmas. The schema is checked once per process, on the first
+    connection, instead of on every call.
     
-    def __init__(self, db_file=DB_FILE):
+    Writes go through write(), which takes the write lock up front with
+    BEGIN IMMEDIATE and retries with exponential backoff when another
+    station holds the database past busy_timeout. Every write that changes
+    rows moves generation on, which is what invalidates cached query results.
+    
+    With multi_process, the processes sharing the database take turns on a
+    file lock before BEGIN IMMEDIATE, so they queue in the kernel instead of
+    polling SQLite's lock, and the generation includes a counter shared
+    through a memory-mapped file, so a write in one process invalidates the
+    cached results of all of them.
+    """
+    
+    def __init__(self, db_file=DB_FILE, pragmas=None, write_retries=None, retry_backoff=DEFAULT_RETRY_BACKOFF,
+                 retry_backoff_max=DEFAULT_RETRY_BACKOFF_MAX, multi_process=None):
         self.db_file = db_file
-        self._ensure_table_exists()
-    
-    def _ensure_table_exists(self):
-        """Create the table if it doesn't exist"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS PA_InternalScrap (
-            ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TEST_ID INTEGER,
-            Entry_Date TEXT,
-            Batch_Number TEXT,
-            Date_Code TEXT,
-            Product TEXT,
-            Scrap TEXT,
-            Quantity INTEGER,
-            Signature TEXT,
-            Notes TEXT,
-            Casting_Clock INTEGER,
-            Pinhole_Level INTEGER,
-            Exact_Time TEXT,
-            Casting_Cavity_Number TEXT,
-            Core_Cavity_Number TEXT,
-            Core_Clock TEXT,
-            Shift_Class INTEGER,
-            Location TEXT,
-            Created_At TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
+        self.pragmas = {name: get_setting(PRAGMA_ENV.format(name.upper()), value)
+                        for name, value in DEFAULT_PRAGMAS.items()}
+        self.pragmas.update(pragmas or {})
+        if write_retries is None:
+            write_retries = get_setting(WRITE_RETRIES_ENV, DEFAULT_WRITE_RETRIES)
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        if multi_process is None:
+            multi_process = get_setting(MULTI_PROCESS_ENV, False)
+        self.multi_process = multi_process
+        self._writer_lock = FileLock(state_file(db_file, 'writer.lock')) if multi_process else None
+        self._shared_generation = SharedCounter(state_file(db_file, 'generation')) if multi_process else None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = {}  # thread ident -> (thread, connection)
+        self._schema_ready = False
+        self._closed = False
+        self.pid = os.getpid()
+        self._generation = next(_generations)
+    
+    @property
+    def generation(self):
+        """Changes after every write that changes rows (in any process, with multi_process)"""
+        if self._shared_generation is None:
+            return self._generation
+        return self._generation, self._shared_generation.value()
+    
+    def open_connection(self):
+        """Open a new, unpooled connection with the configured pragmas"""
+        with metrics.phase("db.connect"):
+            conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            for name, value in self.pragmas.items():
+                if value is not None:
+                    conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            if not self._schema_ready:
+                with metrics.phase("db.schema_check"):
+                    self._ensure_schema(conn)
+                self._schema_ready = True
+        return conn
+    
+    def connection(self):
+        """Return this thread's pooled connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection manager has been shut down")
+        
+        conn = self.open_connection()
+        thread = threading.current_thread()
+        with self._lock:
+            self._prune_dead_threads()
+            previous = self._connections.get(thread.ident)
+            if previous is not None:
+                # Thread ident reused by a new thread; the old connection is orphaned
+                previous[1].close()
+            self._connections[thread.ident] = (thread, conn)
+        self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Run a block inside BEGIN/COMMIT on this thread's connection"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+    
+    def write(self, func):
+        """
+        Run func(conn) in a write transaction, retrying while the database is busy
+        
+        The whole transaction is rolled back and replayed on each retry, so
+        func must not have side effects outside the database.
+        
+        Returns:
+            Whatever func returns
+        """
+        attempt = 0
+        while True:
+            try:
+                # Connect first: the schema check on a new connection takes the writer lock itself
+                conn = self.connection()
+                if self._writer_lock is None:
+                    return self._write_once(conn, func)
+                with metrics.phase("db.write.lock"):
+                    self._writer_lock.acquire()
+                try:
+                    return self._write_once(conn, func)
+                finally:
+                    self._writer_lock.release()
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt >= self.write_retries:
+                    raise
+                metrics.count("db.write.busy_retries")
+                delay = min(self.retry_backoff * (2 ** attempt), self.retry_backoff_max)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+    
+    def _write_once(self, conn, func):
+        # transaction() spelled out, so waiting for the lock, the work
+        # and the commit are timed as separate phases
+        with metrics.phase("db.write.begin"):
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            changes = conn.total_changes
+            with metrics.phase("db.write.body"):
+                result = func(conn)
+            changed = conn.total_changes != changes
+            with metrics.phase("db.write.commit"):
+                conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        # Only after COMMIT, so a reader that saw the old generation
+        # cannot have cached rows from after this write under the new one
+        if changed:
+            self._generation = next(_generations)
+            if self._shared_generation is not None:
+                self._shared_generation.increment()
+        return result
+    
+    def close_all(self):
+        """Close every pooled connection (called on interpreter exit)"""
+        with self._lock:
+            self._closed = True
+            for thread, conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            if self._writer_lock is not None:
+                self._writer_lock.close()
+                self._shared_generation.close()
+                self._writer_lock = self._shared_generation = None
+        self._local = threading.local()
+    
+    def retire(self):
+        """
+        Stop handing out connections after the manager has been replaced
         
-        conn.commit()
-        conn.close()
+        Only this thread's and finished threads' connections are closed here;
+        a connection still owned by another running thread may be mid-query,
+        so it is left to close itself when that thread exits.
+        """
+        current = threading.get_ident()
+        with self._lock:
+            self._closed = True
+            for ident, (thread, conn) in list(self._connections.items()):
+                if ident == current or not thread.is_alive():
+                    conn.close()
+            self._connections.clear()
+        self._local.conn = None
+    
+    def _prune_dead_threads(self):
+        # Streamlit runs each script rerun on a short-lived thread
+        for ident, (thread, conn) in list(self._connections.items()):
+            if not thread.is_alive():
+                conn.close()
+                del self._connections[ident]
+    
+    def _ensure_schema(self, conn):
+        if self._writer_lock is None:
+            return self._apply_migrations(conn)
+        with self._writer_lock:
+            if self._apply_migrations(conn):
+                self._shared_generation.increment()
+    
+    def _apply_migrations(self, conn):
+        """Bring the schema up to date; returns True if any migration ran"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(SCHEMA_SQL)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for migration_version, description, apply in MIGRATIONS:
+                if migration_version > version:
+                    apply(conn)
+                    conn.execute(f"PRAGMA user_version = {migration_version}")
+                    if migration_version >= SCHEMA_HISTORY_VERSION:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO PA_SchemaHistory (Version, Description, Applied_At) "
+                            "VALUES (?, ?, CURRENT_TIMESTAMP)",
+                            (migration_version, description)
+                        )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return version < SCHEMA_VERSION
+
+
+def is_busy_error(error):
+    """True if an OperationalError means another connection holds the lock"""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return (code & 0xFF) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+_default_db_file = get_setting(DB_FILE_ENV, DB_FILE)
+
+
+def configure(db_file=None, pragmas=None, **write_options):
+    """
+    Set the database file and pragmas used by the module-level functions
+    
+    Args:
+        db_file (str): Path to the SQLite database file (default: SCRAP_DB_FILE or defect_logs.db)
+        pragmas (dict): Overrides for DEFAULT_PRAGMAS, e.g. {'busy_timeout': 10000}
+        **write_options: write_retries, retry_backoff, retry_backoff_max, multi_process
+    
+    Returns:
+        ConnectionManager: The new process-wide manager
+    """
+    global _default_db_file
+    db_file = db_file or get_setting(DB_FILE_ENV, DB_FILE)
+    key = os.path.abspath(db_file)
+    with _managers_lock:
+        old = _managers.pop(key, None)
+        if old is not None and old.pid == os.getpid():
+            old.retire()
+        manager = ConnectionManager(db_file, pragmas, **write_options)
+        _managers[key] = manager
+        _default_db_file = db_file
+    return manager
+
+
+def get_manager(db_file=None):
+    """Return the process-wide connection manager for a database file"""
+    db_file = db_file or _default_db_file
+    key = os.path.abspath(db_file)
+    manager = _managers.get(key)
+    if manager is None or manager.pid != os.getpid():
+        with _managers_lock:
+            manager = _managers.get(key)
+            # A manager inherited through fork() must not touch the parent's connections
+            if manager is None or manager.pid != os.getpid():
+                manager = ConnectionManager(db_file)
+                _managers[key] = manager
+    return manager
+
+
+def close_connections():
+    """Close all pooled connections for every database file"""
+    with _managers_lock:
+        for manager in _managers.values():
+            if manager.pid == os.getpid():
+                manager.close_all()
+        _managers.clear()
+
+
+atexit.register(close_connections)
+
+
+class QueryCache:
+    """
+    Shared LRU cache of query results, capped by approximate memory use
+    
+    Each entry remembers the generation of the database it was read at.
+    A write that changes rows moves the manager's generation on, so stale
+    entries are recognised and dropped on lookup; nothing has to be scanned
+    or cleared when a defect is logged. Writes made by other processes only
+    move the generation when the manager runs with multi_process.
+    """
+    
+    def __init__(self, max_bytes=DEFAULT_QUERY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (generation, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key, generation):
+        """Return the value cached for key at generation, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key, generation, value, size):
+        """
+        Cache value (about size bytes), evicting the least recently used entries past max_bytes
+        
+        Returns:
+            bool: False if the value alone is larger than max_bytes and was not cached
+        """
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (generation, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return True
+    
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self):
+        """Entry count, memory use and hit/miss counts"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+    
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+
+query_cache = QueryCache(int(get_setting(QUERY_CACHE_MB_ENV, DEFAULT_QUERY_CACHE_BYTES / (1024 * 1024)) * 1024 * 1024))
+
+
+def _rows_size(rows):
+    """Approximate memory held by a list of result rows"""
+    return sys.getsizeof(rows) + sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows
+    )
+
+
+def cached_query(sql, params=(), db_file=None):
+    """
+    Run a read query, answering repeats from the shared result cache
+    
+    Results are keyed by the database file, the whitespace-normalized SQL
+    and the parameters, and stay valid until the next write that changes
+    rows.
+    
+    Returns:
+        tuple: (rows: list of tuple, columns: list)
+    """
+    manager = get_manager(db_file)
+    normalized = " ".join(sql.split())
+    key = (os.path.abspath(manager.db_file), normalized, tuple(params))
+    # Read before querying; see ConnectionManager.write
+    generation = manager.generation
+    result = query_cache.get(key, generation)
+    if result is None:
+        with metrics.phase("db.query", normalized):
+            cursor = manager.connection().execute(sql, params)
+            rows = cursor.fetchall()
+            columns = [description[0] for description in cursor.description]
+            cursor.close()
+        result = (tuple(rows), tuple(columns))
+        query_cache.put(key, generation, result, _rows_size(rows))
+    return list(result[0]), list(result[1])
+
+
+class SQLiteConnection:
+    """SQLite database connection for local logging"""
+    
+    def __init__(self, db_file=None):
+        self.db_file = db_file or _default_db_file
+        self.manager = get_manager(self.db_file)
     
     def get_connection(self):
-        """Create and return a database connection"""
-        return sqlite3.connect(self.db_file)
+        """Create and return a new database connection (caller closes it)"""
+        return self.manager.open_connection()
     
     def test_connection(self):
         """Test the database connection"""
         try:
-            conn = self.get_connection()
+            conn = self.manager.connection()
             cursor = conn.cursor()
             cursor.execute("SELECT 1")
             cursor.close()
-            conn.close()
             return True, f"SQLite connection successful! Database: {self.db_file}"
         except Exception as e:
             return False, str(e)
 
 
-def log_defect_to_database(click_data, session_info):
+# Insert statement shared by every write path. It writes to the data table
+# directly (not through the view) so last_insert_rowid() sees the new rows.
+# Parameters are numbered so the typed time columns can be computed from
+# Entry_Date (?1) and Exact_Time (?11) by the same SQL the backfill uses.
+INSERT_DEFECT_SQL = f"""
+INSERT INTO PA_InternalScrap_Data
+(
+    Entry_Date,
+    Batch_Number,
+    Date_Code,
+    Product_ID,
+    Scrap_ID,
+    Quantity,
+    Signature,
+    Notes,
+    Casting_Clock,
+    Pinhole_Level,
+    Exact_Time,
+    Casting_Cavity_Number,
+    Core_Cavity_Number,
+    Ring_ID,
+    Shift_Class,
+    Location_ID,
+    Client_ID,
+    Entry_Day,
+    Exact_Epoch,
+    Shift
+)
+VALUES (
+    ?1, ?2, ?3,
+    (SELECT ID FROM PA_Products WHERE Name = ?4),
+    (SELECT ID FROM PA_DefectTypes WHERE Name = ?5),
+    ?6, ?7, ?8, ?9, ?10, ?11, ?12, ?13,
+    (SELECT ID FROM PA_Rings WHERE Name = ?14),
+    ?15,
+    (SELECT ID FROM PA_Locations WHERE Name = ?16),
+    ?17,
+    {ENTRY_DAY_SQL.format(ref='?1')},
+    {EXACT_EPOCH_SQL.format(ref='?11')},
+    {SHIFT_SQL.format(ref='?11')}
+)
+ON CONFLICT (Client_ID) WHERE Client_ID IS NOT NULL DO NOTHING
+"""
+
+# Position of each catalog column in a build_defect_values() tuple
+CATALOG_VALUE_POSITIONS = {'Product': 3, 'Scrap': 4, 'Core_Clock': 13, 'Location': 15}
+CLIENT_ID_POSITION = 16
+
+
+def build_defect_values(click_data, session_info):
+    """Map a circle diagram click and the session form onto INSERT_DEFECT_SQL values"""
+    return (
+        session_info.get('date'),                    # Entry_Date
+        session_info.get('batch_number'),            # Batch_Number
+        session_info.get('date_code'),               # Date_Code
+        session_info.get('part_number'),             # Product
+        click_data.get('defect'),                    # Scrap
+        1,                                           # Quantity (always 1)
+        'LS',                                        # Signature (always 'LS')
+        session_info.get('notes'),                   # Notes
+        click_data.get('segment'),                   # Casting_Clock
+        click_data.get('distance'),                  # Pinhole_Level
+        click_data.get('timestamp'),                 # Exact_Time
+        click_data.get('cavity'),                    # Casting_Cavity_Number
+        click_data.get('cavity'),                    # Core_Cavity_Number (same as above)
+        click_data.get('ring'),                      # Core_Clock
+        click_data.get('angle'),                     # Shift_Class
+        click_data.get('option'),                    # Location
+        click_data.get('client_id')                  # Client_ID (idempotency key)
+    )
+
+
+def find_logged_client_ids(conn, client_ids):
+    """
+    Look up rows already logged under any of client_ids (one index probe each)
+    
+    Returns:
+        dict: Client_ID -> ID, for the keys that exist
+    """
+    client_ids = list({client_id for client_id in client_ids if client_id is not None})
+    logged = {}
+    for start in range(0, len(client_ids), 500):
+        chunk = client_ids[start:start + 500]
+        logged.update(conn.execute(
+            f"SELECT Client_ID, ID FROM {DATA_TABLE} WHERE Client_ID IN ({', '.join('?' * len(chunk))})",
+            chunk
+        ).fetchall())
+    return logged
+
+
+def insert_defect_rows(conn, rows):
+    """
+    Insert prepared value tuples inside the caller's write transaction
+    
+    Rows whose Client_ID is already in the table, or earlier in rows, are
+    not inserted again; they get the ID of the row that was.
+    
+    Returns:
+        tuple: (ids, existed) - the row ID of each of rows, in order, and
+            per row whether its Client_ID was already in the table
+    """
+    logged = find_logged_client_ids(conn, (row[CLIENT_ID_POSITION] for row in rows))
+    fresh = []
+    slots = []          # per row: its index in fresh, or None if already logged
+    first_slot = {}     # Client_ID -> index in fresh
+    for row in rows:
+        client_id = row[CLIENT_ID_POSITION]
+        if client_id in logged:
+            slots.append(None)
+        elif client_id is not None and client_id in first_slot:
+            slots.append(first_slot[client_id])
+        else:
+            if client_id is not None:
+                first_slot[client_id] = len(fresh)
+            slots.append(len(fresh))
+            fresh.append(row)
+    
+    first_id = None
+    if fresh:
+        for column, position in CATALOG_VALUE_POSITIONS.items():
+            names = {row[position] for row in fresh if row[position] is not None}
+            if names:
+                add_catalog_names(conn, column, names)
+        conn.executemany(INSERT_DEFECT_SQL, fresh)
+        # The write lock is held for the whole transaction, so AUTOINCREMENT
+        # hands this batch a contiguous block of IDs ending at last_insert_rowid
+        # (and no other writer can have added one of its keys since the lookup)
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first_id = last_id - len(fresh) + 1
+    ids = [logged[row[CLIENT_ID_POSITION]] if slot is None else first_id + slot
+           for row, slot in zip(rows, slots)]
+    return ids, [slot is None for slot in slots]
+
+
+def add_catalog_names(conn, column, names):
+    """Add names to a column's catalog inside the caller's write transaction (existing names are skipped)"""
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {CATALOGS[column][0]} (Name) VALUES (?)",
+        [(name,) for name in names]
+    )
+
+
+def get_catalog_names(column, db_file=None):
+    """
+    Get the names in a column's catalog, oldest first
+    
+    Args:
+        column (str): 'Product', 'Scrap', 'Core_Clock' or 'Location'
+    
+    Returns:
+        list: Catalog names in ID order
+    """
+    table, _ = CATALOGS[column]
+    try:
+        rows, _ = cached_query(f"SELECT Name FROM {table} ORDER BY ID", db_file=db_file)
+        return [row[0] for row in rows]
+    
+    except Exception as e:
+        return []
+
+
+@timed()
+def register_catalog_names(column, names, db_file=None):
+    """
+    Make sure names exist in a column's catalog (e.g. the part number list)
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        names = [name for name in names if name]
+        get_manager(db_file).write(lambda conn: add_catalog_names(conn, column, names))
+        return True, f"{len(names)} {column} names registered"
+    
+    except Exception as e:
+        return False, f"Failed to register {column} names: {str(e)}"
+
+
+@timed()
+def log_defect_to_database(click_data, session_info):
+    """
+    Log a defect entry to the SQLite database
+    
+    Args:
+        click_data (dict): Data from the circle diagram click
+        session_info (dict): Session information from Streamlit
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        values = build_defect_values(click_data, session_info)
+        
+        # Execute the insert (retried if another station holds the write lock);
+        # a replay of an entry already logged changes nothing
+        ids, existed = get_manager().write(lambda conn: insert_defect_rows(conn, [values]))
+        inserted_id = ids[0]
+        
+        if existed[0]:
+            return True, f"Already logged, nothing added. ID: {inserted_id} (Local DB)"
+        return True, f"Defect logged successfully! ID: {inserted_id} (Local DB)"
+    
+    except Exception as e:
+        return False, f"Failed to log defect: {str(e)}"
+
+
+@timed()
+def log_defects_batch(click_data_list, session_info):
+    """
+    Log several defects from one submission in a single transaction
+    
+    Args:
+        click_data_list (list of dict): Entries from the circle diagram
+        session_info (dict): Session information from Streamlit, shared by all entries
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        if not click_data_list:
+            return False, "No defects to log"
+        rows = [build_defect_values(click_data, session_info) for click_data in click_data_list]
+        
+        # One executemany and one commit for the whole batch; entries
+        # already logged (a replayed submission) are skipped
+        ids, existed = get_manager().write(lambda conn: insert_defect_rows(conn, rows))
+        added = len({row_id for row_id, was_logged in zip(ids, existed) if not was_logged})
+        
+        id_text = f"ID: {ids[0]}" if len(ids) == 1 else f"IDs: {min(ids)}-{max(ids)}"
+        if not added:
+            return True, f"Already logged, nothing added. {id_text} (Local DB)"
+        if len(ids) == 1:
+            return True, f"Defect logged successfully! {id_text} (Local DB)"
+        suffix = f", {len(ids) - added} already logged" if added < len(ids) else ""
+        return True, f"{added} defects logged successfully! {id_text}{suffix} (Local DB)"
+    
+    except Exception as e:
+        return False, f"Failed to log defects: {str(e)}"
+
+
+@timed()
+def get_all_defects():
+    """Get all logged defects from the database"""
+    try:
+        conn = get_manager().connection()
+        cursor = conn.execute("SELECT * FROM PA_InternalScrap ORDER BY ID DESC")
+        rows = cursor.fetchall()
+        
+        # Get column names
+        columns = [description[0] for description in cursor.description]
+        cursor.close()
+        
+        return rows, columns
+    
+    except Exception as e:
+        return [], []
+
+
+@timed()
+def get_defect_count(db_file=None):
+    """Get total count of logged defects (read from the trigger-maintained counters)"""
+    try:
+        rows, _ = cached_query(
+            "SELECT Total FROM PA_InternalScrap_Counters WHERE Dimension = 'total' AND Key = ''",
+            db_file=db_file
+        )
+        
+        return rows[0][0] if rows else 0
+    
+    except Exception as e:
+        return 0
+
+
+def get_last_defect_id(db_file=None):
+    """
+    Get the highest defect ID in the live table
+    
+    Not cached: the live log view polls this to notice new rows, including
+    rows written by other processes.
+    """
+    try:
+        conn = get_manager(db_file).connection()
+        return conn.execute(f"SELECT COALESCE(MAX(ID), 0) FROM {DATA_TABLE}").fetchone()[0]
+    
+    except Exception as e:
+        return 0
+
+
+def build_filter_clause(filters, conditions_by_key=FILTER_CONDITIONS):
+    """
+    Turn a log viewer filters dict into a WHERE clause
+    
+    Args:
+        filters (dict): Keys from FILTER_CONDITIONS; None or "" values are ignored
+        conditions_by_key (dict): FILTER_CONDITIONS for the view, or
+            DATA_FILTER_CONDITIONS for PA_InternalScrap_Data
+    
+    Returns:
+        tuple: (where_sql: str, params: list) - where_sql is "" when nothing is filtered
+    """
+    conditions = []
+    params = []
+    for key, value in (filters or {}).items():
+        if value is None or value == "":
+            continue
+        if key not in conditions_by_key:
+            raise ValueError(f"Unknown filter: {key}")
+        conditions.append(conditions_by_key[key])
+        params.append(str(value))
+    
+    if not conditions:
+        return "", params
+    return "WHERE " + " AND ".join(conditions), params
+
+
+def _page_query(filters, before_id, limit):
+    where, params = build_filter_clause(filters)
+    if before_id is not None:
+        where = f"{where} AND ID < ?" if where else "WHERE ID < ?"
+        params.append(before_id)
+    return f"SELECT * FROM PA_InternalScrap {where} ORDER BY ID DESC LIMIT ?", params + [limit]
+
+
+def _export_query(filters):
+    where, params = build_filter_clause(filters)
+    return f"SELECT * FROM PA_InternalScrap {where} ORDER BY ID DESC", params
+
+
+def _count_query(filters):
+    where, params = build_filter_clause(filters)
+    return f"SELECT COUNT(*) FROM PA_InternalScrap {where}", params
+
+
+@timed()
+def get_defects_page(filters=None, before_id=None, page_size=100):
     """
-    Log a defect entry to the SQLite database
+    Get one page of defects, newest first, using keyset pagination on ID
     
     Args:
-        click_data (dict): Data from the circle diagram click
-        session_info (dict): Session information from Streamlit
+        filters (dict): Log viewer filters (see FILTER_CONDITIONS)
+        before_id (int): Only return rows with ID below this (None = first page)
+        page_size (int): Maximum rows to return
     
     Returns:
-        tuple: (success: bool, message: str)
+        tuple: (rows, columns, next_before_id) - next_before_id is None on the last page
     """
     try:
-        db = SQLiteConnection()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Prepare the SQL insert statement
-        sql = """
-        INSERT INTO PA_InternalScrap
-        (
-            Entry_Date,
-            Batch_Number,
-            Date_Code,
-            Product,
-            Scrap,
-            Quantity,
-            Signature,
-            Notes,
-            Casting_Clock,
-            Pinhole_Level,
-            Exact_Time,
-            Casting_Cavity_Number,
-            Core_Cavity_Number,
-            Core_Clock,
-            Shift_Class,
-            Location
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        
-        # Prepare values from click_data and session_info
-        values = (
-            session_info.get('date'),                    # Entry_Date
-            session_info.get('batch_number'),            # Batch_Number
-            session_info.get('date_code'),               # Date_Code
-            session_info.get('part_number'),             # Product
-            click_data.get('defect'),                    # Scrap
-            1,                                           # Quantity (always 1)
-            'LS',                                        # Signature (always 'LS')
-            session_info.get('notes'),                   # Notes
-            click_data.get('segment'),                   # Casting_Clock
-            click_data.get('distance'),                  # Pinhole_Level
-            click_data.get('timestamp'),                 # Exact_Time
-            click_data.get('cavity'),                    # Casting_Cavity_Number
-            click_data.get('cavity'),                    # Core_Cavity_Number (same as above)
-            click_data.get('ring'),                      # Core_Clock
-            click_data.get('angle'),                     # Shift_Class
-            click_data.get('option')                     # Location
-        )
+        # Fetch one extra row to find out whether another page follows
+        rows, columns = cached_query(*_page_query(filters, before_id, page_size + 1))
         
-        # Execute the insert
-        cursor.execute(sql, values)
-        conn.commit()
+        next_before_id = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_before_id = rows[-1][0]
         
-        # Get the inserted ID
-        inserted_id = cursor.lastrowid
+        return rows, columns, next_before_id
+    
+    except Exception as e:
+        return [], [], None
+
+
+@timed()
+def count_defects(filters=None):
+    """
+    Count the defects matching the log viewer filters
+    
+    Unfiltered, date-only, product-only and scrap-only counts are answered
+    from the counters table; other combinations run a COUNT(*).
+    """
+    active = {key: str(value) for key, value in (filters or {}).items() if value is not None and value != ""}
+    try:
+        if not active:
+            return get_defect_count()
         
-        cursor.close()
-        conn.close()
+        if set(active) <= {'date_from', 'date_to'}:
+            rows, _ = cached_query(
+                "SELECT COALESCE(SUM(Total), 0) FROM PA_InternalScrap_Counters "
+                "WHERE Dimension = 'day' AND Key >= ? AND Key <= ? AND Key != ''",
+                (active.get('date_from', ''), active.get('date_to', '\uffff'))
+            )
+            return rows[0][0]
         
-        return True, f"Defect logged successfully! ID: {inserted_id} (Local DB)"
+        if len(active) == 1 and set(active) <= {'product', 'scrap'}:
+            dimension, key = next(iter(active.items()))
+            rows, _ = cached_query(
+                "SELECT Total FROM PA_InternalScrap_Counters WHERE Dimension = ? AND Key = ?",
+                (dimension, key)
+            )
+            return rows[0][0] if rows else 0
         
+        rows, _ = cached_query(*_count_query(active))
+        return rows[0][0]
+    
     except Exception as e:
-        return False, f"Failed to log defect: {str(e)}"
+        return 0
 
 
-def get_all_defects():
-    """Get all logged defects from the database"""
+def iter_defect_chunks(filters=None, chunk_size=5000):
+    """
+    Stream defects matching the log viewer filters, newest first
+    
+    Rows are pulled from SQLite chunk_size at a time, so memory use does not
+    grow with the size of the table.
+    
+    Yields:
+        tuple: (columns, rows) with at most chunk_size rows per chunk
+    """
+    conn = get_manager().connection()
+    cursor = conn.execute(*_export_query(filters))
     try:
-        db = SQLiteConnection()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM PA_InternalScrap ORDER BY ID DESC")
-        rows = cursor.fetchall()
-        
-        # Get column names
         columns = [description[0] for description in cursor.description]
-        
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+    finally:
         cursor.close()
-        conn.close()
-        
-        return rows, columns
+
+
+class _LineBuffer:
+    """Minimal file object that lets csv.writer hand back what it wrote"""
+    
+    def __init__(self):
+        self.parts = []
+    
+    def write(self, text):
+        self.parts.append(text)
+    
+    def take(self):
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
+
+def iter_defects_csv(filters=None, chunk_size=5000):
+    """
+    Stream defects matching the log viewer filters as CSV text
+    
+    Yields the header line first, then one CSV block per chunk of rows.
+    """
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer, lineterminator="\n")
+    header_written = False
+    for columns, rows in iter_defect_chunks(filters, chunk_size):
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.take()
+    
+    if not header_written:
+        # No matching rows: still produce a header so the file opens cleanly
+        cursor = get_manager().connection().execute("SELECT * FROM PA_InternalScrap LIMIT 0")
+        writer.writerow([description[0] for description in cursor.description])
+        cursor.close()
+        yield buffer.take()
+
+
+@timed()
+def write_defects_csv(file, filters=None, chunk_size=5000):
+    """
+    Write defects matching the log viewer filters to a text file as CSV
+    
+    Args:
+        file: Writable text file object (open it with newline="")
+        filters (dict): Log viewer filters (see FILTER_CONDITIONS)
+        chunk_size (int): Rows fetched from SQLite per round trip
+    
+    Returns:
+        int: Number of characters written
+    """
+    written = 0
+    for block in iter_defects_csv(filters, chunk_size):
+        written += file.write(block)
+    return written
+
+
+@timed()
+def get_defect_breakdown(dimension):
+    """
+    Get defect totals grouped by one dimension
+    
+    Args:
+        dimension (str): 'day', 'product' or 'scrap'
+    
+    Returns:
+        dict: key -> count, largest first ('day' is sorted newest first)
+    """
+    if dimension not in COUNTER_DIMENSIONS:
+        raise ValueError(f"Unknown counter dimension: {dimension}")
+    order = "Key DESC" if dimension == 'day' else "Total DESC, Key"
+    try:
+        rows, _ = cached_query(
+            f"SELECT Key, Total FROM PA_InternalScrap_Counters "
+            f"WHERE Dimension = ? AND Total > 0 ORDER BY {order}",
+            (dimension,)
+        )
         
+        return dict(rows)
+    
     except Exception as e:
-        return [], []
+        return {}
 
 
-def get_defect_count():
-    """Get total count of logged defects"""
+@timed()
+def get_defect_totals(columns, filters=None):
+    """
+    Count defects grouped by one or more columns
+    
+    Catalog columns are grouped on their integer IDs and the names are
+    joined onto the grouped rows afterwards, so each name lookup runs once
+    per group instead of once per defect.
+    
+    Args:
+        columns (list): PA_InternalScrap column names, e.g. ['Product', 'Location']
+        filters (dict): Log viewer filters (see FILTER_CONDITIONS)
+    
+    Returns:
+        list of tuple: (*column values, count), largest count first
+    """
+    for column in columns:
+        if column not in DEFECT_COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+    where, params = build_filter_clause(filters, DATA_FILTER_CONDITIONS)
+    grouped = [CATALOGS[column][1] if column in CATALOGS else column for column in columns]
+    selected = [
+        f"{CATALOGS[column][0]}.Name" if column in CATALOGS else f"g.{column}"
+        for column in columns
+    ]
+    joins = "".join(
+        f" LEFT JOIN {CATALOGS[column][0]} ON {CATALOGS[column][0]}.ID = g.{CATALOGS[column][1]}"
+        for column in columns if column in CATALOGS
+    )
+    sql = (
+        f"SELECT {', '.join(selected)}, g.Total FROM ("
+        f"SELECT {', '.join(grouped)}, COUNT(*) AS Total FROM {DATA_TABLE} {where} "
+        f"GROUP BY {', '.join(grouped)}) g{joins} ORDER BY g.Total DESC"
+    )
     try:
-        db = SQLiteConnection()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM PA_InternalScrap")
-        count = cursor.fetchone()[0]
-        
-        cursor.close()
-        conn.close()
-        
-        return count
+        return cached_query(sql, params)[0]
+    
+    except Exception as e:
+        return []
+
+
+def get_defect_counts_by_day():
+    """Get defect totals per Entry_Date"""
+    return get_defect_breakdown('day')
+
+
+def get_defect_counts_by_product():
+    """Get defect totals per Product"""
+    return get_defect_breakdown('product')
+
+
+def get_defect_counts_by_scrap():
+    """Get defect totals per Scrap type"""
+    return get_defect_breakdown('scrap')
+
+
+@timed()
+def rebuild_defect_counters():
+    """
+    Recompute the counters table from PA_InternalScrap
+    
+    Runs automatically once when the counters table is first created; call
+    it by hand only if the counters are suspected to have drifted.
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        def rebuild(conn):
+            for statement in COUNTER_BACKFILL:
+                conn.execute(statement)
         
+        get_manager().write(rebuild)
+        return True, f"Counters rebuilt ({get_defect_count()} defects)"
+    
     except Exception as e:
+        return False, f"Failed to rebuild counters: {str(e)}"
+
+
+@timed()
+def refresh_defect_summaries(db_file=None):
+    """
+    Fold defects logged since the last refresh into the summary tables
+    
+    Only rows above the summaries watermark are read, so the cost depends
+    on how much was logged since the previous call, not on table size.
+    The watermark is compared with MAX(ID) in a (cached) read first, so a
+    call with nothing new to fold in never takes the write lock.
+    
+    Returns:
+        int: Number of new defects summarized
+    """
+    rows, _ = cached_query(SUMMARY_PENDING_SQL, db_file=db_file)
+    since_id, last_id = rows[0]
+    if last_id <= since_id:
         return 0
+    
+    def refresh(conn):
+        since_id = conn.execute(f"SELECT {SUMMARY_WATERMARK}").fetchone()[0]
+        last_id = conn.execute(f"SELECT COALESCE(MAX(ID), 0) FROM {DATA_TABLE}").fetchone()[0]
+        if last_id <= since_id:
+            return 0
+        added = conn.execute(
+            f"SELECT COUNT(*) FROM {DATA_TABLE} WHERE ID > ? AND ID <= ?", (since_id, last_id)
+        ).fetchone()[0]
+        for statement in SUMMARY_REFRESH:
+            conn.execute(statement, (since_id, last_id))
+        conn.execute(
+            """
+            INSERT INTO PA_ExportState (Target, Last_ID, Exported_At) VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (Target) DO UPDATE SET Last_ID = excluded.Last_ID, Exported_At = excluded.Exported_At
+            """,
+            (SUMMARY_TARGET, last_id)
+        )
+        return added
+    
+    return get_manager(db_file).write(refresh)
 
 
-def export_to_sql_server_format():
+@timed()
+def rebuild_defect_summaries(db_file=None, archive_dir=None):
     """
-    Export all data in format ready for SQL Server import
-    Returns SQL INSERT statements
+    Recompute the summary tables from scratch
+    
+    Rows moved to the Parquet archive are read back from their partitions
+    (this needs pyarrow once anything has been archived), so the summaries
+    keep covering archived history.
+    
+    Args:
+        db_file (str): SQLite database (default: the configured one)
+        archive_dir (str): Archive location (see archive.get_archive_dir)
+    
+    Returns:
+        tuple: (success: bool, message: str)
     """
     try:
-        db = SQLiteConnection()
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        def reset(conn):
+            conn.execute("DELETE FROM PA_Summary_Daily")
+            conn.execute("DELETE FROM PA_Summary_Batch")
+            conn.execute("DELETE FROM PA_Summary_Shift")
+            conn.execute("DELETE FROM PA_ExportState WHERE Target = ?", (SUMMARY_TARGET,))
+            if not conn.execute("SELECT 1 FROM PA_ArchivePartitions LIMIT 1").fetchone():
+                return 0
+            from archive import add_archive_to_summaries
+            return add_archive_to_summaries(conn, archive_dir)
         
-        cursor.execute("""
-            SELECT 
-                Entry_Date, Batch_Number, Date_Code, Product, Scrap,
-                Quantity, Signature, Notes, Casting_Clock, Pinhole_Level,
-                Exact_Time, Casting_Cavity_Number, Core_Cavity_Number,
-                Core_Clock, Shift_Class, Location
-            FROM PA_InternalScrap
-            ORDER BY ID
-        """)
+        archived = get_manager(db_file).write(reset)
+        added = refresh_defect_summaries(db_file)
+        return True, f"Summaries rebuilt ({added} defects, {archived} archived)"
+    
+    except Exception as e:
+        return False, f"Failed to rebuild summaries: {str(e)}"
+
+
+@timed()
+def get_shift_summary(date_from=None, date_to=None, product=None):
+    """
+    Get defects per day and shift from PA_Summary_Shift
+    
+    Args:
+        date_from (str): First Entry_Date to include (None = no lower bound)
+        date_to (str): Last Entry_Date to include (None = no upper bound)
+        product (str): Only this product (None = all)
+    
+    Returns:
+        tuple: (rows, columns) - Entry_Date, Shift (1-3, None when Exact_Time is missing), Defects
+    """
+    conditions = ["Defects > 0"]
+    params = []
+    if date_from:
+        conditions.append("Entry_Date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        conditions.append("Entry_Date <= ?")
+        params.append(str(date_to))
+    if product:
+        conditions.append(f"Product_ID = {_catalog_id('Product', '?')}")
+        params.append(product)
+    try:
+        return cached_query(
+            f"""
+            SELECT Entry_Date, NULLIF(Shift, 0) AS Shift, SUM(Defects) AS Defects
+            FROM PA_Summary_Shift
+            WHERE {" AND ".join(conditions)}
+            GROUP BY Entry_Date, Shift
+            ORDER BY Entry_Date, Shift
+            """,
+            params
+        )
+    
+    except Exception as e:
+        return [], []
+
+
+@timed()
+def get_daily_summary(date_from=None, date_to=None, product=None):
+    """
+    Get daily defect totals from PA_Summary_Daily
+    
+    Args:
+        date_from (str): First Entry_Date to include (None = no lower bound)
+        date_to (str): Last Entry_Date to include (None = no upper bound)
+        product (str): Only this product (None = all)
+    
+    Returns:
+        tuple: (rows, columns) - Entry_Date, Product, Scrap, Location, Defects, Quantity
+    """
+    conditions = ["d.Defects > 0"]
+    params = []
+    if date_from:
+        conditions.append("d.Entry_Date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        conditions.append("d.Entry_Date <= ?")
+        params.append(str(date_to))
+    if product:
+        conditions.append(f"d.Product_ID = {_catalog_id('Product', '?')}")
+        params.append(product)
+    try:
+        return cached_query(
+            f"""
+            SELECT d.Entry_Date, p.Name AS Product, s.Name AS Scrap, l.Name AS Location, d.Defects, d.Quantity
+            FROM PA_Summary_Daily d
+            LEFT JOIN PA_Products p ON p.ID = d.Product_ID
+            LEFT JOIN PA_DefectTypes s ON s.ID = d.Scrap_ID
+            LEFT JOIN PA_Locations l ON l.ID = d.Location_ID
+            WHERE {" AND ".join(conditions)}
+            ORDER BY d.Entry_Date
+            """,
+            params
+        )
+    
+    except Exception as e:
+        return [], []
+
+
+@timed()
+def get_batch_summary(date_from=None, date_to=None, product=None, limit=50):
+    """
+    Get the batches with the most defects from PA_Summary_Batch
+    
+    Args:
+        date_from (str): Only batches with entries on or after this date
+        date_to (str): Only batches with entries on or before this date
+        product (str): Only this product (None = all)
+        limit (int): Maximum batches to return
+    
+    Returns:
+        tuple: (rows, columns) - Batch_Number, Product, Defects, Quantity,
+            Scrap_Types, Top_Scrap, First_Entry_Date, Last_Entry_Date
+    """
+    conditions = ["b.Defects > 0"]
+    params = []
+    if date_from:
+        conditions.append("b.Last_Entry_Date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        conditions.append("b.First_Entry_Date <= ?")
+        params.append(str(date_to))
+    if product:
+        conditions.append(f"b.Product_ID = {_catalog_id('Product', '?')}")
+        params.append(product)
+    try:
+        return cached_query(
+            f"""
+            SELECT b.Batch_Number, p.Name AS Product, SUM(b.Defects) AS Defects, SUM(b.Quantity) AS Quantity,
+                   COUNT(*) AS Scrap_Types,
+                   (SELECT s.Name FROM PA_Summary_Batch t JOIN PA_DefectTypes s ON s.ID = t.Scrap_ID
+                    WHERE t.Batch_Number = b.Batch_Number AND t.Product_ID = b.Product_ID
+                    ORDER BY t.Defects DESC LIMIT 1) AS Top_Scrap,
+                   MIN(b.First_Entry_Date) AS First_Entry_Date, MAX(b.Last_Entry_Date) AS Last_Entry_Date
+            FROM PA_Summary_Batch b
+            LEFT JOIN PA_Products p ON p.ID = b.Product_ID
+            WHERE {" AND ".join(conditions)}
+            GROUP BY b.Batch_Number, b.Product_ID
+            ORDER BY Defects DESC
+            LIMIT ?
+            """,
+            params + [limit]
+        )
+    
+    except Exception as e:
+        return [], []
+
+
+def delete_archived_defects(conn, ids):
+    """
+    Delete rows that have been copied to the archive, inside the caller's write transaction
+    
+    The summaries cover archived history, so the rows are added to them once
+    more before the delete triggers take them out. Counters and the sync
+    outbox follow the live table as usual.
+    
+    Args:
+        conn: Connection with an open write transaction
+        ids (list of int): IDs of the archived rows
+    
+    Returns:
+        int: Number of rows deleted
+    """
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {ARCHIVE_BATCH_TABLE} (ID INTEGER PRIMARY KEY)")
+    conn.execute(f"DELETE FROM {ARCHIVE_BATCH_TABLE}")
+    conn.executemany(f"INSERT OR IGNORE INTO {ARCHIVE_BATCH_TABLE} (ID) VALUES (?)", [(row_id,) for row_id in ids])
+    try:
+        for statement in _summary_upserts(f"ID IN (SELECT ID FROM {ARCHIVE_BATCH_TABLE})"):
+            conn.execute(statement)
+        return conn.execute(
+            f"DELETE FROM {DATA_TABLE} WHERE ID IN (SELECT ID FROM {ARCHIVE_BATCH_TABLE})"
+        ).rowcount
+    finally:
+        conn.execute(f"DELETE FROM {ARCHIVE_BATCH_TABLE}")
+
+
+@timed()
+def get_archived_count(db_file=None):
+    """Get the number of defects moved to the Parquet archive"""
+    try:
+        rows, _ = cached_query("SELECT COALESCE(SUM(Rows), 0) FROM PA_ArchivePartitions", db_file=db_file)
+        return rows[0][0]
+    
+    except Exception as e:
+        return 0
+
+
+@timed()
+def run_backfill_step(name, chunk_size=DEFAULT_BACKFILL_CHUNK, db_file=None):
+    """
+    Apply the next chunk of a queued backfill in its own write transaction
+    
+    The chunk is the next chunk_size rows by ID (not an ID span, so gaps
+    left by archiving cost nothing). Progress is committed with the chunk,
+    and the write lock is released in between, so stations keep logging
+    while a backfill runs.
+    
+    Returns:
+        tuple: (rows done so far, rows in total, finished: bool);
+            (0, 0, True) if there is nothing queued under name
+    """
+    _, apply = BACKFILLS[name]
+    
+    def step(conn):
+        row = conn.execute(
+            "SELECT Last_ID, Target_ID, Rows_Done, Rows_Total, Finished_At FROM PA_Backfills WHERE Name = ?",
+            (name,)
+        ).fetchone()
+        if row is None:
+            return 0, 0, True
+        last_id, target_id, rows_done, rows_total, finished_at = row
+        if finished_at is not None:
+            return rows_done, rows_total, True
         
-        rows = cursor.fetchall()
+        up_to_id, rows = conn.execute(
+            f"SELECT MAX(ID), COUNT(*) FROM (SELECT ID FROM {DATA_TABLE} WHERE ID > ? AND ID <= ? ORDER BY ID LIMIT ?)",
+            (last_id, target_id, chunk_size)
+        ).fetchone()
+        if rows:
+            apply(conn, last_id, up_to_id)
+        else:
+            up_to_id = target_id
+        finished = up_to_id >= target_id
+        conn.execute(
+            "UPDATE PA_Backfills SET Last_ID = ?, Rows_Done = Rows_Done + ?, "
+            "Finished_At = CASE WHEN ? THEN CURRENT_TIMESTAMP END WHERE Name = ?",
+            (up_to_id, rows, finished, name)
+        )
+        return rows_done + rows, max(rows_total, rows_done + rows), finished
+    
+    return get_manager(db_file).write(step)
+
+
+def get_backfill_status(db_file=None):
+    """
+    Progress of every backfill ever queued, oldest first
+    
+    Returns:
+        list of dict: name, description, rows_done, rows_total, last_id,
+            target_id, queued_at, finished_at, known (False if this version
+            of the app no longer defines it)
+    """
+    try:
+        rows = get_manager(db_file).connection().execute(
+            "SELECT Name, Rows_Done, Rows_Total, Last_ID, Target_ID, Queued_At, Finished_At "
+            "FROM PA_Backfills ORDER BY Queued_At, Name"
+        ).fetchall()
+    except Exception as e:
+        return []
+    return [
+        {
+            'name': name,
+            'description': BACKFILLS[name][0] if name in BACKFILLS else "",
+            'rows_done': rows_done,
+            'rows_total': rows_total,
+            'last_id': last_id,
+            'target_id': target_id,
+            'queued_at': queued_at,
+            'finished_at': finished_at,
+            'known': name in BACKFILLS,
+        }
+        for name, rows_done, rows_total, last_id, target_id, queued_at, finished_at in rows
+    ]
+
+
+def get_schema_history(db_file=None):
+    """
+    Applied schema migrations, oldest first
+    
+    Returns:
+        list of tuple: (version, description, applied_at or None)
+    """
+    try:
+        return get_manager(db_file).connection().execute(
+            "SELECT Version, Description, Applied_At FROM PA_SchemaHistory ORDER BY Version"
+        ).fetchall()
+    except Exception as e:
+        return []
+
+
+def sql_server_literal(value):
+    """
+    Format a Python value as a T-SQL literal
+    
+    Integers and floats are emitted bare so typed columns receive numbers,
+    text is emitted as an N'' literal with embedded quotes doubled.
+    """
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    return "N'" + str(value).replace("'", "''") + "'"
+
+
+def get_export_watermark(target=SQL_SERVER_EXPORT_TARGET):
+    """Get the highest ID already exported to a target (0 if never exported)"""
+    row = get_manager().connection().execute(
+        "SELECT Last_ID FROM PA_ExportState WHERE Target = ?", (target,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def set_export_watermark(last_id, target=SQL_SERVER_EXPORT_TARGET):
+    """Record the highest ID exported to a target"""
+    get_manager().write(lambda conn: conn.execute(
+        """
+        INSERT INTO PA_ExportState (Target, Last_ID, Exported_At) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (Target) DO UPDATE SET Last_ID = excluded.Last_ID, Exported_At = excluded.Exported_At
+        """,
+        (target, last_id)
+    ))
+
+
+def iter_sql_server_export(since_id=0, batch_size=SQL_SERVER_BATCH_SIZE):
+    """
+    Stream rows with ID > since_id as multi-row SQL Server INSERT statements
+    
+    Args:
+        since_id (int): Export only rows after this ID
+        batch_size (int): Rows per INSERT statement (SQL Server allows up to 1000)
+    
+    Yields:
+        tuple: (last_id: int, statement: str) for each batch, in ID order
+    """
+    if not 1 <= batch_size <= 1000:
+        raise ValueError("batch_size must be between 1 and 1000")
+    
+    header = (
+        f"INSERT INTO {SQL_SERVER_TABLE}\n"
+        f"({', '.join(EXPORT_COLUMNS)})\n"
+        "VALUES\n"
+    )
+    conn = get_manager().connection()
+    cursor = conn.execute(
+        f"SELECT ID, {', '.join(EXPORT_COLUMNS)} FROM PA_InternalScrap WHERE ID > ? ORDER BY ID",
+        (since_id,)
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            values = ",\n".join(
+                "    (" + ", ".join(sql_server_literal(value) for value in row[1:]) + ")"
+                for row in rows
+            )
+            yield rows[-1][0], header + values + ";"
+    finally:
         cursor.close()
-        conn.close()
+
+
+@timed()
+def export_to_sql_server_format(batch_size=SQL_SERVER_BATCH_SIZE, incremental=False):
+    """
+    Export data in format ready for SQL Server import
+    Returns SQL INSERT statements, batch_size rows per statement
+    
+    Args:
+        batch_size (int): Rows per INSERT statement
+        incremental (bool): Only export rows added since the last incremental
+            export, then move the high-water mark past them
+    """
+    try:
+        since_id = get_export_watermark() if incremental else 0
         
-        # Generate SQL INSERT statements
         sql_statements = []
-        for row in rows:
-            values = ', '.join([f"'{str(v)}'" if v is not None else 'NULL' for v in row])
-            sql = f"""INSERT INTO [ict_spotfire_dev].[dbo].[PA_InternalScrap]
-            (Entry_Date, Batch_Number, Date_Code, Product, Scrap, Quantity, Signature, Notes,
-             Casting_Clock, Pinhole_Level, Exact_Time, Casting_Cavity_Number, Core_Cavity_Number,
-             Core_Clock, Shift_Class, Location)
-            VALUES ({values});"""
-            sql_statements.append(sql)
+        last_id = since_id
+        for last_id, statement in iter_sql_server_export(since_id, batch_size):
+            sql_statements.append(statement)
         
-        return '\n\n'.join(sql_statements)
+        if incremental and last_id > since_id:
+            set_export_watermark(last_id)
         
+        return '\n\n'.join(sql_statements)
+    
     except Exception as e:
         return f"-- Error generating export: {str(e)}"
 
 
+APP_QUERY_SAMPLE_FILTERS = {
+    'date_from': '2025-01-01',
+    'date_to': '2025-01-31',
+    'product': '19.N402.00',
+    'batch_number': 'B1',
+    'scrap': 'Pinholes',
+    'location': 'Inboard',
+}
+
+
+def _page_reads(filters):
+    """
+    The reads the pages make for one set of log viewer filters
+    
+    Returns:
+        list of tuple: (name, call, full_scan_allowed); call runs the read
+            the way the page does
+    """
+    # Imported here: these modules build on this one
+    from columnar_reader import read_defects_frame
+    from heatmap import HeatmapEngine
+    
+    label = ", ".join(filters) or "unfiltered"
+    date_from, date_to, product = filters.get('date_from'), filters.get('date_to'), filters.get('product')
+    last_id = get_last_defect_id()
+    reads = [
+        (f"View Logs count ({label})", lambda: count_defects(filters), False),
+        # Newest rows: LIMIT-bounded, so a scan in ID order is fine when nothing narrows it
+        (f"View Logs page ({label})", lambda: read_defects_frame(filters, limit=101), not filters),
+        (f"View Logs older page ({label})", lambda: read_defects_frame(filters, before_id=last_id // 2, limit=101), False),
+        (f"View Logs live poll ({label})",
+         lambda: read_defects_frame(filters, before_id=last_id + 1, after_id=max(0, last_id - 50)), False),
+    ]
+    if set(filters) <= {'date_from', 'date_to', 'product'}:
+        reads += [
+            (f"Home heatmap ({label})", lambda: HeatmapEngine().get(product, date_from, date_to), not filters),
+            (f"Analytics daily summary ({label})", lambda: get_daily_summary(date_from, date_to, product), False),
+            (f"Analytics top batches ({label})",
+             lambda: get_batch_summary(date_from, date_to, product, limit=25), False),
+            (f"Analytics by shift ({label})", lambda: get_shift_summary(date_from, date_to, product), False),
+        ]
+    return reads
+
+
+def _app_queries():
+    """
+    The queries the pages issue, as (name, sql, params, full_scan_allowed)
+    
+    Generated by running the pages' reads (see _page_reads) with SQL tracing
+    on, for each filter the log viewer offers and a few combinations; the
+    filter-independent reads run once. The CSV export is listed from its
+    query instead of being run, as it streams every matching row.
+    """
+    filter_sets = [{}] + [{key: value} for key, value in APP_QUERY_SAMPLE_FILTERS.items()]
+    filter_sets += [
+        {key: APP_QUERY_SAMPLE_FILTERS[key] for key in keys}
+        for keys in (('date_from', 'date_to'), ('date_from', 'date_to', 'product'), ('batch_number', 'scrap'))
+    ]
+    reads = [
+        ("Home defect count", get_defect_count, False),
+        ("Home archived count", get_archived_count, False),
+        ("Home defect types", lambda: get_catalog_names('Scrap'), False),
+        ("View Logs product options", get_defect_counts_by_product, False),
+        ("View Logs scrap options", get_defect_counts_by_scrap, False),
+        ("View Logs location options", lambda: get_catalog_names('Location'), False),
+        ("Analytics summaries watermark", lambda: cached_query(SUMMARY_PENDING_SQL), False),
+    ]
+    for filters in filter_sets:
+        reads += _page_reads(filters)
+    
+    conn = get_manager().connection()
+    statements = []
+    queries = {}
+    query_cache.clear()
+    conn.set_trace_callback(statements.append)
+    try:
+        for name, read, full_scan_allowed in reads:
+            del statements[:]
+            try:
+                read()
+            except Exception as e:
+                pass
+            for sql in statements:
+                normalized = " ".join(sql.split())
+                if normalized.upper().startswith(("SELECT", "WITH")) and normalized not in queries:
+                    queries[normalized] = (name, normalized, [], full_scan_allowed)
+    finally:
+        conn.set_trace_callback(None)
+        query_cache.clear()
+    
+    for filters in filter_sets:
+        sql, params = _export_query(filters)
+        label = ", ".join(filters) or "unfiltered"
+        queries[(sql, tuple(params))] = (f"View Logs CSV export ({label})", sql, params, not filters)
+    return list(queries.values())
+
+
+def explain_app_queries():
+    """
+    Run EXPLAIN QUERY PLAN for every query the pages issue
+    
+    A query is flagged when its plan scans PA_InternalScrap end to end and
+    it is not one of the few queries that are expected to (full exports,
+    an unfiltered heatmap, or a LIMIT-bounded scan of the newest rows).
+    
+    Returns:
+        list of dict: name, sql, plan (list of str), full_scan (bool), flagged (bool)
+    """
+    conn = get_manager().connection()
+    report = []
+    for name, sql, params, full_scan_allowed in _app_queries():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        full_scan = any(re.match(r"SCAN PA_InternalScrap(_Data)?\b", detail) for detail in plan)
+        report.append({
+            'name': name,
+            'sql': " ".join(sql.split()),
+            'plan': plan,
+            'full_scan': full_scan,
+            'flagged': full_scan and not full_scan_allowed,
+        })
+    return report
+
+
 # Alias for backwards compatibility
 DatabaseConnection = SQLiteConnection
 
@@ -241,8 +2437,13 @@ if __name__ == "__main__":
     print("\n" + "=" * 50)
     if success:
         print("✓ SUCCESS: " + message)
-        print(f"\nDatabase location: {os.path.abspath(DB_FILE)}")
+        print(f"\nDatabase location: {os.path.abspath(db.db_file)}")
         print(f"Total records: {get_defect_count()}")
+        
+        flagged = [query for query in explain_app_queries() if query['flagged']]
+        print(f"Queries scanning the full table: {len(flagged)}")
+        for query in flagged:
+            print(f"  - {query['name']}: {' | '.join(query['plan'])}")
     else:
         print("✗ FAILED: " + message)
     print("=" * 50)
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Defect Heatmap Engine
+Counts defects by clock segment x ring x defect type with NumPy, for the
+heatmap overlay on the circle diagram
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from database_sqlite import (
+    CATALOGS,
+    DATA_FILTER_CONDITIONS,
+    DATA_TABLE,
+    build_filter_clause,
+    get_manager,
+)
+
+SEGMENTS = 12                   # clock positions on the circle diagram
+DEFAULT_CACHE_SIZE = 32         # filter combinations kept in memory
+
+
+class Heatmap:
+    """
+    Defect counts for one filter, as counts[segment, ring, defect type]
+    
+    Segments 1-12 and the catalog IDs of rings and defect types index the
+    array directly. Index 0 on every axis collects rows whose value is
+    missing or out of range.
+    """
+    
+    def __init__(self, counts, rings, defect_types, last_id, table_total):
+        self.counts = counts
+        self.rings = rings                  # ring name by Ring_ID ('' at 0)
+        self.defect_types = defect_types    # defect name by Scrap_ID ('' at 0)
+        self.last_id = last_id              # highest defect ID included
+        self.table_total = table_total      # table row count when last_id was read
+    
+    def total(self):
+        """Number of defects counted"""
+        return int(self.counts.sum())
+    
+    def segment_ring(self, defect_type=None):
+        """
+        Counts per segment and ring, for one defect type or all of them
+        
+        Returns:
+            numpy.ndarray: Shape (13, number of rings + 1), indexed like counts
+        """
+        if defect_type is None:
+            return self.counts.sum(axis=2)
+        if defect_type not in self.defect_types:
+            return np.zeros(self.counts.shape[:2], dtype=self.counts.dtype)
+        return self.counts[:, :, self.defect_types.index(defect_type)]
+    
+    def hotspots(self, limit=5, defect_type=None):
+        """
+        The segment/ring cells with the most defects
+        
+        Returns:
+            list of tuple: (segment, ring, count), largest first
+        """
+        # Only cells with a known segment and ring are places on the part
+        grid = self.segment_ring(defect_type).copy()
+        grid[0, :] = 0
+        grid[:, 0] = 0
+        order = np.argsort(grid, axis=None)[::-1][:limit]
+        cells = []
+        for flat_index in order:
+            segment, ring = np.unravel_index(flat_index, grid.shape)
+            if grid[segment, ring] == 0:
+                break
+            cells.append((int(segment), self.rings[ring], int(grid[segment, ring])))
+        return cells
+    
+    def overlay(self, defect_type=None):
+        """
+        Payload for the circle diagram's heatmap overlay
+        
+        Returns:
+            dict: rings (names), cells (segment 1-12 x ring counts), max
+        """
+        grid = self.segment_ring(defect_type)[1:SEGMENTS + 1, 1:]
+        return {
+            'rings': self.rings[1:],
+            'cells': grid.tolist(),
+            'max': int(grid.max()) if grid.size else 0,
+        }
+
+
+class HeatmapEngine:
+    """
+    Builds Heatmaps and keeps the most recently used ones up to date
+    
+    A cached heatmap remembers the highest defect ID it has counted. On the
+    next request only rows above that ID are aggregated and added, unless
+    the table has shrunk in the meantime (a delete), in which case it is
+    rebuilt. Cached heatmaps are never modified in place, so one can be
+    shared between sessions.
+    """
+    
+    def __init__(self, db_file=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.db_file = db_file
+        self.cache_size = cache_size
+        self._cache = OrderedDict()     # (product, date_from, date_to) -> Heatmap
+        self._lock = threading.Lock()
+    
+    def get(self, product=None, date_from=None, date_to=None):
+        """
+        Get the heatmap for a product and Entry_Date range (None = all)
+        
+        Returns:
+            Heatmap
+        """
+        filters = {'product': product, 'date_from': date_from, 'date_to': date_to}
+        key = tuple(str(value) if value else None for value in filters.values())
+        with self._lock:
+            cached = self._cache.get(key)
+        
+        # One read transaction, so the watermark, the row count and the
+        # aggregated rows all come from the same snapshot
+        with get_manager(self.db_file).transaction() as conn:
+            last_id, table_total = conn.execute(
+                f"SELECT COALESCE(MAX(ID), 0), "
+                f"(SELECT Total FROM PA_InternalScrap_Counters WHERE Dimension = 'total' AND Key = '') "
+                f"FROM {DATA_TABLE}"
+            ).fetchone()
+            table_total = table_total or 0
+            
+            if cached is not None and cached.last_id == last_id and cached.table_total == table_total:
+                heatmap = cached
+            else:
+                rings = self._labels(conn, 'Core_Clock')
+                defect_types = self._labels(conn, 'Scrap')
+                counts = None
+                since_id = 0
+                if cached is not None and cached.last_id < last_id:
+                    added = conn.execute(
+                        f"SELECT COUNT(*) FROM {DATA_TABLE} WHERE ID > ?", (cached.last_id,)
+                    ).fetchone()[0]
+                    if cached.table_total + added == table_total:
+                        counts = cached.counts.copy()
+                        since_id = cached.last_id
+                
+                if counts is None:
+                    counts = np.zeros((SEGMENTS + 1, len(rings), len(defect_types)), dtype=np.int64)
+                counts = self._add_rows(conn, counts, filters, since_id, last_id, len(rings), len(defect_types))
+                heatmap = Heatmap(counts, rings, defect_types, last_id, table_total)
+        
+        with self._lock:
+            self._cache[key] = heatmap
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return heatmap
+    
+    def clear(self):
+        """Drop every cached heatmap"""
+        with self._lock:
+            self._cache.clear()
+    
+    def _labels(self, conn, column):
+        table, _ = CATALOGS[column]
+        rows = conn.execute(f"SELECT ID, Name FROM {table}").fetchall()
+        labels = [''] * (max((row[0] for row in rows), default=0) + 1)
+        for catalog_id, name in rows:
+            labels[catalog_id] = name
+        return labels
+    
+    def _add_rows(self, conn, counts, filters, since_id, last_id, ring_count, defect_count):
+        where, params = build_filter_clause(filters, DATA_FILTER_CONDITIONS)
+        where = f"{where} AND ID > ? AND ID <= ?" if where else "WHERE ID > ? AND ID <= ?"
+        rows = conn.execute(
+            f"""
+            SELECT CAST(COALESCE(Casting_Clock, 0) AS INTEGER), COALESCE(Ring_ID, 0),
+                   COALESCE(Scrap_ID, 0), COUNT(*)
+            FROM {DATA_TABLE} {where}
+            GROUP BY 1, 2, 3
+            """,
+            params + [since_id, last_id]
+        ).fetchall()
+        if not rows:
+            return counts
+        
+        cells = np.array(rows, dtype=np.int64)
+        segments, rings, defects, totals = cells.T
+        segments[(segments < 1) | (segments > SEGMENTS)] = 0
+        
+        # Catalogs only grow; widen the array if a new ring or defect type appeared
+        shape = (SEGMENTS + 1, max(ring_count, counts.shape[1]), max(defect_count, counts.shape[2]))
+        if shape != counts.shape:
+            counts = np.pad(counts, [(0, new - old) for new, old in zip(shape, counts.shape)])
+        np.add.at(counts, (segments, rings, defects), totals)
+        return counts
@@ -0,0 +1,211 @@
+"""
+Lightweight Instrumentation
+Timing histograms, counters and a slow-operation log for the database layer
+and the Home page. Off unless SCRAP_METRICS=1 (or enabled from the Admin
+page); while off, an instrumented call costs one flag check.
+"""
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from settings import get_setting
+
+METRICS_ENV = "SCRAP_METRICS"
+SLOW_MS_ENV = "SCRAP_SLOW_MS"
+
+DEFAULT_SLOW_MS = 250.0         # operations at least this slow are logged
+SLOW_LOG_SIZE = 100             # most recent slow operations kept
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Counts of durations per bucket, with count, sum and max"""
+    
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def add(self, ms):
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+    
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile (capped at max)"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, bucket_count in zip(BUCKETS_MS, self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+    
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms,
+            'total_ms': self.total_ms,
+            'buckets': dict(zip([str(bound) for bound in BUCKETS_MS] + ['inf'], self.buckets)),
+        }
+
+
+class _Phase:
+    """Context manager timing one block into a Metrics timer"""
+    
+    __slots__ = ('metrics', 'name', 'detail', 'start')
+    
+    def __init__(self, metrics, name, detail):
+        self.metrics = metrics
+        self.name = name
+        self.detail = detail
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.name, time.perf_counter() - self.start, self.detail)
+        if exc_type is not None:
+            self.metrics.count(f"{self.name}.error")
+        return False
+
+
+class _NoPhase:
+    """Stand-in for _Phase while metrics are off"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class Metrics:
+    """
+    Process-wide registry of timers and counters
+    
+    Timers are named after the function or phase they measure ("db.write.commit",
+    "log_defect_to_database", "home.script"); anything that takes slow_ms or
+    longer is also appended to the slow log and logged as a warning.
+    """
+    
+    def __init__(self, enabled=False, slow_ms=DEFAULT_SLOW_MS):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def record(self, name, seconds, detail=None):
+        """Add one duration to a timer"""
+        ms = seconds * 1000
+        with self._lock:
+            histogram = self._timers.get(name)
+            if histogram is None:
+                histogram = self._timers[name] = Histogram()
+            histogram.add(ms)
+            if ms >= self.slow_ms:
+                self._slow.append({
+                    'name': name,
+                    'ms': ms,
+                    'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'thread': threading.current_thread().name,
+                    'detail': detail,
+                })
+        if ms >= self.slow_ms:
+            logger.warning("Slow %s: %.1f ms%s", name, ms, f" ({detail})" if detail else "")
+    
+    def count(self, name, amount=1):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+    
+    def phase(self, name, detail=None):
+        """
+        Time a block: with metrics.phase("db.write.commit"): ...
+        
+        Args:
+            name (str): Timer name
+            detail (str): Shown in the slow log if the block is slow (e.g. the SQL)
+        """
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name, detail)
+    
+    def timed(self, name=None):
+        """Decorator timing every call of a function (timer name defaults to the function name)"""
+        def decorate(func):
+            label = name or func.__name__
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Phase(self, label, None):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+    
+    def snapshot(self):
+        """
+        Everything recorded so far
+        
+        Returns:
+            dict: enabled, slow_ms, since, timers (name -> histogram dict),
+                counters, slow (most recent last)
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'slow_ms': self.slow_ms,
+                'since': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._since)),
+                'timers': {name: histogram.to_dict() for name, histogram in sorted(self._timers.items())},
+                'counters': dict(sorted(self._counters.items())),
+                'slow': list(self._slow),
+            }
+    
+    def dump_json(self, path=None):
+        """Return the snapshot as JSON, also writing it to path if given"""
+        text = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+    
+    def reset(self):
+        """Forget all timers, counters and slow entries"""
+        with self._lock:
+            self._timers = {}
+            self._counters = {}
+            self._slow = deque(maxlen=SLOW_LOG_SIZE)
+            self._since = time.time()
+
+
+metrics = Metrics(
+    enabled=get_setting(METRICS_ENV, False),
+    slow_ms=get_setting(SLOW_MS_ENV, DEFAULT_SLOW_MS),
+)
+timed = metrics.timed
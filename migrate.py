@@ -0,0 +1,165 @@
+"""
+Schema Migrations and Backfills
+Schema changes are applied by the connection manager when a database is
+first opened (see MIGRATIONS in database_sqlite). Data changes that touch
+every existing row are queued as backfills instead and worked through
+here, a chunk per short transaction, so logging carries on during an
+upgrade and an interrupted backfill picks up where it stopped.
+
+Usage:
+    python migrate.py status [--db defect_logs.db]
+    python migrate.py run [--db defect_logs.db] [--chunk-size 2000] [--pause 0.05]
+"""
+import argparse
+import atexit
+import threading
+import time
+import traceback
+
+from database_sqlite import (
+    DEFAULT_BACKFILL_CHUNK,
+    SCHEMA_VERSION,
+    close_connections,
+    configure,
+    get_backfill_status,
+    get_manager,
+    get_schema_history,
+    run_backfill_step,
+)
+
+DEFAULT_PAUSE = 0.05            # seconds between chunks, so waiting writers get the lock
+
+
+def pending_backfills(db_file=None):
+    """Names of the queued backfills that are not finished and still defined"""
+    return [status['name'] for status in get_backfill_status(db_file)
+            if status['finished_at'] is None and status['known']]
+
+
+def run_backfills(chunk_size=DEFAULT_BACKFILL_CHUNK, pause=DEFAULT_PAUSE, progress=None, stop_event=None,
+                  db_file=None):
+    """
+    Run every pending backfill to completion, oldest first
+    
+    Args:
+        chunk_size (int): Rows per transaction
+        pause (float): Seconds to sleep between chunks
+        progress (callable): Called as progress(name, rows_done, rows_total) after each chunk
+        stop_event (threading.Event): Stop (resumably) after the current chunk once set
+        db_file (str): SQLite database (default: the configured one)
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        finished = []
+        for name in pending_backfills(db_file):
+            done = False
+            while not done:
+                if stop_event is not None and stop_event.is_set():
+                    return True, f"Stopped; {len(finished)} backfill(s) finished, the rest will resume"
+                rows_done, rows_total, done = run_backfill_step(name, chunk_size, db_file)
+                if progress:
+                    progress(name, rows_done, rows_total)
+                if not done and pause:
+                    time.sleep(pause)
+            finished.append(name)
+        if not finished:
+            return True, "No backfills pending"
+        return True, f"{len(finished)} backfill(s) finished: {', '.join(finished)}"
+    
+    except Exception as e:
+        return False, f"Backfill failed (progress is kept, run again to resume): {str(e)}"
+
+
+class BackfillWorker:
+    """Runs pending backfills on a background thread, then exits"""
+    
+    def __init__(self, db_file=None, chunk_size=DEFAULT_BACKFILL_CHUNK, pause=DEFAULT_PAUSE):
+        self.db_file = db_file
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.result = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the background thread (no-op if already running)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="defect-backfill", daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self, timeout=10.0):
+        """Stop after the current chunk"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def _run(self):
+        try:
+            self.result = run_backfills(self.chunk_size, self.pause, stop_event=self._stop, db_file=self.db_file)
+            if not self.result[0]:
+                self.last_error = self.result[1]
+        except Exception:
+            self.last_error = traceback.format_exc()
+
+
+def start_backfill_worker(**worker_options):
+    """
+    Start a BackfillWorker if any backfill is pending
+    
+    Returns:
+        BackfillWorker or None: None when there is nothing to do
+    """
+    if not pending_backfills(worker_options.get('db_file')):
+        return None
+    worker = BackfillWorker(**worker_options).start()
+    atexit.register(worker.stop)
+    return worker
+
+
+def print_status(db_file=None):
+    print(f"Schema version {get_manager(db_file).connection().execute('PRAGMA user_version').fetchone()[0]}"
+          f" (this app: {SCHEMA_VERSION})")
+    for version, description, applied_at in get_schema_history(db_file):
+        print(f"  {version:>3}  {description:<45} {applied_at or '-'}")
+    statuses = get_backfill_status(db_file)
+    print("Backfills" if statuses else "No backfills queued")
+    for status in statuses:
+        state = ("done " + status['finished_at'] if status['finished_at']
+                 else "unknown to this app" if not status['known']
+                 else f"{status['rows_done'] / max(1, status['rows_total']):.0%}")
+        print(f"  {status['name']:<30} {status['rows_done']:>10,} / {status['rows_total']:<10,} {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['status', 'run'])
+    parser.add_argument('--db', help='database file (default: defect_logs.db)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_BACKFILL_CHUNK)
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE)
+    args = parser.parse_args()
+    
+    if args.db:
+        configure(args.db)
+    if args.command == 'status':
+        print_status()
+    else:
+        def progress(name, rows_done, rows_total):
+            print(f"\r{name}: {rows_done:,} / {rows_total:,} rows", end="", flush=True)
+        success, message = run_backfills(args.chunk_size, args.pause, progress)
+        print()
+        print(message)
+        if not success:
+            raise SystemExit(1)
+    close_connections()
+
+
+if __name__ == "__main__":
+    main()
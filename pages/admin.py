@@ -0,0 +1,117 @@
+import json
+import os
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from app_resources import get_backfill_worker, get_page_css
+from database_sqlite import SCHEMA_VERSION, get_backfill_status, get_manager, get_schema_history, query_cache
+from metrics import METRICS_ENV, metrics
+
+st.set_page_config(
+    page_title="Admin | Brembo QC",
+    page_icon="⚙️",
+    layout="wide"
+)
+
+st.markdown(get_page_css(), unsafe_allow_html=True)
+
+# Header
+st.markdown("""
+<div class="main-header">
+    <div class="company-name">BREMBO</div>
+    <h1>Admin</h1>
+    <p>Database and Page Timings</p>
+</div>
+""", unsafe_allow_html=True)
+
+# Navigation
+if st.button("⬅️ Back to Home"):
+    st.switch_page("Home.py")
+
+# Settings apply to the whole server process, not just this session
+col1, col2, col3 = st.columns([1, 1, 2])
+with col1:
+    metrics.enabled = st.toggle("Collect metrics", value=metrics.enabled,
+                                help=f"Starts on when {METRICS_ENV}=1 is set")
+with col2:
+    metrics.slow_ms = st.number_input("Slow threshold (ms)", min_value=1.0, value=float(metrics.slow_ms), step=50.0)
+with col3:
+    if st.button("🗑️ Reset metrics"):
+        metrics.reset()
+        query_cache.hits = query_cache.misses = 0
+
+snapshot = metrics.snapshot()
+manager = get_manager()
+st.caption(f"Collected since {snapshot['since']} by process {os.getpid()} · database {os.path.abspath(manager.db_file)} · "
+           f"{'shared with other server processes' if manager.multi_process else 'single server process'}")
+
+# Timers: one row per function or phase, slowest total first
+st.subheader("Timings")
+timers = pd.DataFrame([
+    {'Name': name, **{key: value for key, value in timer.items() if key != 'buckets'}}
+    for name, timer in snapshot['timers'].items()
+])
+if timers.empty:
+    st.info("Nothing recorded yet" if metrics.enabled else "Metrics are off")
+else:
+    timers = timers.sort_values('total_ms', ascending=False)
+    st.dataframe(timers, use_container_width=True, hide_index=True,
+                 column_config={column: st.column_config.NumberColumn(format="%.2f")
+                                for column in timers.columns if column.endswith('_ms')})
+    
+    name = st.selectbox("Histogram", options=timers['Name'])
+    buckets = pd.Series(snapshot['timers'][name]['buckets'], name='Calls')
+    buckets.index = [f"≤ {bound} ms" if bound != 'inf' else "slower" for bound in buckets.index]
+    st.bar_chart(buckets[buckets.cumsum() > 0])
+
+col1, col2 = st.columns(2)
+
+with col1:
+    st.subheader("Counters")
+    if snapshot['counters']:
+        st.dataframe(pd.Series(snapshot['counters'], name='Count'), use_container_width=True)
+    else:
+        st.info("No counters yet")
+
+with col2:
+    st.subheader("Query cache")
+    cache = query_cache.stats()
+    metric1, metric2, metric3 = st.columns(3)
+    lookups = cache['hits'] + cache['misses']
+    metric1.metric("Hit rate", f"{cache['hits'] / lookups:.0%}" if lookups else "-")
+    metric2.metric("Entries", f"{cache['entries']:,}")
+    metric3.metric("Size", f"{cache['bytes'] / (1024 * 1024):.1f} MB")
+
+st.subheader("Slow operations")
+if snapshot['slow']:
+    st.dataframe(pd.DataFrame(reversed(snapshot['slow'])), use_container_width=True, hide_index=True)
+else:
+    st.info(f"Nothing took {metrics.slow_ms:g} ms or longer")
+
+# Schema upgrades: applied migrations and the progress of their data backfills
+st.subheader("Schema")
+history = get_schema_history()
+st.caption(f"Schema version {history[-1][0] if history else '?'} (this app: {SCHEMA_VERSION})")
+backfills = get_backfill_status()
+worker = get_backfill_worker()
+for backfill in backfills:
+    if backfill['finished_at']:
+        label = f"{backfill['name']}: done {backfill['finished_at']}"
+    elif not backfill['known']:
+        label = f"{backfill['name']}: not defined in this version of the app"
+    else:
+        label = f"{backfill['name']}: {backfill['rows_done']:,} / {backfill['rows_total']:,} rows"
+    st.progress(min(1.0, backfill['rows_done'] / max(1, backfill['rows_total'])), text=label)
+if worker and worker.last_error:
+    st.error(f"Backfill stopped: {worker.last_error}")
+with st.expander("Migration history"):
+    st.dataframe(pd.DataFrame(history, columns=['Version', 'Description', 'Applied At']),
+                 use_container_width=True, hide_index=True)
+
+snapshot['query_cache'] = query_cache.stats()
+st.download_button(
+    "📥 Download JSON",
+    data=json.dumps(snapshot, indent=2),
+    file_name=f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+    mime="application/json"
+)
@@ -0,0 +1,105 @@
+import streamlit as st
+import pandas as pd
+from datetime import date, timedelta
+from app_resources import get_page_css
+from database_sqlite import (
+    get_batch_summary,
+    get_daily_summary,
+    get_defect_counts_by_product,
+    get_shift_summary,
+    refresh_defect_summaries,
+)
+
+st.set_page_config(
+    page_title="Analytics | Brembo QC",
+    page_icon="📈",
+    layout="wide"
+)
+
+st.markdown(get_page_css(), unsafe_allow_html=True)
+
+# Header
+st.markdown("""
+<div class="main-header">
+    <div class="company-name">BREMBO</div>
+    <h1>Scrap Analytics</h1>
+    <p>Daily and Batch Summaries</p>
+</div>
+""", unsafe_allow_html=True)
+
+# Navigation
+if st.button("⬅️ Back to Home"):
+    st.switch_page("Home.py")
+
+# Bring the summaries up to date; only rows logged since the last visit are read, and
+# nothing is written when there are none. On failure the last refresh is shown.
+try:
+    refresh_defect_summaries()
+except Exception as e:
+    st.warning(f"⚠️ Summaries could not be updated, showing the last refresh: {e}")
+
+col1, col2 = st.columns([2, 3])
+
+with col1:
+    date_range = st.date_input(
+        "Entry Date",
+        value=(date.today() - timedelta(days=30), date.today()),
+        help="Pick a start and end date"
+    )
+
+with col2:
+    product = st.selectbox("Product", options=[""] + sorted(get_defect_counts_by_product()))
+
+date_from = date_range[0] if len(date_range) > 0 else None
+date_to = date_range[1] if len(date_range) > 1 else None
+
+rows, columns = get_daily_summary(date_from, date_to, product or None)
+daily = pd.DataFrame(rows, columns=columns)
+
+if daily.empty:
+    st.info("No defects logged for this selection")
+    st.stop()
+
+daily[['Scrap', 'Location']] = daily[['Scrap', 'Location']].fillna("Unknown")
+
+# Headline numbers
+total = int(daily['Defects'].sum())
+days = daily['Entry_Date'].nunique()
+by_scrap = daily.groupby('Scrap')['Defects'].sum().sort_values(ascending=False)
+
+metric1, metric2, metric3, metric4 = st.columns(4)
+metric1.metric("Defects", f"{total:,}")
+metric2.metric("Days with defects", days)
+metric3.metric("Defects per day", f"{total / days:,.1f}")
+metric4.metric("Top scrap", by_scrap.index[0], f"{by_scrap.iloc[0] / total:.0%} of defects")
+
+st.markdown("---")
+
+# Daily trend, stacked by scrap type
+st.subheader("Defects per day")
+trend = daily.pivot_table(index='Entry_Date', columns='Scrap', values='Defects', aggfunc='sum', fill_value=0)
+st.bar_chart(trend)
+
+col1, col2 = st.columns(2)
+
+with col1:
+    st.subheader("By scrap type")
+    st.bar_chart(by_scrap)
+
+with col2:
+    st.subheader("By location")
+    st.bar_chart(daily.groupby('Location')['Defects'].sum())
+
+# Shift of each defect from its Exact_Time (shift 3 is the night shift)
+st.subheader("By shift")
+rows, columns = get_shift_summary(date_from, date_to, product or None)
+shifts = pd.DataFrame(rows, columns=columns)
+if not shifts.empty:
+    shifts['Shift'] = "Shift " + shifts['Shift'].astype('Int64').astype(str)
+    st.bar_chart(shifts.pivot_table(index='Entry_Date', columns='Shift', values='Defects',
+                                    aggfunc='sum', fill_value=0))
+
+# Batches with the most defects in the period
+st.subheader("Top batches")
+rows, columns = get_batch_summary(date_from, date_to, product or None, limit=25)
+st.dataframe(pd.DataFrame(rows, columns=columns), use_container_width=True, hide_index=True)
@@ -1,7 +1,21 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
+import io
+import tempfile
 from datetime import datetime
+from app_resources import get_page_css
+from columnar_reader import concat_defects_frames, read_defects_frame
+from database_sqlite import (
+    count_defects,
+    get_defect_counts_by_product,
+    get_catalog_names,
+    get_defect_counts_by_scrap,
+    get_last_defect_id,
+    write_defects_csv,
+)
+
+PAGE_SIZES = [50, 100, 250, 500]
+LIVE_ROWS = 500             # newest rows kept on screen in live mode
+LIVE_INTERVAL = 5           # seconds between live polls
 
 st.set_page_config(
     page_title="View Logs | Brembo QC",
@@ -9,128 +23,7 @@ st.set_page_config(
     layout="wide"
 )
 
-st.markdown("""
-<style>
-    /* Main app background */
-    .stApp {
-        background: linear-gradient(135deg, #1e293b 0%, #334155 100%);
-    }
-    
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    
-    /* Header */
-    .main-header {
-        background: linear-gradient(135deg, #1a1a1a 0%, #2d2d2d 50%, #1a1a1a 100%);
-        padding: 30px 40px;
-        border-radius: 0;
-        margin: -80px -80px 40px -80px;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.4);
-        border-bottom: 4px solid #dc2626;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .main-header::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 100%;
-        background: linear-gradient(90deg, transparent 0%, rgba(220, 38, 38, 0.1) 50%, transparent 100%);
-        animation: shine 3s infinite;
-    }
-    
-    @keyframes shine {
-        0%, 100% { transform: translateX(-100%); }
-        50% { transform: translateX(100%); }
-    }
-    
-    .company-name {
-        color: #dc2626;
-        font-size: 18px;
-        font-weight: 900;
-        letter-spacing: 4px;
-        margin-bottom: 8px;
-        text-transform: uppercase;
-    }
-    
-    .main-header h1 {
-        color: white;
-        font-size: 36px;
-        font-weight: 800;
-        margin: 0;
-        letter-spacing: -1px;
-        text-transform: uppercase;
-    }
-    
-    .main-header p {
-        color: rgba(255, 255, 255, 0.7);
-        font-size: 13px;
-        margin: 8px 0 0 0;
-        letter-spacing: 1px;
-        text-transform: uppercase;
-        font-weight: 500;
-    }
-    
-    /* Data frame */
-    .stDataFrame {
-        background: white;
-        border-radius: 12px;
-        padding: 20px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Download button */
-    .stDownloadButton > button {
-        background: linear-gradient(135deg, #10b981 0%, #059669 100%) !important;
-        color: white !important;
-        border: none !important;
-        border-radius: 8px !important;
-        padding: 12px 24px !important;
-        font-weight: 600 !important;
-        font-size: 14px !important;
-        box-shadow: 0 4px 12px rgba(16, 185, 129, 0.3) !important;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    .stDownloadButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(16, 185, 129, 0.4) !important;
-    }
-    
-    /* Success/Info messages */
-    .stSuccess, .stInfo, .stError {
-        border-radius: 10px !important;
-        font-weight: 500 !important;
-        border: none !important;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1) !important;
-    }
-    
-    /* Record count */
-    .record-count {
-        background: rgba(255, 255, 255, 0.1);
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        padding: 15px 25px;
-        border-radius: 10px;
-        color: white;
-        text-align: center;
-        margin: 20px 0;
-        font-size: 16px;
-        font-weight: 600;
-    }
-    
-    .record-count .number {
-        color: #fbbf24;
-        font-weight: 700;
-        font-size: 24px;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(get_page_css(), unsafe_allow_html=True)
 
 # Header
 st.markdown("""
@@ -145,15 +38,101 @@ st.markdown("""
 if st.button("⬅️ Back to Home"):
     st.switch_page("Home.py")
 
-# Connect to database
+# Filters (applied in SQL, not on a loaded DataFrame)
+col1, col2, col3, col4, col5 = st.columns(5)
+
+with col1:
+    date_range = st.date_input("Entry Date", value=(), help="Pick a start and end date")
+
+with col2:
+    product = st.selectbox("Product", options=[""] + sorted(get_defect_counts_by_product()))
+
+with col3:
+    batch_number = st.text_input("Batch Number").strip()
+
+with col4:
+    scrap = st.selectbox("Scrap", options=[""] + sorted(get_defect_counts_by_scrap()))
+
+with col5:
+    location = st.selectbox("Location", options=[""] + get_catalog_names('Location'))
+
+filters = {
+    'date_from': date_range[0] if len(date_range) > 0 else None,
+    'date_to': date_range[1] if len(date_range) > 1 else None,
+    'product': product,
+    'batch_number': batch_number,
+    'scrap': scrap,
+    'location': location,
+}
+
+live = st.toggle("🔴 Live", help=f"Show new defects as they are logged (checked every {LIVE_INTERVAL} s)")
+
+page_size = st.session_state.get('log_page_size', PAGE_SIZES[1])
+
+# Keyset pagination state: a stack of the "before ID" cursors of earlier pages.
+# Changing any filter or the page size starts again from the newest row.
+filter_key = repr((sorted(filters.items()), page_size))
+if st.session_state.get('log_filter_key') != filter_key:
+    st.session_state.log_filter_key = filter_key
+    st.session_state.log_cursors = [None]
+
+
+@st.fragment(run_every=LIVE_INTERVAL)
+def live_tail(filters, filter_key):
+    """Newest matching rows, topped up with rows logged since the last poll"""
+    # Rows up to last_id are on screen; only the ID range after it is read,
+    # so a poll costs as much as the rows logged since the previous one
+    last_id = get_last_defect_id()
+    if st.session_state.get('live_filter_key') != filter_key:
+        st.session_state.live_filter_key = filter_key
+        st.session_state.live_frame = read_defects_frame(filters, before_id=last_id + 1, limit=LIVE_ROWS)
+        st.session_state.live_total = count_defects(filters)
+        new_rows = 0
+    elif last_id > st.session_state.live_last_id:
+        new = read_defects_frame(filters, before_id=last_id + 1, after_id=st.session_state.live_last_id)
+        new_rows = len(new)
+        if new_rows:
+            # The total moves by the rows read instead of being counted again
+            st.session_state.live_total += new_rows
+            new = concat_defects_frames([new, st.session_state.live_frame])
+            st.session_state.live_frame = new.head(LIVE_ROWS)
+    else:
+        new_rows = 0
+    st.session_state.live_last_id = last_id
+    
+    frame = st.session_state.live_frame
+    total = st.session_state.live_total
+    st.success(
+        f"🔴 Live | {total:,} matching records | newest {len(frame):,} shown | "
+        f"updated {datetime.now().strftime('%H:%M:%S')}" + (f" | {new_rows:,} new" if new_rows else "")
+    )
+    st.dataframe(frame, use_container_width=True, height=600)
+
+
+if live:
+    live_tail(filters, filter_key)
+    st.stop()
+else:
+    # Turning live mode back on starts from a fresh read
+    st.session_state.pop('live_filter_key', None)
+
 try:
-    conn = sqlite3.connect('defect_logs.db')
-    
-    # Get all defects
-    df = pd.read_sql_query("SELECT * FROM PA_InternalScrap ORDER BY ID DESC", conn)
-    
-    if len(df) > 0:
-        st.success(f"✅ Successfully loaded {len(df):,} records from database")
+    total = count_defects(filters)
+    # Typed columns straight from SQLite; one extra row tells whether another page follows
+    df = read_defects_frame(
+        filters,
+        before_id=st.session_state.log_cursors[-1],
+        limit=page_size + 1
+    )
+    next_before_id = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        next_before_id = int(df['ID'].iloc[-1])
+    
+    if total > 0:
+        page_number = len(st.session_state.log_cursors)
+        page_count = max(1, -(-total // page_size))
+        st.success(f"✅ {total:,} matching records | Page {page_number:,} of {page_count:,}")
         
         # Display table
         st.dataframe(
@@ -162,20 +141,49 @@ try:
             height=600
         )
         
-        # Download as CSV
-        csv = df.to_csv(index=False)
+        nav1, nav2, nav3 = st.columns([1, 1, 4])
+        with nav1:
+            if st.button("◀ Newer", disabled=page_number == 1, use_container_width=True):
+                st.session_state.log_cursors.pop()
+                st.rerun()
+        with nav2:
+            if st.button("Older ▶", disabled=next_before_id is None, use_container_width=True):
+                st.session_state.log_cursors.append(next_before_id)
+                st.rerun()
+        with nav3:
+            st.selectbox("Rows per page", options=PAGE_SIZES, index=1, key='log_page_size')
+        
+        # Download as CSV: built only when clicked, streamed from SQLite into a
+        # temporary file chunk by chunk instead of through a DataFrame. The open
+        # file itself is returned (unbuffered, which download_button reads as a
+        # raw stream), so the only copy in memory is the one Streamlit serves.
+        # The file is deleted as soon as Streamlit drops it.
+        def build_csv():
+            export_file = tempfile.TemporaryFile(buffering=0)
+            try:
+                text = io.TextIOWrapper(io.BufferedWriter(export_file), encoding="utf-8", newline="")
+                write_defects_csv(text, filters)
+                text.flush()
+                text.detach().detach()
+                export_file.seek(0)
+            except Exception:
+                export_file.close()
+                raise
+            return export_file
+        
+        filtered = any(value for value in filters.values())
         st.download_button(
-            label="📥 Download All Data (CSV)",
-            data=csv,
+            label="📥 Download Filtered Data (CSV)" if filtered else "📥 Download All Data (CSV)",
+            data=build_csv,
             file_name=f"brembo_defects_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
             mime="text/csv"
         )
-        
+    
+    elif any(value for value in filters.values()):
+        st.info("ℹ️ No defects match the current filters.")
     else:
         st.info("ℹ️ No defects have been logged yet. Start logging defects on the Home page!")
-    
-    conn.close()
-    
+
 except Exception as e:
     st.error(f"❌ Database Error: {e}")
     st.info("💡 Make sure you've logged at least one defect on the Home page first.")
\ No newline at end of file
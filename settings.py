@@ -0,0 +1,83 @@
+"""
+Deployment Settings
+Every SCRAP_* setting can be given as an environment variable or in the
+TOML file named by SCRAP_CONFIG, under the variable's name without the
+prefix, in lower case (SCRAP_DB_FILE -> db_file). Environment variables
+win, so one config file can be shared by several server processes and
+overridden per process.
+
+Example (scrap.toml):
+    db_file = "/srv/qc/defect_logs.db"    # relative paths are relative to this file
+    multi_process = true
+    pragma_busy_timeout = 10000
+    write_mode = "write_behind"
+"""
+import os
+
+# Path to the TOML settings file
+CONFIG_ENV = "SCRAP_CONFIG"
+ENV_PREFIX = "SCRAP_"
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+_config_cache = {}      # path -> settings read from it
+
+
+def _file_key(env_name):
+    return env_name[len(ENV_PREFIX):].lower() if env_name.startswith(ENV_PREFIX) else env_name.lower()
+
+
+def load_config_file(path):
+    """
+    Read a TOML settings file (once per process)
+    
+    Returns:
+        dict: Setting name -> value, with relative *_file and *_dir paths
+            made absolute against the file's directory
+    """
+    path = os.path.abspath(path)
+    if path not in _config_cache:
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuntimeError("Reading a settings file needs Python 3.11+ or: pip install tomli")
+        with open(path, 'rb') as f:
+            settings = tomllib.load(f)
+        base_dir = os.path.dirname(path)
+        for key, value in settings.items():
+            if key.endswith(('_file', '_dir')) and isinstance(value, str):
+                settings[key] = os.path.join(base_dir, os.path.expanduser(value))
+        _config_cache[path] = settings
+    return _config_cache[path]
+
+
+def _convert(value, default):
+    """Coerce value to the type of default (environment values are strings)"""
+    if default is None or isinstance(value, type(default)):
+        return value
+    if isinstance(default, bool):
+        return str(value).strip().lower() in TRUE_VALUES
+    return type(default)(value)
+
+
+def get_setting(env_name, default=None):
+    """
+    Look up a setting: environment variable, then settings file, then default
+    
+    Args:
+        env_name (str): Environment variable, e.g. "SCRAP_DB_FILE"
+        default: Returned when the setting is not given; its type is also
+            the type the value is converted to
+    """
+    value = os.environ.get(env_name)
+    if value is None:
+        config_file = os.environ.get(CONFIG_ENV)
+        if not config_file:
+            return default
+        value = load_config_file(config_file).get(_file_key(env_name))
+        if value is None:
+            return default
+    return _convert(value, default)
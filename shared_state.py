@@ -0,0 +1,133 @@
+"""
+Cross-Process Coordination
+For several server processes sharing one database file: file locks so only
+one process writes (or runs the sync worker) at a time, and a generation
+counter in a small memory-mapped file, so each process's query cache
+notices the writes made by the others.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+    import msvcrt
+
+_COUNTER = struct.Struct('<Q')
+
+
+def state_file(db_file, name):
+    """Path of a coordination file kept next to the database, e.g. defect_logs.db-writer.lock"""
+    return f"{os.path.abspath(db_file)}-{name}"
+
+
+def _lock_fd(fd, blocking):
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    # msvcrt's own blocking mode gives up after 10 seconds, so poll instead
+    delay = 0.001
+    while True:
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def _unlock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    Exclusive lock held by one thread of one process at a time
+    
+    Threads of the same process queue on a threading.Lock first, so only
+    one of them waits on the file. The operating system releases the file
+    lock when its process exits, so a crashed server never leaves it held.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    
+    def acquire(self, blocking=True):
+        """
+        Take the lock
+        
+        Returns:
+            bool: False if blocking is False and another thread or process holds it
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            locked = _lock_fd(self._fd, blocking)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        if not locked:
+            self._thread_lock.release()
+        return locked
+    
+    def release(self):
+        _unlock_fd(self._fd)
+        self._thread_lock.release()
+    
+    def close(self):
+        os.close(self._fd)
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class SharedCounter:
+    """
+    Unsigned 64-bit counter in a memory-mapped file
+    
+    Reading it costs about as much as reading an attribute. Increments are
+    not atomic on their own: only call increment() while holding the lock
+    that serializes the writers.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size < _COUNTER.size:
+                os.ftruncate(fd, _COUNTER.size)
+            self._map = mmap.mmap(fd, _COUNTER.size)
+        finally:
+            os.close(fd)
+    
+    def value(self):
+        return _COUNTER.unpack_from(self._map)[0]
+    
+    def increment(self):
+        value = self.value() + 1
+        _COUNTER.pack_into(self._map, 0, value)
+        return value
+    
+    def close(self):
+        self._map.close()
@@ -0,0 +1,365 @@
+"""
+Background Sync Engine
+Pushes locally logged defects to the remote database in batches, off the
+Streamlit request thread, so logging never waits on the network
+"""
+import atexit
+import sqlite3
+import threading
+import time
+import traceback
+
+from database_sqlite import EXPORT_COLUMNS, SQL_SERVER_TABLE, get_defect_count, get_manager
+from settings import get_setting
+from shared_state import FileLock, state_file
+
+# Environment variable naming the sync target, e.g.
+#   sqlite:///C:/QC/central_defects.db
+#   mssql:DRIVER={ODBC Driver 18 for SQL Server};SERVER=...;DATABASE=ict_spotfire_dev;...
+SYNC_TARGET_ENV = "SCRAP_SYNC_TARGET"
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_INTERVAL = 5.0          # seconds between outbox polls when idle
+DEFAULT_BASE_BACKOFF = 2.0      # seconds, doubled per failed attempt
+DEFAULT_MAX_BACKOFF = 300.0
+
+
+class TargetUnavailable(ConnectionError):
+    """The target cannot be reached (connection refused, login timeout, link lost)"""
+
+
+class SyncTarget:
+    """Destination for synced rows. Subclasses implement write_rows()."""
+    
+    name = "target"
+    
+    def write_rows(self, columns, rows):
+        """
+        Write rows to the target in one transaction
+        
+        Args:
+            columns (list): "ID" followed by EXPORT_COLUMNS
+            rows (list of tuple): Values in column order; ID is the local row ID
+        
+        Raises:
+            ConnectionError: The target is unreachable (e.g. TargetUnavailable);
+                the batch is tried again as a whole once the worker has backed off
+            Exception: Any other error; the whole batch is treated as not written
+        """
+        raise NotImplementedError
+    
+    def close(self):
+        """Release any connection held by the target"""
+
+
+class SQLiteSyncTarget(SyncTarget):
+    """
+    A second SQLite file standing in for SQL Server
+    
+    Rows keep their local ID as the primary key, so replaying a batch after
+    a lost acknowledgement is a no-op.
+    """
+    
+    name = "sqlite"
+    
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._conn = None
+    
+    def _connect(self):
+        if self._conn is None:
+            try:
+                self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+                self._conn.execute("PRAGMA busy_timeout = 5000")
+                self._conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS PA_InternalScrap (
+                        ID INTEGER PRIMARY KEY,
+                        {', '.join(EXPORT_COLUMNS)},
+                        Synced_At TEXT DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                self._conn.commit()
+            except sqlite3.OperationalError as e:
+                self.close()
+                raise TargetUnavailable(f"Cannot open {self.db_file}: {e}") from e
+        return self._conn
+    
+    def write_rows(self, columns, rows):
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in columns)
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO PA_InternalScrap ({', '.join(columns)}) VALUES ({placeholders})",
+                    rows
+                )
+        except sqlite3.OperationalError as e:
+            # Locked or unreadable file, not a bad row
+            raise TargetUnavailable(str(e)) from e
+    
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SqlServerSyncTarget(SyncTarget):
+    """
+    SQL Server target via pyodbc (optional dependency)
+    
+    The remote table has its own identity column, so the local ID is not
+    sent. A batch whose commit succeeded but whose acknowledgement was lost
+    is sent again on retry.
+    """
+    
+    name = "sql_server"
+    
+    def __init__(self, connection_string, table=SQL_SERVER_TABLE):
+        self.connection_string = connection_string
+        self.table = table
+        self._conn = None
+    
+    def _connect(self):
+        if self._conn is None:
+            try:
+                import pyodbc
+            except ImportError:
+                raise RuntimeError("SQL Server sync needs pyodbc: pip install pyodbc")
+            try:
+                self._conn = pyodbc.connect(self.connection_string, autocommit=False)
+            except pyodbc.Error as e:
+                raise TargetUnavailable(f"Cannot connect to SQL Server: {e}") from e
+        return self._conn
+    
+    def write_rows(self, columns, rows):
+        conn = self._connect()
+        import pyodbc
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        placeholders = ", ".join("?" for _ in columns[1:])
+        try:
+            cursor.executemany(
+                f"INSERT INTO {self.table} ({', '.join(columns[1:])}) VALUES ({placeholders})",
+                [row[1:] for row in rows]
+            )
+            conn.commit()
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            # Drop the connection so the next attempt reconnects
+            self.close()
+            # Timeouts and lost links (SQLSTATE 08xxx, HYT00) are not the rows' fault
+            if isinstance(e, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+                raise TargetUnavailable(str(e)) from e
+            raise
+        finally:
+            cursor.close()
+    
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+def target_from_url(url):
+    """Build a SyncTarget from a "sqlite:///path" or "mssql:<odbc string>" URL"""
+    if url.startswith("sqlite:///"):
+        return SQLiteSyncTarget(url[len("sqlite:///"):])
+    if url.startswith("mssql:"):
+        return SqlServerSyncTarget(url[len("mssql:"):])
+    raise ValueError(f"Unsupported sync target: {url}")
+
+
+class SyncWorker:
+    """
+    Drains PA_SyncOutbox into a SyncTarget on a background thread
+    
+    Each pass takes up to batch_size due rows in ID order and writes them to
+    the target in one call. If the batch fails on its data, its rows are
+    retried one at a time so a single bad row cannot hold back the others;
+    rows that still fail are rescheduled with exponential backoff. If the
+    target is unreachable (a ConnectionError), the rows stay due as they
+    are and the worker itself backs off, so an outage costs one connection
+    attempt per pass instead of one per row.
+    
+    When several server processes share the database, each may start a
+    worker with the same leader_lock (a FileLock); only the worker holding
+    it syncs, so no row is pushed twice. The others poll for the lock and
+    take over if the leading process exits.
+    """
+    
+    def __init__(self, target, db_file=None, batch_size=DEFAULT_BATCH_SIZE, interval=DEFAULT_INTERVAL,
+                 base_backoff=DEFAULT_BASE_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF, leader_lock=None):
+        self.target = target
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.interval = interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.leader_lock = leader_lock
+        self.leading = leader_lock is None
+        self.last_error = None
+        self.outage_passes = 0      # consecutive passes that found the target unreachable
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the background thread (no-op if already running)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="defect-sync", daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self, timeout=10.0):
+        """Stop the background thread after its current pass"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.leader_lock is not None and self.leading:
+            self.leading = False
+            self.leader_lock.release()
+        self.target.close()
+    
+    def wake(self):
+        """Ask the worker to poll now instead of waiting for the interval"""
+        self._wake.set()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.leading:
+                self.leading = self.leader_lock.acquire(blocking=False)
+                if not self.leading:
+                    self._wake.wait(self.interval)
+                    self._wake.clear()
+                    continue
+            try:
+                synced = self.run_once()
+                self.outage_passes = 0
+            except ConnectionError:
+                self.last_error = traceback.format_exc()
+                self.outage_passes += 1
+                # Only stop() cuts this short: new rows don't make the target reachable
+                delay = min(self.max_backoff, self.base_backoff * (1 << min(self.outage_passes - 1, 20)))
+                self._stop.wait(delay)
+                self._wake.clear()
+                continue
+            except Exception:
+                self.last_error = traceback.format_exc()
+                synced = 0
+            if synced < self.batch_size:
+                # Outbox drained (or failing): wait for new rows or the next poll
+                self._wake.wait(self.interval)
+                self._wake.clear()
+    
+    def run_once(self):
+        """
+        Push one batch of due rows to the target
+        
+        Returns:
+            int: Number of rows synced in this pass
+        
+        Raises:
+            ConnectionError: The target was unreachable; rows written before
+                that are recorded, the rest stay due
+        """
+        manager = get_manager(self.db_file)
+        conn = manager.connection()
+        columns = ["ID"] + list(EXPORT_COLUMNS)
+        rows = conn.execute(
+            f"""
+            SELECT s.{', s.'.join(columns)}
+            FROM PA_SyncOutbox o JOIN PA_InternalScrap s ON s.ID = o.ID
+            WHERE o.Status = 'pending' AND o.Next_Attempt_At <= ?
+            ORDER BY o.ID
+            LIMIT ?
+            """,
+            (time.time(), self.batch_size)
+        ).fetchall()
+        if not rows:
+            return 0
+        
+        unavailable = None
+        try:
+            self.target.write_rows(columns, rows)
+            synced, failed = rows, []
+        except ConnectionError:
+            raise
+        except Exception as e:
+            self.last_error = str(e)
+            synced, failed = [], []
+            for row in rows:
+                try:
+                    self.target.write_rows(columns, [row])
+                    synced.append(row)
+                except ConnectionError as row_error:
+                    unavailable = row_error
+                    break
+                except Exception as row_error:
+                    failed.append((row, str(row_error)))
+        
+        def record(conn):
+            conn.executemany(
+                "UPDATE PA_SyncOutbox SET Status = 'synced', Synced_At = CURRENT_TIMESTAMP, "
+                "Last_Error = NULL WHERE ID = ?",
+                [(row[0],) for row in synced]
+            )
+            now = time.time()
+            for row, error in failed:
+                conn.execute(
+                    "UPDATE PA_SyncOutbox SET Attempts = Attempts + 1, Last_Error = ?, "
+                    "Next_Attempt_At = ? + MIN(?, ? * (1 << MIN(Attempts, 20))) WHERE ID = ?",
+                    (error, now, self.max_backoff, self.base_backoff, row[0])
+                )
+        
+        if synced or failed:
+            manager.write(record)
+        if unavailable is not None:
+            raise unavailable
+        return len(synced)
+
+
+def get_sync_status(db_file=None):
+    """
+    Summarize the outbox
+    
+    Returns:
+        dict: pending (waiting to sync), retrying (pending after a failure), synced
+    """
+    conn = get_manager(db_file).connection()
+    # The Next_Attempt_At term lets SQLite answer from the partial pending index
+    pending, retrying = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(Attempts > 0), 0) FROM PA_SyncOutbox "
+        "WHERE Status = 'pending' AND Next_Attempt_At >= 0"
+    ).fetchone()
+    # The outbox holds exactly one row per defect, so everything else is synced
+    synced = get_defect_count(db_file) - pending
+    return {'pending': pending, 'retrying': retrying, 'synced': synced}
+
+
+def start_sync_worker_from_env(**worker_options):
+    """
+    Start a SyncWorker for the target named in SCRAP_SYNC_TARGET
+    
+    With SCRAP_MULTI_PROCESS every server process starts one, and they
+    share a leader lock next to the database so only one of them syncs.
+    
+    Returns:
+        SyncWorker or None: None when no sync target is configured
+    """
+    url = get_setting(SYNC_TARGET_ENV)
+    if not url:
+        return None
+    manager = get_manager(worker_options.get('db_file'))
+    if manager.multi_process and 'leader_lock' not in worker_options:
+        worker_options['leader_lock'] = FileLock(state_file(manager.db_file, 'sync.lock'))
+    worker = SyncWorker(target_from_url(url), **worker_options).start()
+    atexit.register(worker.stop)
+    return worker
@@ -0,0 +1,192 @@
+"""
+Time-Window Queries
+Resolves common windows (current and last shift, today, this week, ...)
+to Unix-second ranges and counts or lists the defects in them with index
+range scans on the typed Exact_Epoch column. While the backfill of those
+columns is still running, queries fall back to comparing Exact_Time text.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+
+from database_sqlite import (
+    DATA_FILTER_CONDITIONS,
+    DATA_TABLE,
+    SHIFT_SQL,
+    SHIFT_STARTS,
+    TEMPORAL_BACKFILL,
+    build_filter_clause,
+    cached_query,
+)
+from metrics import timed
+
+WINDOWS = ("current_shift", "last_shift", "today", "yesterday", "this_week", "last_7_days")
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()     # Entry_Day 0
+
+
+def shift_start(moment):
+    """Start (local datetime) of the shift that moment falls in"""
+    starts = [
+        datetime.combine(moment.date() - timedelta(days=days_back), time(hour))
+        for days_back in (1, 0) for hour in SHIFT_STARTS
+    ]
+    return max(start for start in starts if start <= moment)
+
+
+def next_shift_start(moment):
+    """Start (local datetime) of the shift after the one moment falls in"""
+    starts = [
+        datetime.combine(moment.date() + timedelta(days=days_ahead), time(hour))
+        for days_ahead in (0, 1) for hour in SHIFT_STARTS
+    ]
+    return min(start for start in starts if start > moment)
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    return datetime.fromisoformat(value)
+
+
+def resolve_window(window, now=None):
+    """
+    Turn a named window or a custom range into Unix seconds
+    
+    Args:
+        window (str or tuple): One of WINDOWS, or (start, end) as datetimes
+            (naive = local time), dates (midnight), ISO strings or Unix seconds
+        now (datetime): Reference time for named windows (default: now, local)
+    
+    Returns:
+        tuple: (start, end) Unix seconds, start inclusive, end exclusive
+    """
+    if isinstance(window, (tuple, list)):
+        start, end = (_to_datetime(value) for value in window)
+    else:
+        now = now or datetime.now()
+        midnight = datetime.combine(now.date(), time())
+        if window == "current_shift":
+            start, end = shift_start(now), next_shift_start(now)
+        elif window == "last_shift":
+            end = shift_start(now)
+            start = shift_start(end - timedelta(seconds=1))
+        elif window == "today":
+            start, end = midnight, midnight + timedelta(days=1)
+        elif window == "yesterday":
+            start, end = midnight - timedelta(days=1), midnight
+        elif window == "this_week":
+            start = midnight - timedelta(days=now.weekday())
+            end = start + timedelta(days=7)
+        elif window == "last_7_days":
+            start, end = now - timedelta(days=7), now
+        else:
+            raise ValueError(f"Unknown time window: {window}")
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def window_filters(window, now=None, filters=None):
+    """
+    Log viewer filters for a window, for anything that reads PA_InternalScrap_Data
+    with DATA_FILTER_CONDITIONS (e.g. columnar_reader.read_defects_frame)
+    
+    These match on Exact_Epoch, so rows are only found once
+    temporal_columns_ready() (or if they were logged after the upgrade).
+    """
+    start, end = resolve_window(window, now)
+    return dict(filters or {}, time_from=start, time_to=end)
+
+
+def temporal_columns_ready(db_file=None):
+    """True once Entry_Day, Exact_Epoch and Shift are filled for every row"""
+    try:
+        rows, _ = cached_query(
+            "SELECT Finished_At IS NOT NULL FROM PA_Backfills WHERE Name = ?", (TEMPORAL_BACKFILL,), db_file
+        )
+        return bool(rows and rows[0][0])
+    except Exception as e:
+        return False
+
+
+def _window_clause(window, filters, now, db_file):
+    """(WHERE sql, params, day expression, shift expression) on PA_InternalScrap_Data for a window"""
+    start, end = resolve_window(window, now)
+    where, params = build_filter_clause(filters, DATA_FILTER_CONDITIONS)
+    if temporal_columns_ready(db_file):
+        condition = "Exact_Epoch >= ? AND Exact_Epoch < ?"
+        bounds = [start, end]
+        day, shift = "Entry_Day", "Shift"
+    else:
+        # Exact_Time is ISO 8601 in UTC, so text order is time order
+        condition = "Exact_Time >= ? AND Exact_Time < ?"
+        bounds = [datetime.fromtimestamp(bound, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S') for bound in (start, end)]
+        day, shift = "Entry_Date", SHIFT_SQL.format(ref='Exact_Time')
+    where = f"{where} AND {condition}" if where else f"WHERE {condition}"
+    return where, params + bounds, day, shift
+
+
+@timed()
+def count_defects_in_window(window, filters=None, now=None, db_file=None):
+    """
+    Count the defects logged in a time window
+    
+    Args:
+        window (str or tuple): See resolve_window
+        filters (dict): Log viewer filters to apply as well (see FILTER_CONDITIONS)
+    
+    Returns:
+        int: Defects with Exact_Time in the window
+    """
+    try:
+        where, params, _, _ = _window_clause(window, filters, now, db_file)
+        rows, _ = cached_query(f"SELECT COUNT(*) FROM {DATA_TABLE} {where}", params, db_file)
+        return rows[0][0]
+    
+    except Exception as e:
+        return 0
+
+
+@timed()
+def get_shift_counts(window, filters=None, now=None, db_file=None):
+    """
+    Defects per shift in a time window
+    
+    Returns:
+        list of tuple: (Entry_Date, Shift, Defects), oldest first
+    """
+    try:
+        where, params, day, shift = _window_clause(window, filters, now, db_file)
+        # Grouped on the day column itself, so the typed query stays inside the index
+        rows, _ = cached_query(
+            f"SELECT {day}, {shift}, COUNT(*) FROM {DATA_TABLE} {where} GROUP BY 1, 2 ORDER BY 1, 2",
+            params, db_file
+        )
+        if day == "Entry_Day":
+            rows = [(None if day_number is None else str(date.fromordinal(EPOCH_ORDINAL + day_number)), shift, count)
+                    for day_number, shift, count in rows]
+        return rows
+    
+    except Exception as e:
+        return []
+
+
+@timed()
+def get_defects_in_window(window, filters=None, limit=1000, now=None, db_file=None):
+    """
+    The defects logged in a time window, newest first
+    
+    Returns:
+        tuple: (rows, columns) in PA_InternalScrap column order
+    """
+    try:
+        where, params, _, _ = _window_clause(window, filters, now, db_file)
+        return cached_query(
+            f"SELECT * FROM PA_InternalScrap WHERE ID IN (SELECT ID FROM {DATA_TABLE} {where}) "
+            "ORDER BY ID DESC LIMIT ?",
+            params + [limit], db_file
+        )
+    
+    except Exception as e:
+        return [], []
@@ -0,0 +1,210 @@
+"""
+Write-Behind Queue for Defect Submission
+Defects are acknowledged as soon as they are queued; a single writer thread
+commits them to SQLite in groups, so a click never waits on the disk
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database_sqlite import build_defect_values, get_manager, insert_defect_rows
+from metrics import metrics
+from settings import get_setting
+
+# Set to "write_behind" to queue submissions instead of writing them inline
+WRITE_MODE_ENV = "SCRAP_WRITE_MODE"
+
+DEFAULT_MAX_BATCH = 100
+DEFAULT_MAX_DELAY = 0.02        # seconds to wait for more rows before committing a group
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    In-process queue with one writer thread and group commit
+    
+    submit() returns a Future right away. The writer thread takes the first
+    queued row, collects whatever else arrives within max_delay (up to
+    max_batch rows), and commits them in one transaction. Each Future then
+    resolves to its row's ID, or to the exception that made the commit fail.
+    
+    Because one commit covers the whole group, the writer can afford
+    synchronous=FULL: an ID is only handed back once the row has been
+    fsynced, not just written to the WAL.
+    
+    If the writer thread hits an error outside a commit (opening the
+    database, say), every queued Future fails with it and the queue
+    closes, so nothing waits on a writer that is gone.
+    """
+    
+    def __init__(self, db_file=None, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY,
+                 synchronous='FULL'):
+        self.db_file = db_file
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.synchronous = synchronous
+        self._queue = queue.Queue()
+        self._closed = False
+        self._error = None          # what stopped the writer thread, if it failed
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="defect-write-behind", daemon=True)
+        self._thread.start()
+    
+    def submit(self, click_data, session_info):
+        """
+        Queue one defect for writing
+        
+        Returns:
+            Future: Resolves to the inserted ID once the row is committed
+        """
+        values = build_defect_values(click_data, session_info)
+        future = Future()
+        with self._close_lock:
+            if self._error is not None:
+                raise RuntimeError(f"Write-behind writer stopped: {self._error}") from self._error
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+            self._queue.put((values, future))
+        return future
+    
+    def submit_batch(self, click_data_list, session_info):
+        """
+        Queue several defects from one submission
+        
+        They are queued together, so the writer normally commits them in the
+        same group.
+        
+        Returns:
+            list of Future: One per entry, in order
+        """
+        return [self.submit(click_data, session_info) for click_data in click_data_list]
+    
+    @property
+    def error(self):
+        """The exception that stopped the writer thread, or None while it runs"""
+        return self._error
+    
+    def pending(self):
+        """Approximate number of rows waiting to be written"""
+        return self._queue.qsize()
+    
+    def flush(self, timeout=None):
+        """
+        Block until every row queued so far has been committed or failed
+        
+        Returns:
+            bool: False if the timeout expired first
+        """
+        marker = Future()
+        with self._close_lock:
+            if self._closed or not self._thread.is_alive():
+                # Closing already drains the queue; just wait for the writer to finish
+                self._thread.join(timeout)
+                return not self._thread.is_alive()
+            self._queue.put((None, marker))
+        try:
+            marker.result(timeout)
+            return True
+        except TimeoutError:
+            return False
+    
+    def close(self, timeout=30.0):
+        """Stop accepting rows, write everything already queued, then stop the writer"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            if not self._thread.is_alive():
+                return
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+    
+    def _run(self):
+        batch = []
+        try:
+            manager = get_manager(self.db_file)
+            if self.synchronous:
+                manager.connection().execute(f"PRAGMA synchronous = {self.synchronous}")
+            
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                if batch[0] is _STOP:
+                    break
+                
+                # Group commit: gather whatever else arrives within max_delay
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                
+                self._write(manager, batch)
+                batch = []
+        except Exception as e:
+            self._fail(batch, e)
+    
+    def _fail(self, batch, error):
+        """The writer is stopping on error: close the queue and fail everything still waiting"""
+        metrics.count("write_behind.writer_failed")
+        with self._close_lock:
+            self._closed = True
+            self._error = error
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in batch:
+            if item is _STOP:
+                continue
+            values, future = item
+            if future.done():
+                continue
+            if values is None:
+                future.set_result(None)         # a flush() marker: nothing left to wait for
+            else:
+                future.set_exception(error)
+    
+    def _write(self, manager, batch):
+        rows = [(values, future) for values, future in batch if values is not None]
+        markers = [future for values, future in batch if values is None]
+        if rows:
+            metrics.count("write_behind.batches")
+            metrics.count("write_behind.rows", len(rows))
+            try:
+                ids, _ = manager.write(lambda conn: insert_defect_rows(conn, [values for values, _ in rows]))
+            except Exception as e:
+                for _, future in rows:
+                    future.set_exception(e)
+            else:
+                for (_, future), inserted_id in zip(rows, ids):
+                    future.set_result(inserted_id)
+        for marker in markers:
+            marker.set_result(None)
+
+
+def start_write_behind_from_env(**queue_options):
+    """
+    Start a WriteBehindQueue when SCRAP_WRITE_MODE=write_behind
+    
+    The queue is flushed on interpreter exit, so rows acknowledged to an
+    operator are written even when the server is shut down.
+    
+    Returns:
+        WriteBehindQueue or None: None in the default synchronous mode
+    """
+    if get_setting(WRITE_MODE_ENV, "sync").lower() != "write_behind":
+        return None
+    write_queue = WriteBehindQueue(**queue_options)
+    atexit.register(write_queue.close)
+    return write_queue